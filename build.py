@@ -36,17 +36,28 @@
 
 import sys
 
-import errno, glob, json, os, re, subprocess, threading, codecs, functools
+import argparse, bisect, contextlib, errno, glob, hashlib, json, multiprocessing, os, re, select, shutil, socket, struct, subprocess, tempfile, threading, time, codecs, functools, traceback, zlib
+from multiprocessing.pool import ThreadPool
+
+try:
+  import resource
+except ImportError:
+  # Not available on Windows; --profile then omits peak memory use.
+  resource = None
 
 if sys.version_info[0] == 2:
   import httplib
+  import Queue as queue
   from urllib import urlencode
+  from urlparse import urlsplit
 else:
   import http.client as httplib
-  from urllib.parse import urlencode
+  import queue
+  from urllib.parse import urlencode, urlsplit
   from importlib import reload
 
 REMOTE_COMPILER = "remote"
+REMOTE_COMPILER_URL = "https://closure-compiler.appspot.com/compile"
 
 CLOSURE_DIR = os.path.pardir
 CLOSURE_ROOT = os.path.pardir
@@ -57,6 +68,15 @@ CLOSURE_DIR_NPM = "node_modules"
 CLOSURE_ROOT_NPM = os.path.join("node_modules")
 CLOSURE_LIBRARY_NPM = "google-closure-library"
 CLOSURE_COMPILER_NPM = ("google-closure-compiler.cmd" if os.name == "nt" else "google-closure-compiler")
+CLOSURE_COMPILER_JAR_NPM = os.path.join(
+    CLOSURE_ROOT_NPM, "google-closure-compiler", "compiler.jar")
+
+CACHE_DIR = ".build_cache"
+
+# Arduino boards whose generators can be split out of arduino_compressed.js,
+# by the name of their file in generators/arduino.
+ARDUINO_BOARDS = ["esp32", "esp8266", "k210", "raspberryPiPico", "roboProBot",
+                  "roboProStation"]
 
 def import_path(fullpath):
   """Import a file with full path specification.
@@ -85,25 +105,1109 @@ def read(filename):
 HEADER = ("// Do not edit this file; automatically generated by build.py.\n"
           "'use strict';\n")
 
+# Google's (and only Google's) Apache licences, which the Closure Compiler
+# preserves and build.py trims from compiled output.  The pattern matches the
+# UTF-8 bytes of the output, so the title line, which is words and spaces in
+# any script, is checked against LICENSE_TITLE once decoded.
+LICENSE = br"""/\*
+
+ (?P<license_title>[^\n]+)
+
+ Copyright \d+ Google Inc.
+ https://developers.google.com/blockly/
+
+ Licensed under the Apache License, Version 2.0 \(the "License"\);
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+\*/"""
+LICENSE_TITLE = re.compile(u"[\\w ]+$", re.UNICODE)
+
+def compiler_version(closure_compiler):
+  """Ask the compiler which version it is, for use in cache keys.
+
+  Args:
+      closure_compiler:  Path to the local compiler, or REMOTE_COMPILER.
+
+  Returns:
+      The compiler's version banner, or the compiler name if it has none.
+  """
+  if closure_compiler == REMOTE_COMPILER:
+    return closure_compiler
+  # Reading the npm package version avoids starting a JVM just to ask.
+  package_json = os.path.join(
+      os.path.dirname(CLOSURE_COMPILER_JAR_NPM), "package.json")
+  try:
+    with open(package_json) as f:
+      return "%s %s" % (closure_compiler, json.load(f)["version"])
+  except (IOError, OSError, ValueError, KeyError):
+    pass
+  try:
+    proc = subprocess.Popen([closure_compiler, "--version"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, shell=(os.name == "nt"))
+    (stdout, _) = proc.communicate()
+  except OSError:
+    return closure_compiler
+  return stdout.decode("utf-8").strip() or closure_compiler
+
+
+class Build_profile(object):
+  """Records wall and CPU time per build phase and target, for --profile.
+
+  Phases may be recorded from any thread.  While disabled, recording costs
+  nothing.
+  """
+  def __init__(self):
+    self.enabled = False
+    self.lock = threading.Lock()
+    self.started = time.time()
+    self.phases = []
+    self.sizes = {}
+    self.metrics = {}
+
+  @staticmethod
+  def cpu_time():
+    # Per-thread where the platform allows, since targets build in threads.
+    if hasattr(time, "thread_time"):
+      return time.thread_time()
+    times = os.times()
+    return times[0] + times[1]
+
+  @contextlib.contextmanager
+  def phase(self, phase, target=""):
+    """Time the body of a with statement.
+
+    The record is yielded, so the target may be filled in once it is known.
+    """
+    record = dict(phase=phase, target=target)
+    if not self.enabled:
+      yield record
+      return
+    wall = time.time()
+    cpu = self.cpu_time()
+    try:
+      yield record
+    finally:
+      record["wall"] = round(time.time() - wall, 4)
+      record["cpu"] = round(self.cpu_time() - cpu, 4)
+      with self.lock:
+        self.phases.append(record)
+
+  def add_sizes(self, target, bytes_in, bytes_out):
+    if self.enabled:
+      with self.lock:
+        self.sizes[target] = dict(bytes_in=bytes_in, bytes_out=bytes_out)
+
+  def add_metrics(self, name, metrics):
+    if self.enabled:
+      with self.lock:
+        self.metrics[name] = metrics
+
+  def report(self):
+    """Collect the whole run's measurements into a JSON-friendly dict."""
+    times = os.times()
+    report = dict(
+      wall=round(time.time() - self.started, 4),
+      cpu=dict(self=round(times[0] + times[1], 4),
+               children=round(times[2] + times[3], 4)),
+      # Stable sort: each target's phases stay in the order they ran.
+      phases=sorted(self.phases, key=lambda r: r["target"]),
+      sizes=self.sizes,
+      metrics=self.metrics,
+    )
+    if resource:
+      # ru_maxrss is in kilobytes on Linux but bytes on macOS.
+      scale = 1 if sys.platform == "darwin" else 1024
+      report["peak_rss"] = dict(
+          self=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+          children=resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+    return report
+
+  def write(self, filename):
+    """Print a summary table and write the full report to a JSON file."""
+    report = self.report()
+    print("\nPROFILE")
+    print("%-36s %-14s %8s %8s %10s %10s" % (
+        "target", "phase", "wall s", "cpu s", "bytes in", "bytes out"))
+    phases = report["phases"]
+    for (i, record) in enumerate(phases):
+      sizes = {}
+      if i + 1 == len(phases) or phases[i + 1]["target"] != record["target"]:
+        # Sizes belong to the target, so show them once, on its last row.
+        sizes = report["sizes"].get(record["target"], {})
+      print("%-36s %-14s %8.2f %8.2f %10s %10s" % (
+          record["target"] or "-", record["phase"], record["wall"],
+          record["cpu"], sizes.get("bytes_in", ""), sizes.get("bytes_out", "")))
+    print("Total: %.2fs wall, %.2fs CPU in build.py, %.2fs CPU in compilers." % (
+        report["wall"], report["cpu"]["self"], report["cpu"]["children"]))
+    if "peak_rss" in report:
+      print("Peak RSS: %d MB in build.py, %d MB in largest compiler." % (
+          report["peak_rss"]["self"] // 2**20,
+          report["peak_rss"]["children"] // 2**20))
+    with open(filename, "w") as f:
+      json.dump(report, f, indent=2, sort_keys=True)
+    print("Wrote profile to %s." % filename)
+
+
+profile = Build_profile()
+
+
+class Output_log(object):
+  """Counts the outputs which changed and those left untouched.
+
+  Outputs whose content is already up to date are not rewritten, so their
+  modification times stay put and tools watching them have nothing to redo.
+  """
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.reset()
+
+  def reset(self):
+    with self.lock:
+      self.changed = []
+      self.unchanged = []
+
+  def record(self, filename, changed):
+    with self.lock:
+      (self.changed if changed else self.unchanged).append(filename)
+
+  def summary(self):
+    with self.lock:
+      return "%d outputs changed, %d unchanged." % (
+          len(self.changed), len(self.unchanged))
+
+
+outputs = Output_log()
+
+
+def makedirs(path):
+  """Create a directory and its parents, if they do not exist yet."""
+  try:
+    os.makedirs(path)
+  except OSError as e:
+    if e.errno != errno.EEXIST:
+      raise
+
+
+def replace_file(src, dst):
+  """Rename src to dst, replacing dst if it exists."""
+  if os.name == "nt" and os.path.exists(dst):
+    os.remove(dst)
+  os.rename(src, dst)
+
+
+def file_digest(filename):
+  """Return the SHA-1 hex digest of a file, or None if it cannot be read."""
+  digest = hashlib.sha1()
+  try:
+    with open(filename, "rb") as f:
+      for chunk in iter(lambda: f.read(1 << 16), b""):
+        digest.update(chunk)
+  except (IOError, OSError):
+    return None
+  return digest.hexdigest()
+
+
+def write_file(filename, data):
+  """Replace a file's content, unless it already holds exactly that data.
+
+  Args:
+      filename:  The file to write.
+      data:  The new content, as bytes or as text to encode as UTF-8.
+
+  Returns:
+      Whether the file was written.
+  """
+  if not isinstance(data, bytes):
+    data = data.encode("utf-8")
+  changed = file_digest(filename) != hashlib.sha1(data).hexdigest()
+  if changed:
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "wb") as f:
+      f.write(data)
+    replace_file(tmp_filename, filename)
+  outputs.record(filename, changed)
+  return changed
+
+
+# Node.js script printing, as JSON, the median milliseconds V8 takes to compile
+# each file named on the command line after the number of runs, or null for
+# files which do not compile.
+PARSE_TIME_JS = """
+var fs = require('fs'), vm = require('vm');
+var runs = parseInt(process.argv[1], 10), files = process.argv.slice(2);
+var sources = files.map(function(file) { return fs.readFileSync(file, 'utf8'); });
+var times = files.map(function() { return []; });
+for (var run = 0; run < runs; run++) {
+  for (var i = 0; i < files.length; i++) {
+    if (!times[i]) {
+      continue;
+    }
+    // A distinct comment defeats V8's compilation cache.
+    var source = sources[i] + '\\n//' + run;
+    var start = process.hrtime();
+    try {
+      new vm.Script(source, {filename: files[i]});
+    } catch (e) {
+      times[i] = null;
+      continue;
+    }
+    var elapsed = process.hrtime(start);
+    times[i].push(elapsed[0] * 1e3 + elapsed[1] / 1e6);
+  }
+}
+var result = {};
+files.forEach(function(file, i) {
+  if (times[i]) {
+    times[i].sort(function(a, b) { return a - b; });
+  }
+  result[file] = times[i] && times[i][runs >> 1];
+});
+console.log(JSON.stringify(result));
+"""
+
+
+def percent_change(old, new):
+  """How much new differs from old, in whole percent."""
+  return int(round((new - old) * 100.0 / old)) if old else 0
+
+
+def parse_times(filenames, runs=5):
+  """Measure how long V8 takes to parse and compile each file.
+
+  Returns:
+      A dict of median milliseconds, or None if a file does not compile, by
+      filename.  None if Node.js is not available.
+  """
+  if not filenames:
+    return {}
+  try:
+    proc = subprocess.Popen(["node", "-e", PARSE_TIME_JS, str(runs)] + filenames,
+                            stdout=subprocess.PIPE, shell=(os.name == "nt"))
+  except OSError:
+    return None
+  (stdout, _) = proc.communicate()
+  if proc.returncode:
+    return None
+  return json.loads(stdout.decode("utf-8"))
+
+
+_BASE64 = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+_BASE64_VALUES = dict((char, i) for (i, char) in enumerate(_BASE64))
+
+
+def _encode_vlq(value):
+  value = (-value << 1) | 1 if value < 0 else value << 1
+  chars = ""
+  while True:
+    digit = value & 31
+    value >>= 5
+    chars += _BASE64[digit | 32 if value else digit]
+    if not value:
+      return chars
+
+
+def decode_mappings(mappings):
+  """Decode the mappings of a version 3 source map.
+
+  Returns:
+      A list with, for each generated line, a list of segments.  Each segment
+      is a list of absolute values: generated column and, if present, source
+      index, source line, source column and name index.
+  """
+  lines = []
+  state = [0, 0, 0, 0, 0]
+  for line in mappings.split(";"):
+    segments = []
+    state[0] = 0
+    for segment in line.split(","):
+      if not segment:
+        continue
+      values = []
+      value = shift = 0
+      for char in segment:
+        digit = _BASE64_VALUES[char]
+        value += (digit & 31) << shift
+        if digit & 32:
+          shift += 5
+        else:
+          values.append(-(value >> 1) if value & 1 else value >> 1)
+          value = shift = 0
+      for (i, value) in enumerate(values):
+        state[i] += value
+      segments.append(state[:len(values)])
+    lines.append(segments)
+  return lines
+
+
+def encode_mappings(lines):
+  """The inverse of decode_mappings."""
+  encoded_lines = []
+  state = [0, 0, 0, 0, 0]
+  for segments in lines:
+    state[0] = 0
+    encoded = []
+    for segment in segments:
+      chars = ""
+      for (i, value) in enumerate(segment):
+        chars += _encode_vlq(value - state[i])
+        state[i] = value
+      encoded.append(chars)
+    encoded_lines.append(",".join(encoded))
+  return ";".join(encoded_lines)
+
+
+def utf16_offsets(data):
+  """Count the UTF-16 code units before each byte offset of UTF-8 data.
+
+  Returns:
+      A list of len(data) + 1 counts.  A character's code units are counted
+      from its first byte on, so the start of the character at a given count
+      is the last offset with that count.
+  """
+  offsets = [0]
+  units = 0
+  for byte in bytearray(data):
+    if byte & 0xc0 != 0x80:
+      units += 2 if byte >= 0xf0 else 1
+    offsets.append(units)
+  return offsets
+
+
+class Output_pipeline(object):
+  """Writes compiled code out with the licences and a stub removed.
+
+  The patterns are compiled once, when the pipeline is created.  write()
+  scans the code in a single pass and writes only the text between matches,
+  so no edited copy of the bundle is ever built in memory.  Output goes to a
+  temporary file which replaces the target once it is complete, so a failed
+  build never leaves a truncated file behind.  If the target already holds
+  the same bytes, it is left untouched.
+
+  Given the compiler's source map, the pipeline shifts it past the header,
+  drops the mappings of removed text and moves everything after each removal
+  back to where it ends up, then writes it next to the target.
+  """
+  def __init__(self, remove=""):
+    patterns = [LICENSE]
+    if remove:
+      patterns.append(re.escape(remove.encode("utf-8")))
+    self.pattern = re.compile(b"|".join(patterns))
+
+  def write(self, target_filename, header, code, source_map=None):
+    """Write header and then code, minus the removed text, to a file.
+
+    Args:
+        target_filename:  The file to replace.
+        header:  Text to write before the code.  It must end with a newline.
+        code:  The compiled code, as UTF-8 bytes.
+        source_map:  The compiler's version 3 source map for code, as a JSON
+            string, or None.  The adjusted map is written to
+            target_filename + ".map".
+
+    Returns:
+        The number of bytes written.
+    """
+    tmp_filename = target_filename + ".tmp"
+    digest = hashlib.sha1()
+    removed = []
+    try:
+      with open(tmp_filename, "wb") as f:
+        def write(data):
+          f.write(data)
+          digest.update(data)
+        header = header.encode("utf-8")
+        write(header)
+        size = len(header)
+        pos = 0
+        for match in self.pattern.finditer(code):
+          title = match.group("license_title")
+          if title and not LICENSE_TITLE.match(title.decode("utf-8", "replace")):
+            continue
+          write(code[pos:match.start()])
+          size += match.start() - pos
+          pos = match.end()
+          if source_map is not None:
+            removed.append(match.span())
+        write(code[pos:])
+        size += len(code) - pos
+        if source_map is not None:
+          footer = ("\n//# sourceMappingURL=%s.map\n" %
+                    os.path.basename(target_filename)).encode("utf-8")
+          write(footer)
+          size += len(footer)
+      changed = file_digest(target_filename) != digest.hexdigest()
+      if changed:
+        replace_file(tmp_filename, target_filename)
+      else:
+        os.remove(tmp_filename)
+      outputs.record(target_filename, changed)
+    except:
+      if os.path.exists(tmp_filename):
+        os.remove(tmp_filename)
+      raise
+    if source_map is not None:
+      source_map = json.loads(source_map)
+      source_map["file"] = os.path.basename(target_filename)
+      source_map["mappings"] = encode_mappings(self.adjust_mappings(
+          decode_mappings(source_map["mappings"]), header.count(b"\n"), code,
+          removed))
+      source_map.pop("lineCount", None)
+      write_file(target_filename + ".map",
+                 json.dumps(source_map, sort_keys=True))
+    return size
+
+  @staticmethod
+  def adjust_mappings(lines, header_lines, code, removed):
+    """Move decoded mappings of code to where its text ends up in the output.
+
+    Source map columns count UTF-16 code units, which are bytes only as long
+    as the code is ASCII.
+
+    Args:
+        lines:  Decoded mappings of code, as returned by decode_mappings.
+        header_lines:  The number of lines written before code.
+        code:  The compiled code.
+        removed:  The (start, end) offsets of text removed from code, in order.
+
+    Returns:
+        The decoded mappings of the output.
+    """
+    newlines = [match.start() for match in re.finditer(b"\n", code)]
+    line_starts = [0] + [offset + 1 for offset in newlines]
+    units = utf16_offsets(code) if re.search(b"[\x80-\xff]", code) else None
+    # Offsets at which removals end, and the bytes (and code units) removed up
+    # to each.
+    ends = []
+    removed_bytes = []
+    removed_units = []
+    total = total_units = 0
+    for (start, end) in removed:
+      total += end - start
+      ends.append(end)
+      removed_bytes.append(total)
+      if units:
+        total_units += units[end] - units[start]
+        removed_units.append(total_units)
+
+    def new_offset(offset):
+      """Offset once removals are applied, or None if it was removed."""
+      i = bisect.bisect_right(ends, offset)
+      if i < len(removed) and removed[i][0] <= offset:
+        return None
+      return offset - (removed_bytes[i - 1] if i else 0)
+
+    def new_column(offset, line_start, new_line_start):
+      """The column of code's offset in its output line, which starts at
+      line_start in code and at new_line_start in the output."""
+      if not units:
+        return new_offset(offset) - new_line_start
+      i = bisect.bisect_right(ends, offset)
+      j = bisect.bisect_right(ends, line_start)
+      return (units[offset] - units[line_start] -
+              ((removed_units[i - 1] if i else 0) -
+               (removed_units[j - 1] if j else 0)))
+
+    # Where each output line starts, in code and in the output.
+    kept_newlines = [offset for offset in newlines
+                     if new_offset(offset) is not None]
+    kept_line_starts = [0] + [offset + 1 for offset in kept_newlines]
+    new_line_starts = [0] + [new_offset(offset) + 1 for offset in kept_newlines]
+    adjusted = [[] for _ in range(header_lines + len(new_line_starts))]
+    for (line, segments) in enumerate(lines):
+      if line >= len(line_starts):
+        break
+      for segment in segments:
+        offset = line_starts[line] + segment[0]
+        if units:
+          offset = bisect.bisect_right(
+              units, units[line_starts[line]] + segment[0],
+              line_starts[line]) - 1
+        new = new_offset(offset)
+        if new is None:
+          continue
+        new_line = bisect.bisect_right(new_line_starts, new) - 1
+        adjusted[header_lines + new_line].append(
+            [new_column(offset, kept_line_starts[new_line],
+                        new_line_starts[new_line])] + segment[1:])
+    return adjusted
+
+
+class Compile_cache(object):
+  """On-disk cache of compiler results.
+
+  Entries are keyed by a hash of the compiler version, the compiler flags and
+  the contents of every input file in order, so a target whose inputs have not
+  changed is restored without running the compiler again.
+  """
+  def __init__(self, cache_dir, compiler_version):
+    self.cache_dir = cache_dir
+    self.compiler_version = compiler_version
+
+  def key(self, params):
+    digest = hashlib.sha1()
+    digest.update(self.compiler_version.encode("utf-8") + b"\n")
+    for (arg, value) in params:
+      digest.update(("%s=%s\n" % (arg, value)).encode("utf-8"))
+      if arg == "js_file":
+        with open(value, "rb") as f:
+          content = f.read()
+        # Length-prefix the content so adjacent files cannot run together.
+        digest.update(("%d\n" % len(content)).encode("utf-8"))
+        digest.update(content)
+    return digest.hexdigest()
+
+  def get(self, key):
+    try:
+      with codecs.open(self._path(key), "r", "utf-8") as f:
+        json_data = json.load(f)
+    except (IOError, OSError, ValueError):
+      return None
+    # Compilers hand back bytes, which write_output writes as they are.
+    json_data["compiledCode"] = json_data["compiledCode"].encode("utf-8")
+    return json_data
+
+  def put(self, key, json_data):
+    if ("compiledCode" not in json_data or "errors" in json_data or
+        "serverErrors" in json_data):
+      return
+    entry = dict(json_data)
+    if not isinstance(entry["compiledCode"], type(u"")):
+      entry["compiledCode"] = entry["compiledCode"].decode("utf-8")
+    makedirs(self.cache_dir)
+    # Write to a temporary name first so an interrupted build never leaves a
+    # truncated entry behind.
+    path = self._path(key)
+    tmp_path = "%s.%d.tmp" % (path, threading.current_thread().ident)
+    with codecs.open(tmp_path, "w", "utf-8") as f:
+      json.dump(entry, f)
+    replace_file(tmp_path, path)
+
+  def _path(self, key):
+    return os.path.join(self.cache_dir, key + ".json")
+
+
+
+class Closure_worker_error(Exception):
+  """A persistent compiler worker died or broke protocol."""
+
+
+def _encode_varint(value):
+  data = bytearray()
+  while True:
+    bits = value & 0x7f
+    value >>= 7
+    if value:
+      data.append(bits | 0x80)
+    else:
+      data.append(bits)
+      return bytes(data)
+
+
+def _decode_varint(data, pos):
+  result = 0
+  shift = 0
+  while True:
+    if pos >= len(data):
+      raise Closure_worker_error("truncated varint")
+    byte = bytearray(data[pos:pos + 1])[0]
+    pos += 1
+    result |= (byte & 0x7f) << shift
+    shift += 7
+    if not byte & 0x80:
+      return (result, pos)
+
+
+class Closure_worker(object):
+  """A long-lived Closure Compiler JVM which compiles many targets.
+
+  The compiler is started with --persistent_worker and fed compilations over
+  stdin/stdout using the Bazel worker protocol: each request is a
+  length-prefixed WorkRequest message carrying the command line arguments,
+  and each reply a WorkResponse holding the exit code and the diagnostics.
+  Compiled code is written to a --js_output_file.  A worker which gives no
+  reply within `timeout` seconds is killed.
+  """
+  def __init__(self, command, timeout=None):
+    self.timeout = timeout
+    self.timed_out = False
+    try:
+      self.proc = subprocess.Popen(command + ["--persistent_worker"],
+          stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    except OSError as e:
+      raise Closure_worker_error("cannot start %s: %s" % (command[0], e))
+
+  def compile(self, dash_args):
+    """Compile one target.
+
+    Args:
+        dash_args:  Compiler arguments, as they would appear on a command line.
+
+    Returns:
+        A tuple of the compiler's exit code, the compiled code and the
+        compiler's diagnostics.
+    """
+    (fd, output_file) = tempfile.mkstemp(suffix=".js")
+    os.close(fd)
+    try:
+      request = b""
+      for arg in dash_args + ["--js_output_file", output_file]:
+        arg = arg.encode("utf-8")
+        # Field 1 (arguments), length-delimited.
+        request += b"\x0a" + _encode_varint(len(arg)) + arg
+      (exit_code, output) = self._call(request)
+      with open(output_file, "rb") as f:
+        return (exit_code, f.read(), output)
+    finally:
+      os.remove(output_file)
+
+  def _call(self, request):
+    timer = None
+    if self.timeout:
+      # Killing the worker ends the reads below.
+      timer = threading.Timer(self.timeout, self.kill)
+      timer.daemon = True
+      timer.start()
+    try:
+      try:
+        self.proc.stdin.write(_encode_varint(len(request)) + request)
+        self.proc.stdin.flush()
+        length = self._read_varint()
+        response = self.proc.stdout.read(length)
+      except (IOError, OSError) as e:
+        raise Closure_worker_error("worker pipe failed: %s" % e)
+      if len(response) != length:
+        raise Closure_worker_error("worker exited mid-response")
+    except Closure_worker_error:
+      if self.timed_out:
+        raise Closure_worker_error("worker gave no response in %gs" %
+                                   self.timeout)
+      raise
+    finally:
+      if timer:
+        timer.cancel()
+    exit_code = 0
+    output = ""
+    pos = 0
+    while pos < len(response):
+      (tag, pos) = _decode_varint(response, pos)
+      if tag & 7 == 0:
+        (value, pos) = _decode_varint(response, pos)
+        if tag >> 3 == 1:
+          # int32 fields are sign-extended to 64 bits on the wire.
+          exit_code = value - (1 << 64) if value >= 1 << 63 else value
+      elif tag & 7 == 2:
+        (length, pos) = _decode_varint(response, pos)
+        if tag >> 3 == 2:
+          output = response[pos:pos + length].decode("utf-8")
+        pos += length
+      else:
+        raise Closure_worker_error("unexpected wire type in WorkResponse")
+    return (exit_code, output)
+
+  def _read_varint(self):
+    data = b""
+    while True:
+      byte = self.proc.stdout.read(1)
+      if not byte:
+        raise Closure_worker_error("worker exited")
+      data += byte
+      if not bytearray(byte)[0] & 0x80:
+        return _decode_varint(data, 0)[0]
+
+  def kill(self):
+    self.timed_out = True
+    try:
+      self.proc.kill()
+    except OSError:
+      # It has already exited.
+      pass
+
+  def close(self):
+    for stream in (self.proc.stdin, self.proc.stdout):
+      try:
+        stream.close()
+      except (IOError, OSError):
+        pass
+    self.proc.wait()
+
+
+class Closure_worker_pool(object):
+  """Hands out persistent compiler workers to the threads compiling targets.
+
+  Workers are started lazily, at most `size` of them, and reused for every
+  later compilation.  A worker which fails, or takes longer than `timeout`
+  seconds over a compilation, is shut down rather than returned, and another
+  started in its place; after `size` failures no more are started, and once
+  none is left every compilation raises Closure_worker_error.
+  """
+  def __init__(self, command, size, timeout=None):
+    self.command = command
+    self.size = size
+    self.timeout = timeout
+    self.started = 0
+    self.failures = 0
+    self.dead = False
+    self.lock = threading.Lock()
+    # Idle workers, and None whenever a worker fails, to wake a waiting thread.
+    self.idle = queue.Queue()
+    self.workers = []
+
+  def compile(self, dash_args):
+    worker = self._acquire()
+    try:
+      result = worker.compile(dash_args)
+    except Closure_worker_error:
+      worker.close()
+      self._discard(worker)
+      raise
+    self.idle.put(worker)
+    return result
+
+  def _acquire(self):
+    while True:
+      start = wait = False
+      with self.lock:
+        if self.dead:
+          # Pass the wake-up on to the next waiting thread.
+          self.idle.put(None)
+          raise Closure_worker_error("no compiler worker is left")
+        try:
+          worker = self.idle.get_nowait()
+        except queue.Empty:
+          worker = None
+          if self.started < self.size and self.failures < self.size:
+            self.started += 1
+            start = True
+          else:
+            wait = True
+      if start:
+        try:
+          worker = Closure_worker(self.command, self.timeout)
+        except Closure_worker_error:
+          self._discard(None)
+          raise
+        with self.lock:
+          self.workers.append(worker)
+        return worker
+      if wait:
+        worker = self.idle.get()
+      if worker is not None:
+        return worker
+
+  def _discard(self, worker):
+    """Forget a worker which failed, or failed to start if None."""
+    with self.lock:
+      if worker is not None:
+        self.workers.remove(worker)
+      self.started -= 1
+      self.failures += 1
+      if self.failures >= self.size and not self.workers:
+        self.dead = True
+    self.idle.put(None)
+
+  def close(self):
+    for worker in self.workers:
+      worker.close()
+
+
+class Remote_compiler_error(Exception):
+  """The remote compiler could not be reached or refused a request."""
+
+
+class Remote_compiler(object):
+  """Client for the Closure Compiler service's /compile JSON API.
+
+  At most `size` requests are in flight at once, each on a keep-alive
+  connection which is reused by later requests.  Connection failures,
+  timeouts and overload responses are retried with exponential backoff.
+  The size and latency of every request are recorded for metrics().
+  """
+  # Statuses which the service may return when busy or briefly unavailable.
+  RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+  def __init__(self, url=REMOTE_COMPILER_URL, timeout=60, retries=3,
+               backoff=1.0, size=4):
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+      raise ValueError("not an http(s) URL: %s" % url)
+    self.url = url
+    self.https = parts.scheme == "https"
+    self.host = parts.hostname
+    self.port = parts.port
+    self.path = parts.path or "/"
+    self.timeout = timeout
+    self.retries = retries
+    self.backoff = backoff
+    self.slots = threading.BoundedSemaphore(size)
+    self.lock = threading.Lock()
+    self.idle = []
+    self.requests = []
+    self.failures = 0
+
+  def compile(self, params):
+    """POST a compilation and return the decoded JSON response.
+
+    Args:
+        params:  (name, value) pairs of the request's form fields.
+
+    Returns:
+        The parsed JSON response, with compiledCode as UTF-8 bytes like the
+        local compiler's output.
+    """
+    body = urlencode([(arg, value.encode("utf-8") if
+                       isinstance(value, type(u"")) else value)
+                      for (arg, value) in params])
+    attempt = 0
+    while True:
+      try:
+        data = self._post(body)
+        break
+      except Remote_compiler_error as e:
+        if attempt >= self.retries:
+          with self.lock:
+            self.failures += 1
+          raise Remote_compiler_error("%s (gave up after %d attempts)" % (
+              e, attempt + 1))
+        delay = self.backoff * 2 ** attempt
+        print("WARNING: %s; retrying in %.1fs." % (e, delay))
+        time.sleep(delay)
+        attempt += 1
+    try:
+      json_data = json.loads(data.decode("utf-8"))
+    except ValueError as e:
+      raise Remote_compiler_error("malformed response from %s: %s" % (
+          self.url, e))
+    if "compiledCode" in json_data:
+      json_data["compiledCode"] = json_data["compiledCode"].encode("utf-8")
+    return json_data
+
+  def _post(self, body):
+    """Send one request, returning the response body."""
+    headers = {"Content-type": "application/x-www-form-urlencoded"}
+    with self.slots:
+      while True:
+        (conn, reused) = self._connection()
+        started = time.time()
+        try:
+          conn.request("POST", self.path, body, headers)
+          response = conn.getresponse()
+          data = response.read()
+          break
+        except (socket.error, httplib.HTTPException) as e:
+          conn.close()
+          if reused and not isinstance(e, socket.timeout):
+            # The server closed an idle keep-alive connection; that is no
+            # reason to wait before trying again on a new one.
+            continue
+          raise Remote_compiler_error("request to %s failed: %s" % (
+              self.url, str(e) or type(e).__name__))
+      latency = time.time() - started
+      if (response.getheader("connection") or "").lower() == "close":
+        conn.close()
+      else:
+        with self.lock:
+          self.idle.append(conn)
+    with self.lock:
+      self.requests.append(dict(status=response.status, latency=latency,
+                                bytes_sent=len(body), bytes_received=len(data)))
+    if response.status in self.RETRY_STATUSES:
+      raise Remote_compiler_error("%s returned HTTP %d" % (
+          self.url, response.status))
+    if response.status != 200:
+      raise Remote_compiler_error("%s returned HTTP %d: %s" % (
+          self.url, response.status, data[:200].decode("utf-8", "replace")))
+    return data
+
+  def _connection(self):
+    with self.lock:
+      if self.idle:
+        return (self.idle.pop(), True)
+    if self.https:
+      conn = httplib.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+    else:
+      conn = httplib.HTTPConnection(self.host, self.port, timeout=self.timeout)
+    return (conn, False)
+
+  def metrics(self):
+    """Summarize the requests made so far."""
+    with self.lock:
+      requests = list(self.requests)
+      failures = self.failures
+    latencies = sorted(request["latency"] for request in requests)
+    return dict(
+      url=self.url,
+      requests=len(requests),
+      failed_requests=len([r for r in requests if r["status"] != 200]),
+      failed_compiles=failures,
+      bytes_sent=sum(request["bytes_sent"] for request in requests),
+      bytes_received=sum(request["bytes_received"] for request in requests),
+      latency_mean=round(sum(latencies) / len(latencies), 4) if latencies else 0,
+      latency_max=round(latencies[-1], 4) if latencies else 0,
+    )
+
+  def close(self):
+    with self.lock:
+      for conn in self.idle:
+        conn.close()
+      self.idle = []
+
+
+class Dependency_graph(object):
+  """goog.provide/goog.require graph of a set of files, shared by every target.
+
+  The graph is persisted to an index file between builds.  A file is only
+  parsed again if its modification time or size changed and its content hash
+  no longer matches, so a warm build reads almost nothing.  update()
+  re-parses individual files as they change.
+  The methods mirror calcdeps.BuildDependenciesFromFiles and
+  calcdeps.CalculateDependencies.
+  """
+  INDEX_VERSION = 1
+
+  def __init__(self, filenames, index_file=None):
+    self.index_file = index_file
+    self.deps = {}
+    self.stamps = {}
+    index = {}
+    if index_file:
+      try:
+        with open(index_file) as f:
+          data = json.load(f)
+        if data.get("version") == self.INDEX_VERSION:
+          index = data["files"]
+      except (IOError, OSError, ValueError, KeyError):
+        pass
+    for filename in filenames:
+      self._load(filename, index.get(filename))
+
+  def _load(self, filename, entry):
+    """Parse a file, unless the index entry shows it is unchanged.
+
+    Args:
+        filename:  Path of the file.
+        entry:  [mtime, size, sha1, provides, requires] from the index, or None.
+
+    Returns:
+        The file's DependencyInfo, or None if it does not exist.
+    """
+    try:
+      stat = os.stat(filename)
+    except OSError:
+      return None
+    if entry and entry[:2] == [stat.st_mtime, stat.st_size]:
+      sha1 = entry[2]
+    else:
+      with open(filename, "rb") as f:
+        sha1 = hashlib.sha1(f.read()).hexdigest()
+    if entry and entry[2] == sha1:
+      dep = calcdeps.DependencyInfo(filename)
+      # str() keeps Python 2 from writing u'' prefixes in GetDepsLine.
+      dep.provides = [str(provide) for provide in entry[3]]
+      dep.requires = [str(require) for require in entry[4]]
+    else:
+      dep = calcdeps.BuildDependenciesFromFiles([filename])[0]
+    self.deps[filename] = dep
+    self.stamps[filename] = [stat.st_mtime, stat.st_size, sha1]
+    return dep
+
+  def update(self, filenames):
+    """Re-parse the given files, forgetting any which no longer exist.
+
+    Returns:
+        True if any file's provides or requires changed.
+    """
+    changed = False
+    for filename in filenames:
+      old = self.deps.pop(filename, None)
+      self.stamps.pop(filename, None)
+      dep = self._load(filename, None)
+      if dep:
+        changed = changed or old is None or (
+            (old.provides, old.requires) != (dep.provides, dep.requires))
+      elif old is not None:
+        changed = True
+    return changed
+
+  def save(self):
+    """Write the index file, for the next build to start from."""
+    if not self.index_file:
+      return
+    files = {}
+    for (filename, dep) in self.deps.items():
+      files[filename] = self.stamps[filename] + [dep.provides, dep.requires]
+    makedirs(os.path.dirname(self.index_file))
+    tmp_path = self.index_file + ".tmp"
+    with open(tmp_path, "w") as f:
+      json.dump({"version": self.INDEX_VERSION, "files": files}, f)
+    replace_file(tmp_path, self.index_file)
+
+  def dependencies(self, paths):
+    """The DependencyInfo of each of the given files, in order."""
+    result = []
+    seen = set()
+    for path in paths:
+      if path in self.deps and path not in seen:
+        seen.add(path)
+        result.append(self.deps[path])
+    return result
+
+  def calculate(self, paths, inputs):
+    """All files, in order, needed to compile the inputs."""
+    for input_file in inputs:
+      if input_file not in self.deps:
+        self.update([input_file])
+    search_hash = calcdeps.BuildDependencyHashFromDependencies(
+        self.dependencies(paths + inputs))
+    result_list = []
+    seen_list = []
+    for input_file in inputs:
+      seen_list.append(input_file)
+      for require in self.deps[input_file].requires:
+        calcdeps.ResolveDependencies(require, search_hash, result_list,
+                                     seen_list)
+      result_list.append(input_file)
+    # All files depend on base.js, so put it first.
+    base_js_path = calcdeps.FindClosureBasePath(paths)
+    if base_js_path:
+      result_list.insert(0, base_js_path)
+    return result_list
+
 
 class Gen_uncompressed(threading.Thread):
   """Generate a JavaScript file that loads Blockly's raw files.
   Runs in a separate thread.
   """
-  def __init__(self, search_paths, vertical, closure_env):
+  def __init__(self, search_paths, vertical, closure_env, deps):
     threading.Thread.__init__(self)
     self.search_paths = search_paths
     self.vertical = vertical
     self.closure_env = closure_env
+    self.deps = deps
 
-  def run(self):
+  @property
+  def target_filename(self):
     if self.vertical:
-      target_filename = 'blockly_uncompressed_vertical.js'
+      return 'blockly_uncompressed_vertical.js'
     else:
-      target_filename = 'blockly_uncompressed_horizontal.js'
-    f = open(target_filename, 'w')
-    f.write(HEADER)
-    f.write(self.format_js("""
+      return 'blockly_uncompressed_horizontal.js'
+
+  def run(self):
+    with profile.phase("generate", self.target_filename):
+      self.generate()
+
+  def generate(self):
+    target_filename = self.target_filename
+    out = []
+    out.append(HEADER)
+    out.append(self.format_js("""
 var isNodeJS = !!(typeof module !== 'undefined' && module.exports &&
                   typeof window === 'undefined');
 
@@ -146,9 +1250,10 @@ window.BLOCKLY_BOOT = function() {
     }
   }
 """))
+    dependencies = self.deps.dependencies(self.search_paths)
     add_dependency = []
     base_path = calcdeps.FindClosureBasePath(self.search_paths)
-    for dep in calcdeps.BuildDependenciesFromFiles(self.search_paths):
+    for dep in dependencies:
       add_dependency.append(calcdeps.GetDepsLine(dep, base_path))
     add_dependency.sort()  # Deterministic build.
     add_dependency = '\n'.join(add_dependency)
@@ -158,20 +1263,20 @@ window.BLOCKLY_BOOT = function() {
     m = re.search('[\\/]([^\\/]+)[\\/]core[\\/]blockly.js', add_dependency)
     add_dependency = re.sub('([\\/])' + re.escape(m.group(1)) +
         '([\\/]core[\\/])', '\\1" + dir + "\\2', add_dependency)
-    f.write(add_dependency + '\n')
+    out.append(add_dependency + '\n')
 
     provides = []
-    for dep in calcdeps.BuildDependenciesFromFiles(self.search_paths):
+    for dep in dependencies:
       # starts with '../' or 'node_modules/'
       if not dep.filename.startswith(self.closure_env["closure_root"] + os.sep):
         provides.extend(dep.provides)
     provides.sort()  # Deterministic build.
-    f.write('\n')
-    f.write('// Load Blockly.\n')
+    out.append('\n')
+    out.append('// Load Blockly.\n')
     for provide in provides:
-      f.write("goog.require('%s');\n" % provide)
+      out.append("goog.require('%s');\n" % provide)
 
-    f.write(self.format_js("""
+    out.append(self.format_js("""
 delete this.BLOCKLY_DIR;
 delete this.BLOCKLY_BOOT;
 };
@@ -188,7 +1293,7 @@ if (isNodeJS) {
   document.write('<script>window.BLOCKLY_BOOT();</script>');
 }
 """))
-    f.close()
+    write_file(target_filename, "".join(out))
     print("SUCCESS: " + target_filename)
 
   def format_js(self, code):
@@ -216,26 +1321,179 @@ if (isNodeJS) {
 
     return begin_brace.sub("{{", end_brace.sub(end_replacement, code)).format(**self.closure_env)
 
+class Gen_bundle(Gen_uncompressed):
+  """Generate one unminified JavaScript file holding Blockly's core and all
+  required parts of Closure, in dependency order, with an index source map
+  that leads back to each original file.
+  Loads as fast as the compressed files while keeping the code readable.
+  Files are only read again if they changed since the last run, so rebuilding
+  after an edit is cheap.
+  Runs in a separate thread.
+  """
+  GOOG_MODULE = re.compile(r"^goog\.module\s*\(", re.MULTILINE)
+
+  def __init__(self, search_paths, vertical, closure_env, deps):
+    Gen_uncompressed.__init__(self, search_paths, vertical, closure_env, deps)
+    # Each file's [mtime, size] and text as last read, by name.
+    self.chunks = {}
+    # The files in the bundle when it was last generated.
+    self.inputs = []
+
+  @property
+  def target_filename(self):
+    if self.vertical:
+      return 'blockly_bundle_vertical.js'
+    else:
+      return 'blockly_bundle_horizontal.js'
+
+  def generate(self):
+    target_filename = self.target_filename
+    filenames = self.deps.calculate(self.search_paths,
+      [os.path.join("core", "blockly.js")])
+    self.chunks = dict((filename, self.chunks[filename])
+                       for filename in filenames if filename in self.chunks)
+
+    # Stop base.js from loading deps.js, every file it needs is here.
+    out = [HEADER, "var CLOSURE_NO_DEPS = true;\n"]
+    line = "".join(out).count("\n")
+    sections = []
+    for filename in filenames:
+      text = self.read_chunk(filename)
+      if self.GOOG_MODULE.search(text):
+        # Wrap goog.module files as the Closure debug loader does.
+        out.append("goog.loadModule(function(exports) {'use strict';\n")
+        line += 1
+        text += "return exports;});\n"
+      out.append(text)
+      lines = text.count("\n")
+      if lines:
+        sections.append(dict(offset=dict(line=line, column=0), map=dict(
+            version=3, sources=[filename.replace(os.sep, "/")], names=[],
+            mappings="AAAA" + ";AACA" * (lines - 1))))
+      line += lines
+    out.append("//# sourceMappingURL=%s.map\n" % target_filename)
+
+    write_file(target_filename, "".join(out))
+    write_file(target_filename + ".map", json.dumps(dict(
+        version=3, file=target_filename, sections=sections), sort_keys=True))
+    self.inputs = filenames
+    print("SUCCESS: " + target_filename)
+
+  def read_chunk(self, filename):
+    """The text of a file, ending with a newline, read again only if the file
+    changed."""
+    stat = os.stat(filename)
+    stamp = [stat.st_mtime, stat.st_size]
+    chunk = self.chunks.get(filename)
+    if chunk is None or chunk[0] != stamp:
+      with codecs.open(filename, "r", "utf-8") as f:
+        text = f.read()
+      if text and not text.endswith("\n"):
+        text += "\n"
+      chunk = self.chunks[filename] = (stamp, text)
+    return chunk[1]
+
 class Gen_compressed(threading.Thread):
   """Generate a JavaScript file that contains all of Blockly's core and all
   required parts of Closure, compiled together.
   Uses the Closure Compiler's online API.
-  Runs in a separate thread.
+  Runs in a separate thread, compiling up to `jobs` targets at once.
   """
-  def __init__(self, search_paths_vertical, search_paths_horizontal, closure_env):
+  def __init__(self, search_paths_vertical, search_paths_horizontal, closure_env,
+               deps, cache=None, jobs=1, workers=None, remote=None,
+               source_maps=False, modern=False, arduino_boards=False):
     threading.Thread.__init__(self)
     self.search_paths_vertical = search_paths_vertical
     self.search_paths_horizontal = search_paths_horizontal
     self.closure_env = closure_env
+    self.deps = deps
+    self.cache = cache
+    self.jobs = jobs
+    self.workers = workers
+    self.remote = remote or Remote_compiler()
+    self.source_maps = source_maps
+    # Whether to also compile the Arduino generators as a base and a chunk per
+    # board, and the files of each board, as found by targets().
+    self.arduino_boards = arduino_boards
+    self.board_files = {}
+    # Whether to also compile every target to ECMASCRIPT_2017.
+    self.modern = modern
+    # (ES5 target, ES2017 target) pairs, and the manifest entry of each pair
+    # compiled so far.
+    self.variants = []
+    self.manifest = {}
+    # Output pipelines, by the stub each removes from its targets.
+    self.pipelines = {}
+    self.exit_code = 0
+
+  MANIFEST_FILENAME = "compressed_manifest.json"
+  ARDUINO_MANIFEST_FILENAME = "arduino_boards.json"
+
+  # The targets holding the generators of one Arduino board.
+  BOARD_CHUNK = re.compile(r"arduino_(%s)_compressed\." % "|".join(
+      re.escape(board) for board in ARDUINO_BOARDS))
 
   def run(self):
-    self.gen_core(True)
-    self.gen_core(False)
-    self.gen_blocks("horizontal")
-    self.gen_blocks("vertical")
-    self.gen_blocks("common")
-    self.gen_generator("arduino")
-    self.gen_generator("python")
+    self.exit_code = self.compile_targets(self.targets())
+    if self.arduino_boards and not self.exit_code:
+      self.write_arduino_manifest()
+
+  def targets(self):
+    """Collect the compilation job for every compressed target.
+
+    Returns:
+        A list of (params, target_filename, filenames, remove) tuples, one per
+        compilation, as produced by gen_core, gen_blocks and gen_generator.
+    """
+    targets = [
+      (self.gen_core, True),
+      (self.gen_core, False),
+      (self.gen_blocks, "horizontal"),
+      (self.gen_blocks, "vertical"),
+      (self.gen_blocks, "common"),
+      (self.gen_generator, "arduino"),
+      (self.gen_generator, "python"),
+    ]
+    if self.arduino_boards:
+      # Scanned once for every board chunk and the manifest.
+      self.board_files = self.arduino_board_files()
+      targets.append((self.gen_arduino_board, None))
+      targets.extend((self.gen_arduino_board, board) for board in ARDUINO_BOARDS)
+    jobs = []
+    for (gen, arg) in targets:
+      with profile.phase("prepare") as record:
+        jobs.append(gen(arg))
+        record["target"] = jobs[-1][1]
+    if self.modern:
+      modern_jobs = [self.gen_modern(job) for job in jobs]
+      self.variants = [(job[1], modern_job[1])
+                       for (job, modern_job) in zip(jobs, modern_jobs)]
+      jobs.extend(modern_jobs)
+    return jobs
+
+  def compile_targets(self, targets):
+    """Compile, report on and write out the given targets.
+
+    Targets compile concurrently, but their results are reported and written
+    in the order given so the build log is the same on every run.
+
+    Returns:
+        The exit code: zero if every target compiled.
+    """
+    pool = ThreadPool(self.jobs)
+    try:
+      for result in pool.imap(lambda target: self.do_compile(*target), targets):
+        self.finish(*result)
+    except SystemExit as e:
+      return e.code
+    except Exception:
+      traceback.print_exc()
+      return 1
+    finally:
+      pool.terminate()
+    if self.modern:
+      self.write_manifest(targets)
+    return 0
 
   def gen_core(self, vertical):
     if vertical:
@@ -259,7 +1517,7 @@ class Gen_compressed(threading.Thread):
     ]
 
     # Read in all the source files.
-    filenames = calcdeps.CalculateDependencies(search_paths,
+    filenames = self.deps.calculate(search_paths,
       [os.path.join("core", "blockly.js")])
     filenames.sort()  # Deterministic build.
     for filename in filenames:
@@ -267,7 +1525,145 @@ class Gen_compressed(threading.Thread):
       # either transform them into arguments for local or remote compilation
       params.append(("js_file", filename))
 
-    self.do_compile(params, target_filename, filenames, "")
+    return (params, target_filename, filenames, "")
+
+  def arduino_board_files(self):
+    """Find the generator files each Arduino board needs besides the base.
+
+    A board needs its own file, any file defining a helper which a file it
+    needs calls, and any file defining generators for its blocks, whose types
+    are named arduino_<board>_*.
+
+    Returns:
+        A dict of file lists, in the order arduino_compressed.js has them, by
+        board.
+    """
+    filenames = dict((board, os.path.join("generators", "arduino", board + ".js"))
+                     for board in ARDUINO_BOARDS)
+    defines = {}
+    calls = {}
+    for (board, filename) in filenames.items():
+      code = read(filename)
+      defines[board] = set(re.findall(
+          r"^Blockly\.Arduino(?:\.(\w+)|\['(\w+)'\])\s*=", code, re.MULTILINE))
+      calls[board] = set(re.findall(r"Blockly\.Arduino\.(\w+)", code))
+    needs = {}
+    for board in ARDUINO_BOARDS:
+      needs[board] = set(other for other in ARDUINO_BOARDS if other != board and
+                         any(helper in calls[board] or
+                             generator.startswith("arduino_%s_" % board)
+                             for (helper, generator) in defines[other]))
+    order = self.gen_generator("arduino")[2]
+    result = {}
+    for board in ARDUINO_BOARDS:
+      boards = set([board])
+      pending = [board]
+      while pending:
+        for other in needs[pending.pop()]:
+          if other not in boards:
+            boards.add(other)
+            pending.append(other)
+      result[board] = [filename for filename in order
+                       if filename in [filenames[b] for b in boards]]
+    return result
+
+  def gen_arduino_board(self, board):
+    """Compile the Arduino generators of one board, or with board None, all
+    generators but the boards'.
+
+    The board chunks are loaded, as needed, after arduino_base_compressed.js.
+    """
+    if board is None:
+      (params, target_filename, filenames, remove) = self.gen_generator(
+          "arduino")
+      exclude = set(os.path.join("generators", "arduino", b + ".js")
+                    for b in ARDUINO_BOARDS)
+      params = [(arg, value) for (arg, value) in params
+                if not (arg == "js_file" and value in exclude)]
+      filenames = [filename for filename in filenames
+                   if filename not in exclude]
+      return (params, "arduino_base_compressed.js", filenames, remove)
+
+    params = [
+        ("compilation_level", "SIMPLE_OPTIMIZATIONS"),
+      ]
+    # Add Blockly.Arduino to be compatible with the compiler.
+    params.append(("js_file", os.path.join("build", "gen_arduino.js")))
+    filenames = self.board_files[board]
+    for filename in filenames:
+      params.append(("js_file", filename))
+    filenames = ["[goog.provide]"] + filenames
+
+    # Remove Blockly.Arduino to be compatible with Blockly.
+    remove = "var Blockly={Arduino:{}};"
+    return (params, "arduino_%s_compressed.js" % board, filenames, remove)
+
+  def write_arduino_manifest(self):
+    """Write which chunk holds the generators of each Arduino board, and which
+    board files are in it, to ARDUINO_MANIFEST_FILENAME."""
+    boards = {}
+    for (board, filenames) in sorted(self.board_files.items()):
+      boards[board] = dict(
+          file="arduino_%s_compressed.js" % board,
+          modules=[os.path.basename(filename)[:-3] for filename in filenames])
+    write_file(self.ARDUINO_MANIFEST_FILENAME, json.dumps(dict(
+        base="arduino_base_compressed.js", boards=boards), indent=2,
+        separators=(",", ": "), sort_keys=True) + "\n")
+
+  def gen_modern(self, job):
+    """Turn an ES5 compilation job into one for ES2017 capable browsers."""
+    (params, target_filename, filenames, remove) = job
+    params = [(arg, value) for (arg, value) in params
+              if arg not in ("language_in", "language_out")]
+    params[1:1] = [
+      ("language_in", "ECMASCRIPT_2017"),
+      ("language_out", "ECMASCRIPT_2017"),
+    ]
+    target_filename = target_filename[:-3] + ".es2017.js"
+    return (params, target_filename, filenames, remove)
+
+  def write_manifest(self, targets):
+    """Describe the ES5 and ES2017 variants of every target in
+    MANIFEST_FILENAME, so a page can load the variant the browser supports,
+    and report how the variants of the given targets compare.
+    """
+    compiled = set(target[1] for target in targets)
+    pairs = [pair for pair in self.variants
+             if compiled.intersection(pair) and
+             all(os.path.isfile(filename) for filename in pair)]
+    with profile.phase("parse time"):
+      times = parse_times([filename for pair in pairs for filename in pair])
+    if times is None:
+      print("Node.js not found; not measuring parse times.")
+    metrics = {}
+    for (es5, modern) in pairs:
+      entry = {}
+      for (key, filename) in (("nomodule", es5), ("module", modern)):
+        with open(filename, "rb") as f:
+          data = f.read()
+        entry[key] = dict(file=filename, size=len(data),
+                          gzip_size=len(zlib.compress(data)),
+                          sha1=hashlib.sha1(data).hexdigest())
+      self.manifest[es5] = entry
+      (old, new) = (entry["nomodule"], entry["module"])
+      report = "ES2017: %s is %d KB (%+d%% on ES5), %d KB gzipped (%+d%%)" % (
+          modern, new["size"] // 1024, percent_change(old["size"], new["size"]),
+          new["gzip_size"] // 1024,
+          percent_change(old["gzip_size"], new["gzip_size"]))
+      metrics[es5] = dict(es5_size=old["size"], es2017_size=new["size"],
+                          es5_gzip_size=old["gzip_size"],
+                          es2017_gzip_size=new["gzip_size"])
+      if times and times[es5] and times[modern]:
+        report += ", parses in %.1f ms (%+d%%)" % (
+            times[modern], percent_change(times[es5], times[modern]))
+        metrics[es5].update(es5_parse_ms=times[es5],
+                            es2017_parse_ms=times[modern])
+      print(report + ".")
+    profile.add_metrics("es2017", metrics)
+    write_file(self.MANIFEST_FILENAME, json.dumps(dict(
+        language_out=dict(nomodule="ECMASCRIPT5", module="ECMASCRIPT_2017"),
+        targets=self.manifest), indent=2, separators=(",", ": "),
+        sort_keys=True) + "\n")
 
   def gen_blocks(self, block_type):
     if block_type == "horizontal":
@@ -302,7 +1698,7 @@ class Gen_compressed(threading.Thread):
 
     # Remove Blockly.Blocks to be compatible with Blockly.
     remove = "var Blockly={Blocks:{}};"
-    self.do_compile(params, target_filename, filenames, remove)
+    return (params, target_filename, filenames, remove)
 
   def gen_generator(self, language):
     target_filename = language + "_compressed.js"
@@ -324,20 +1720,62 @@ class Gen_compressed(threading.Thread):
 
     # Remove Blockly.Generator to be compatible with Blockly.
     remove = "var Blockly={Generator:{}};"
-    self.do_compile(params, target_filename, filenames, remove)
+    return (params, target_filename, filenames, remove)
 
   def do_compile(self, params, target_filename, filenames, remove):
     if self.closure_env["closure_compiler"] == REMOTE_COMPILER:
       do_compile = self.do_compile_remote
     else:
       do_compile = self.do_compile_local
-    json_data = do_compile(params, target_filename)
 
+    json_data = None
+    if self.cache:
+      with profile.phase("cache", target_filename):
+        # The key must be taken before compiling, do_compile_remote extends
+        # params.  Entries with a source map are kept apart from those without.
+        cache_key = self.cache.key(
+            params + [("source_map_format", "V3")] if self.source_maps
+            else params)
+        json_data = self.cache.get(cache_key)
+    cached = json_data is not None
+    if not cached:
+      with profile.phase(do_compile.__name__[3:].replace("_", " "),
+                         target_filename):
+        json_data = do_compile(params, target_filename)
+      if self.cache:
+        self.cache.put(cache_key, json_data)
+    return (target_filename, filenames, remove, json_data, cached)
+
+  def finish(self, target_filename, filenames, remove, json_data, cached):
+    """Report on a compiled target and write it out.  Called in target order."""
+    if cached:
+      print("CACHED: " + target_filename)
+    diagnostics = json_data.get("diagnostics")
+    if diagnostics:
+      sys.stderr.write(diagnostics.encode("utf-8") if str is bytes
+                       else diagnostics)
     if self.report_errors(target_filename, filenames, json_data):
       self.write_output(target_filename, remove, json_data)
       self.report_stats(target_filename, json_data)
 
   def do_compile_local(self, params, target_filename):
+      if not self.source_maps:
+        return self.compile_local(params, target_filename, [])
+      # The compiler writes the source map to a file, which is read back into
+      # the result so that it is cached along with the code.
+      (fd, map_filename) = tempfile.mkstemp(suffix=".map")
+      os.close(fd)
+      try:
+        json_data = self.compile_local(params, target_filename, [
+            "--create_source_map", map_filename, "--source_map_format", "V3"])
+        if "compiledCode" in json_data:
+          with codecs.open(map_filename, "r", "utf-8") as f:
+            json_data["sourceMap"] = f.read()
+        return json_data
+      finally:
+        os.remove(map_filename)
+
+  def compile_local(self, params, target_filename, extra_args):
       filter_keys = ["use_closure_library"]
 
       # Drop arg if arg is js_file else add dashes
@@ -350,6 +1788,16 @@ class Gen_compressed(threading.Thread):
       for pair in dash_params:
         if pair[0][2:] not in filter_keys:
           dash_args.extend(pair)
+      dash_args.extend(extra_args)
+
+      if self.workers and not self.workers.dead:
+        try:
+          (returncode, stdout, stderr) = self.workers.compile(dash_args)
+          return self.local_result(params, target_filename, returncode, stdout,
+                                   stderr)
+        except Closure_worker_error as e:
+          print("WARNING: %s; compiling %s in its own process." % (
+              e, target_filename))
 
       # Build the final args array by prepending CLOSURE_COMPILER_NPM to
       # dash_args and dropping any falsy members
@@ -369,20 +1817,31 @@ class Gen_compressed(threading.Thread):
 
         args = [closure_compiler, "--flagfile", f_name]
 
-        proc = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, shell=True)
+        proc = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
       else:
         args = []
         for group in [[CLOSURE_COMPILER_NPM], dash_args]:
           args.extend(filter(lambda item: item, group))
 
-          proc = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        proc = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
       (stdout, stderr) = proc.communicate()
+      return self.local_result(params, target_filename, proc.returncode, stdout,
+                               stderr.decode("utf-8", "replace"))
+
+  def local_result(self, params, target_filename, returncode, stdout, stderr):
+      # The compiler's diagnostics are kept with the target, for finish to
+      # print, rather than left to run together with those of other targets.
+      if returncode:
+        return dict(diagnostics=stderr, errors=[dict(
+            error="%s exited with status %d" % (target_filename, returncode),
+            file=None)])
 
       # Build the JSON response.
       filesizes = [os.path.getsize(value) for (arg, value) in params if arg == "js_file"]
       return dict(
         compiledCode=stdout,
+        diagnostics=stderr,
         statistics=dict(
           originalSize=functools.reduce(lambda v, size: v + size, filesizes, 0),
           compressedSize=len(stdout),
@@ -419,16 +1878,10 @@ class Gen_compressed(threading.Thread):
           else:
             remoteParams.append((arg, value))
 
-      headers = {"Content-type": "application/x-www-form-urlencoded"}
-      conn = httplib.HTTPSConnection("closure-compiler.appspot.com")
-      conn.request("POST", "/compile", urlencode(remoteParams), headers)
-      response = conn.getresponse()
-      # Decode is necessary for Python 3.4 compatibility
-      json_str = response.read().decode("utf-8")
-      conn.close()
-
-      # Parse the JSON response.
-      return json.loads(json_str)
+      try:
+        return self.remote.compile(remoteParams)
+      except Remote_compiler_error as e:
+        return dict(errors=[dict(error=str(e), file=None)])
 
   def report_errors(self, target_filename, filenames, json_data):
     def file_lookup(name):
@@ -475,45 +1928,24 @@ class Gen_compressed(threading.Thread):
         print("FATAL ERROR: Compiler did not return compiledCode.")
         sys.exit(1)
 
-      compiledCode = json_data["compiledCode"].decode("utf-8")
-
-      if (compiledCode.find("new Blockly.Generator") != -1):
-        code = HEADER + "\nlet Blockly = require(\'robopro-blocks\');\n\n" + compiledCode
-      else:
-        code = HEADER + "\n" + compiledCode
-
-      code = code.replace(remove, "")
-
-      # Trim down Google's (and only Google's) Apache licences.
-      # The Closure Compiler preserves these.
-      LICENSE = re.compile("""/\\*
-
- [\w ]+
-
- Copyright \\d+ Google Inc.
- https://developers.google.com/blockly/
-
- Licensed under the Apache License, Version 2.0 \(the "License"\);
- you may not use this file except in compliance with the License.
- You may obtain a copy of the License at
-
-   http://www.apache.org/licenses/LICENSE-2.0
-
- Unless required by applicable law or agreed to in writing, software
- distributed under the License is distributed on an "AS IS" BASIS,
- WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
- See the License for the specific language governing permissions and
- limitations under the License.
-\\*/""")
-      code = re.sub(LICENSE, "", code)
-
       stats = json_data["statistics"]
       original_b = stats["originalSize"]
       compressed_b = stats["compressedSize"]
       if original_b > 0 and compressed_b > 0:
-        f = open(target_filename, "w")
-        f.write(code)
-        f.close()
+        compiled_code = json_data["compiledCode"]
+        # Generators, board chunks included, extend the Blockly of the module.
+        if (compiled_code.find(b"new Blockly.Generator") != -1 or
+            self.BOARD_CHUNK.match(target_filename)):
+          header = HEADER + "\nlet Blockly = require(\'robopro-blocks\');\n\n"
+        else:
+          header = HEADER + "\n"
+        pipeline = self.pipelines.get(remove)
+        if pipeline is None:
+          pipeline = self.pipelines[remove] = Output_pipeline(remove)
+        with profile.phase("write", target_filename):
+          size = pipeline.write(target_filename, header, compiled_code,
+                                json_data.get("sourceMap"))
+        profile.add_sizes(target_filename, original_b, size)
 
   def report_stats(self, target_filename, json_data):
       stats = json_data["statistics"]
@@ -526,7 +1958,7 @@ class Gen_compressed(threading.Thread):
         print("SUCCESS: " + target_filename)
         print("Size changed from %d KB to %d KB (%d%%)." % (
             original_kb, compressed_kb, ratio))
-        if(os.name == "nt"):
+        if(os.name == "nt" and os.path.exists(target_filename + ".config")):
           os.remove(target_filename + ".config")
       else:
         print("UNKNOWN ERROR")
@@ -538,8 +1970,10 @@ class Gen_langfiles(threading.Thread):
   Runs in a separate thread.
   """
 
-  def __init__(self):
+  def __init__(self, jobs=1):
     threading.Thread.__init__(self)
+    self.jobs = jobs
+    self.exit_code = 0
 
   def _rebuild(self, srcs, dests):
     # Determine whether any of the files in srcs is newer than any in dests.
@@ -560,44 +1994,52 @@ class Gen_langfiles(threading.Thread):
         print("Error checking file creation times: " + str(e))
 
   def run(self):
-    # The files msg/json/{en,qqq,synonyms}.json depend on msg/messages.js.
-    if self._rebuild([os.path.join("msg", "messages.js")],
-                     [os.path.join("msg", "json", f) for f in
-                      ["en.json", "qqq.json", "synonyms.json"]]):
-      try:
-        subprocess.check_call([
-            "python",
-            os.path.join("i18n", "js_to_json.py"),
-            "--input_file", "msg/messages.js",
-            "--output_dir", "msg/json/",
-            "--quiet"])
-      except (subprocess.CalledProcessError, OSError) as e:
-        # Documentation for subprocess.check_call says that CalledProcessError
-        # will be raised on failure, but I found that OSError is also possible.
-        print("Error running i18n/js_to_json.py: ", e)
-        sys.exit(1)
+    try:
+      with profile.phase("generate", "msg/js"):
+        self.generate()
+    except SystemExit as e:
+      self.exit_code = e.code
+
+  def generate(self):
+    # The i18n scripts run in this process, so that the message tables
+    # extracted from msg/messages.js are handed straight to create_messages.
+    js_to_json = import_path(os.path.join("i18n", "js_to_json.py"))
+    create_messages = import_path(os.path.join("i18n", "create_messages.py"))
+    json_dir = os.path.join("msg", "json")
+
+    try:
+      # The files msg/json/{en,qqq,synonyms}.json depend on msg/messages.js.
+      if self._rebuild([os.path.join("msg", "messages.js")],
+                       [os.path.join(json_dir, f) for f in
+                        ["en.json", "qqq.json", "synonyms.json"]]):
+        catalog = js_to_json.extract_messages(
+            os.path.join("msg", "messages.js"))
+        js_to_json.write_messages(catalog, json_dir, quiet=True)
+      else:
+        catalog = create_messages.Catalog.load(
+            os.path.join(json_dir, "en.json"),
+            synonym_file=os.path.join(json_dir, "synonyms.json"),
+            constant_file=os.path.join(json_dir, "constants.json"))
+    except (IOError, create_messages.InputError) as e:
+      print("Error extracting messages from msg/messages.js: ", e)
+      sys.exit(1)
 
-    # Checking whether it is necessary to rebuild the js files would be a lot of
-    # work since we would have to compare each <lang>.json file with each
-    # <lang>.js file.  Rebuilding is easy and cheap, so just go ahead and do it.
+    # create_messages keeps a manifest of the inputs each <lang>.js file was
+    # generated from, so only languages whose .json file (or one of the shared
+    # en/synonyms/constants tables) changed are regenerated.
+    json_files = glob.glob(os.path.join(json_dir, "*.json"))
+    json_files = [file for file in json_files if not
+                  (file.endswith(("keys.json", "synonyms.json", "qqq.json", "constants.json")))]
     try:
-      # Use create_messages.py to create .js files from .json files.
-      cmd = [
-          "python",
-          os.path.join("i18n", "create_messages.py"),
-          "--source_lang_file", os.path.join("msg", "json", "en.json"),
-          "--source_synonym_file", os.path.join("msg", "json", "synonyms.json"),
-          "--source_constants_file", os.path.join("msg", "json", "constants.json"),
-          "--key_file", os.path.join("msg", "json", "keys.json"),
-          "--output_dir", os.path.join("msg", "js"),
-          "--quiet"]
-      json_files = glob.glob(os.path.join("msg", "json", "*.json"))
-      json_files = [file for file in json_files if not
-                    (file.endswith(("keys.json", "synonyms.json", "qqq.json", "constants.json")))]
-      cmd.extend(json_files)
-      subprocess.check_call(cmd)
-    except (subprocess.CalledProcessError, OSError) as e:
-      print("Error running i18n/create_messages.py: ", e)
+      (written, unchanged) = create_messages.generate_language_files(
+          json_files, catalog, os.path.join("msg", "js"), quiet=True,
+          jobs=self.jobs)
+      for filename in written:
+        outputs.record(filename, True)
+      for filename in unchanged:
+        outputs.record(filename, False)
+    except (IOError, create_messages.InputError) as e:
+      print("Error creating messages from msg/json: ", e)
       sys.exit(1)
 
     # Output list of .js files created.
@@ -609,6 +2051,166 @@ class Gen_langfiles(threading.Thread):
       else:
         print("FAILED to create " + f)
 
+class Poll_watcher(object):
+  """Detects changed .js files by polling their modification times."""
+  def __init__(self, directories, interval=0.5):
+    self.directories = directories
+    self.interval = interval
+    self.snapshot = self._scan()
+
+  def _scan(self):
+    snapshot = {}
+    for directory in self.directories:
+      for (root, _, names) in os.walk(directory):
+        for name in names:
+          if name.endswith(".js"):
+            path = os.path.normpath(os.path.join(root, name))
+            try:
+              stat = os.stat(path)
+            except OSError:
+              continue
+            snapshot[path] = (stat.st_mtime, stat.st_size)
+    return snapshot
+
+  def wait(self):
+    """Block until some files change, and return their paths."""
+    while True:
+      time.sleep(self.interval)
+      snapshot = self._scan()
+      changed = set(path for path in set(snapshot) | set(self.snapshot)
+                    if snapshot.get(path) != self.snapshot.get(path))
+      self.snapshot = snapshot
+      if changed:
+        return changed
+
+
+class Inotify_watcher(object):
+  """Detects changed .js files with Linux's inotify, called through libc."""
+  # IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+  MASK = 0x8 | 0x40 | 0x80 | 0x100 | 0x200
+
+  def __init__(self, directories):
+    import ctypes, ctypes.util
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                       use_errno=True)
+    self.fd = libc.inotify_init()
+    if self.fd < 0:
+      raise OSError(ctypes.get_errno(), "inotify_init failed")
+    self.paths = {}
+    for directory in directories:
+      for (root, _, _) in os.walk(directory):
+        wd = libc.inotify_add_watch(
+            self.fd, root.encode(sys.getfilesystemencoding()), self.MASK)
+        if wd < 0:
+          raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+        self.paths[wd] = root
+
+  def wait(self):
+    """Block until some files change, and return their paths."""
+    changed = set()
+    timeout = None
+    while True:
+      if not select.select([self.fd], [], [], timeout)[0]:
+        # Nothing more for a moment, the editor has finished saving.
+        return changed
+      data = os.read(self.fd, 65536)
+      pos = 0
+      while pos < len(data):
+        (wd, _, _, length) = struct.unpack_from("iIII", data, pos)
+        name = data[pos + 16:pos + 16 + length].rstrip(b"\0")
+        name = name.decode(sys.getfilesystemencoding())
+        pos += 16 + length
+        if name.endswith(".js") and wd in self.paths:
+          changed.add(os.path.normpath(os.path.join(self.paths[wd], name)))
+      if changed:
+        timeout = 0.1
+
+
+def make_watcher(directories):
+  """Watch with inotify where the platform has it, otherwise by polling."""
+  try:
+    return Inotify_watcher(directories)
+  except (AttributeError, OSError):
+    return Poll_watcher(directories)
+
+
+def watch(uncompressed, compressed, deps, search_roots, directories,
+          bundles=()):
+  """Rebuild the targets whose inputs change, until interrupted.
+
+  Args:
+      uncompressed:  The Gen_uncompressed generators.
+      compressed:  The Gen_compressed generator.
+      deps:  Dependency_graph of every file under search_roots.
+      search_roots:  Directories searched for goog.provide.
+      directories:  Every directory holding inputs, including search_roots.
+      bundles:  The Gen_bundle generators, if any.
+  """
+  watcher = make_watcher(directories)
+  last_inputs = {}
+  for (params, target_filename, _, _) in compressed.targets():
+    last_inputs[target_filename] = [
+        value for (arg, value) in params if arg == "js_file"]
+  print("Watching for changes with %s.  Press Ctrl-C to stop." %
+        ("inotify" if isinstance(watcher, Inotify_watcher) else "polling"))
+
+  def in_search_roots(path):
+    return any(path.startswith(root + os.sep) for root in search_roots)
+
+  try:
+    while True:
+      changed = watcher.wait()
+      started = time.time()
+      edited = started
+      outputs.reset()
+      for path in changed:
+        if os.path.isfile(path):
+          edited = min(edited, os.path.getmtime(path))
+
+      # Keep every generator's search paths in step with added or removed
+      # files, then re-parse just the changed files.
+      searched = [path for path in changed if in_search_roots(path)]
+      for gen in list(uncompressed) + list(bundles):
+        for path in searched:
+          exists = os.path.isfile(path)
+          if exists and path not in gen.search_paths and (exclude_horizontal(path)
+              if gen.vertical else exclude_vertical(path)):
+            gen.search_paths.append(path)
+          elif not exists and path in gen.search_paths:
+            gen.search_paths.remove(path)
+      rebuilt = []
+      graph_changed = deps.update(searched)
+      if searched:
+        deps.save()
+      if graph_changed:
+        for gen in uncompressed:
+          gen.run()
+          rebuilt.append(gen.target_filename)
+      for gen in bundles:
+        if graph_changed or changed.intersection(gen.inputs):
+          gen.run()
+          rebuilt.append(gen.target_filename)
+
+      targets = []
+      for target in compressed.targets():
+        (params, target_filename, _, _) = target
+        inputs = [value for (arg, value) in params if arg == "js_file"]
+        if inputs != last_inputs.get(target_filename) or changed.intersection(inputs):
+          targets.append(target)
+          last_inputs[target_filename] = inputs
+      if targets:
+        compressed.compile_targets(targets)
+        rebuilt.extend(target[1] for target in targets)
+
+      if rebuilt:
+        finished = time.time()
+        print("REBUILT %s in %.2fs (%.2fs after the edit); %s\n" % (
+            ", ".join(rebuilt), finished - started, finished - edited,
+            outputs.summary()))
+  except KeyboardInterrupt:
+    pass
+
+
 def exclude_vertical(item):
   return not item.endswith("block_render_svg_vertical.js")
 
@@ -616,6 +2218,66 @@ def exclude_horizontal(item):
   return not item.endswith("block_render_svg_horizontal.js")
 
 if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Build Blockly.")
+  parser.add_argument("--no-cache", dest="cache", action="store_false",
+                      help="always recompile and re-parse dependencies, "
+                      "ignoring the build cache")
+  parser.add_argument("--cache-dir", default=CACHE_DIR,
+                      help="directory holding cached compiler results and the "
+                      "dependency index")
+  parser.add_argument("--jobs", "-j", type=int,
+                      default=multiprocessing.cpu_count(),
+                      help="number of targets to compile at once")
+  parser.add_argument("--watch", action="store_true",
+                      help="after building, keep rebuilding targets whose "
+                      "inputs change")
+  parser.add_argument("--profile", nargs="?", const="build_profile.json",
+                      metavar="FILE",
+                      help="time each build phase and write a report to FILE "
+                      "(default: %(const)s)")
+  parser.add_argument("--no-worker", dest="worker", action="store_false",
+                      help="start a new compiler process for every target "
+                      "instead of reusing persistent compiler workers")
+  parser.add_argument("--worker-timeout", type=float, default=300,
+                      help="seconds a persistent compiler worker may take over "
+                      "one target before it is killed and the target compiled "
+                      "in a process of its own")
+  parser.add_argument("--remote", action="store_true",
+                      help="compile with the remote compiler even if a local "
+                      "one is installed")
+  parser.add_argument("--remote-url", default=REMOTE_COMPILER_URL,
+                      help="address of the remote compiler's /compile API "
+                      "(default: %(default)s)")
+  parser.add_argument("--remote-timeout", type=float, default=60,
+                      help="seconds to wait for each remote compile request")
+  parser.add_argument("--remote-retries", type=int, default=3,
+                      help="times to retry a failed remote compile request")
+  parser.add_argument("--remote-connections", type=int, default=4,
+                      help="most remote compile requests to have in flight "
+                      "at once")
+  parser.add_argument("--source-maps", action="store_true",
+                      help="write a source map next to every compressed "
+                      "file (local compiler only)")
+  parser.add_argument("--bundle", action="store_true",
+                      help="also concatenate the uncompressed files into "
+                      "blockly_bundle_vertical.js and "
+                      "blockly_bundle_horizontal.js, with source maps")
+  parser.add_argument("--es2017", action="store_true",
+                      help="also compile every compressed file to "
+                      "ECMASCRIPT_2017, as <name>.es2017.js, and describe both "
+                      "variants in %s (local compiler only)" %
+                      Gen_compressed.MANIFEST_FILENAME)
+  parser.add_argument("--arduino-boards", action="store_true",
+                      help="also compile the Arduino generators into "
+                      "arduino_base_compressed.js and a chunk per board, "
+                      "listed in %s" % Gen_compressed.ARDUINO_MANIFEST_FILENAME)
+  parser.add_argument("--langfiles", action="store_true",
+                      help="also generate msg/js/<LANG>.js from msg/json, as "
+                      "npm run translate does")
+  args = parser.parse_args()
+  profile.enabled = args.profile is not None
+
+  workers = None
   try:
     closure_dir = CLOSURE_DIR_NPM
     closure_root = CLOSURE_ROOT_NPM
@@ -626,18 +2288,53 @@ if __name__ == "__main__":
     calcdeps = import_path(os.path.join(
         closure_root, closure_library, "closure", "bin", "calcdeps.py"))
 
-    # Sanity check the local compiler
-    test_args = [closure_compiler, os.path.join("build", "test_input.js")]
-    if(os.name == "nt"):
-      test_proc = subprocess.Popen(test_args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, shell=True)
+    if args.remote:
+      # The local library is still used for dependencies.
+      closure_compiler = REMOTE_COMPILER
+      print("Using remote compiler: %s ...\n" % args.remote_url)
     else:
-      test_proc = subprocess.Popen(test_args, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-    (stdout, _) = test_proc.communicate()
-    assert stdout.decode("utf-8") == read(os.path.join("build", "test_expect.js"))
+      # Sanity check the local compiler, on a persistent worker if possible
+      # so that the same JVM goes on to compile every target.  This is also
+      # the check that the installed compiler supports --persistent_worker;
+      # if it does not, or the worker gets the test input wrong, every target
+      # is compiled in a process of its own.
+      stdout = None
+      if args.worker and os.path.isfile(CLOSURE_COMPILER_JAR_NPM):
+        workers = Closure_worker_pool(
+            ["java", "-jar", CLOSURE_COMPILER_JAR_NPM], max(1, args.jobs),
+            args.worker_timeout)
+        try:
+          (exit_code, stdout, _) = workers.compile(
+              [os.path.join("build", "test_input.js")])
+          if exit_code or stdout.decode("utf-8") != read(
+              os.path.join("build", "test_expect.js")):
+            raise Closure_worker_error("build/test_input.js compiled wrongly")
+        except Closure_worker_error as e:
+          print("WARNING: %s does not work as a persistent worker (%s); "
+                "starting a compiler process per target.\n" % (
+                    CLOSURE_COMPILER_JAR_NPM, e))
+          workers.close()
+          workers = None
+          stdout = None
+      if stdout is None:
+        test_args = [closure_compiler, os.path.join("build", "test_input.js")]
+        if(os.name == "nt"):
+          test_proc = subprocess.Popen(test_args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, shell=True)
+        else:
+          test_proc = subprocess.Popen(test_args, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        (stdout, _) = test_proc.communicate()
+      assert stdout.decode("utf-8") == read(os.path.join("build", "test_expect.js"))
 
-    print("Using local compiler: %s ...\n" % CLOSURE_COMPILER_NPM)
+      if workers:
+        print("Using local compiler: %s (persistent workers) ...\n" %
+              CLOSURE_COMPILER_JAR_NPM)
+      else:
+        print("Using local compiler: %s ...\n" % CLOSURE_COMPILER_NPM)
   except (ImportError, AssertionError):
-    print("Using remote compiler: closure-compiler.appspot.com ...\n")
+    print("Using remote compiler: %s ...\n" % args.remote_url)
+    if workers:
+      workers.close()
+      workers = None
 
     try:
       closure_dir = CLOSURE_DIR
@@ -662,8 +2359,8 @@ if __name__ == "__main__":
   developers.google.com/blockly/guides/modify/web/closure""")
       sys.exit(1)
 
-  search_paths = list(calcdeps.ExpandDirectories(
-      ["core", os.path.join(closure_root, closure_library)]))
+  search_roots = ["core", os.path.join(closure_root, closure_library)]
+  search_paths = list(calcdeps.ExpandDirectories(search_roots))
 
   search_paths_horizontal = list(filter(exclude_vertical, search_paths))
   search_paths_vertical = list(filter(exclude_horizontal, search_paths))
@@ -675,16 +2372,76 @@ if __name__ == "__main__":
     "closure_compiler": closure_compiler,
   }
 
+  if args.cache:
+    cache = Compile_cache(args.cache_dir, compiler_version(closure_compiler))
+  else:
+    cache = None
+
+  # Parse the dependencies once, for every target and any later rebuilds.
+  with profile.phase("dependencies"):
+    deps = Dependency_graph(search_paths, os.path.join(args.cache_dir, "deps.json")
+                            if args.cache else None)
+
+  remote = None
+  if closure_compiler == REMOTE_COMPILER:
+    remote = Remote_compiler(args.remote_url, timeout=args.remote_timeout,
+                             retries=max(0, args.remote_retries),
+                             size=max(1, args.remote_connections))
+    if args.source_maps:
+      print("WARNING: The remote compiler does not return source maps; "
+            "building without them.\n")
+      args.source_maps = False
+    if args.es2017:
+      print("WARNING: The remote compiler only compiles to ECMASCRIPT5; "
+            "building without ES2017 variants.\n")
+      args.es2017 = False
+
   # Run all tasks in parallel threads.
   # Uncompressed is limited by processor speed.
   # Compressed is limited by network and server speed.
-  # Vertical:
-  Gen_uncompressed(search_paths_vertical, True, closure_env).start()
-  # Horizontal:
-  Gen_uncompressed(search_paths_horizontal, False, closure_env).start()
-
-  # Compressed forms of vertical and horizontal.
-  Gen_compressed(search_paths_vertical, search_paths_horizontal, closure_env).start()
-
-  # This is run locally in a separate thread.
-  # Gen_langfiles().start()
+  threads = [
+    # Vertical:
+    Gen_uncompressed(search_paths_vertical, True, closure_env, deps),
+    # Horizontal:
+    Gen_uncompressed(search_paths_horizontal, False, closure_env, deps),
+    # Compressed forms of vertical and horizontal.
+    Gen_compressed(search_paths_vertical, search_paths_horizontal, closure_env,
+                   deps, cache, max(1, args.jobs), workers, remote,
+                   args.source_maps, args.es2017, args.arduino_boards),
+  ]
+  if args.langfiles:
+    # This is run locally in a separate thread.
+    threads.append(Gen_langfiles(max(1, args.jobs)))
+  bundles = []
+  if args.bundle:
+    bundles = [
+      Gen_bundle(list(search_paths_vertical), True, closure_env, deps),
+      Gen_bundle(list(search_paths_horizontal), False, closure_env, deps),
+    ]
+    threads.extend(bundles)
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  deps.save()
+  print(outputs.summary())
+  if args.watch:
+    watch(threads[:2], threads[2], deps, search_roots, search_roots + [
+        "blocks_common", "blocks_horizontal", "blocks_vertical", "generators",
+        "build"], bundles)
+  if workers:
+    workers.close()
+  if remote:
+    remote.close()
+    metrics = remote.metrics()
+    if metrics["requests"]:
+      print("Remote compiler: %d requests (%d failed), %d KB sent, %d KB "
+            "received, %.2fs mean and %.2fs max latency." % (
+                metrics["requests"], metrics["failed_requests"],
+                metrics["bytes_sent"] // 1024, metrics["bytes_received"] // 1024,
+                metrics["latency_mean"], metrics["latency_max"]))
+    profile.add_metrics("remote", metrics)
+  if profile.enabled:
+    profile.write(args.profile)
+  if not args.watch and any(getattr(thread, "exit_code", 0) for thread in threads):
+    sys.exit(1)
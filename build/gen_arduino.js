@@ -0,0 +1 @@
+goog.provide('Blockly.Arduino');
\ No newline at end of file
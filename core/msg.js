@@ -60,3 +60,38 @@ goog.getMsg = function(str, opt_values) {
 goog.getMsg.blocklyMsgMap = {
   'Today': 'TODAY'
 };
+
+/**
+ * The source language (English) messages, copied from Blockly.Msg when the
+ * first delta language file is applied.
+ * @type {Object<string, string>}
+ * @private
+ */
+Blockly.Msg.fallback_ = null;
+
+/**
+ * Apply the messages of a delta language file, as written by
+ * i18n/create_messages.py --delta.  Such a file only holds the messages its
+ * language translates; every other message falls back to English, so the
+ * English messages must be loaded first.
+ * @param {!Object<string, string>} messages Map of keys to translations.
+ */
+Blockly.Msg.applyDelta = function(messages) {
+  var fallback = Blockly.Msg.fallback_;
+  var key;
+  if (!fallback) {
+    fallback = Blockly.Msg.fallback_ = {};
+    for (key in Blockly.Msg) {
+      if (typeof Blockly.Msg[key] == 'string') {
+        fallback[key] = Blockly.Msg[key];
+      }
+    }
+  }
+  // Undo any previously applied language before applying this one.
+  for (key in fallback) {
+    Blockly.Msg[key] = fallback[key];
+  }
+  for (key in messages) {
+    Blockly.Msg[key] = messages[key];
+  }
+};
@@ -83,3 +83,95 @@ Blockly.ScratchMsgs.translate = function(msgId, defaultMsg, useLocale) {
   }
   return defaultMsg;
 };
+
+/**
+ * URL prefix of the message packs loadLocale fetches, '<locale>.json' is
+ * appended to it.  Message packs are written by
+ * i18n/create_messages.py --format pack.
+ * @type {string}
+ */
+Blockly.ScratchMsgs.packPath = 'msg/packs/';
+
+/**
+ * The Blockly.Msg message packs loaded so far, by locale.  They are kept apart
+ * from the scratch-msgs tables in Blockly.ScratchMsgs.locales.
+ * @type {!Object<string, !Object<string, string>>}
+ * @private
+ */
+Blockly.ScratchMsgs.packs_ = {};
+
+/**
+ * Callbacks waiting for each message pack being fetched, by locale.
+ * @type {!Object<string, !Array<function(boolean)>>}
+ * @private
+ */
+Blockly.ScratchMsgs.pendingLoads_ = {};
+
+/**
+ * Apply a loaded message pack to Blockly.Msg, then the locale's scratch-msgs
+ * messages, if any, on top of it.
+ * @param {string} locale E.g., 'de', or 'zh-tw'
+ * @private
+ */
+Blockly.ScratchMsgs.applyPack_ = function(locale) {
+  // Every message of the pack replaces the current language's.
+  Blockly.Msg.applyDelta(Blockly.ScratchMsgs.packs_[locale]);
+  if (Object.keys(Blockly.ScratchMsgs.locales).includes(locale)) {
+    Blockly.ScratchMsgs.setLocale(locale);
+  } else {
+    Blockly.ScratchMsgs.currentLocale_ = locale;
+  }
+};
+
+/**
+ * Change the Blockly.Msg strings to a new Locale, first fetching its message
+ * pack if the locale is not loaded yet.
+ * @param {string} locale E.g., 'de', or 'zh-tw'
+ * @param {function(boolean)=} opt_callback Called once the locale is set, with
+ *     false if its message pack could not be loaded.
+ */
+Blockly.ScratchMsgs.loadLocale = function(locale, opt_callback) {
+  var callback = opt_callback || function() {};
+  if (Blockly.ScratchMsgs.packs_[locale]) {
+    Blockly.ScratchMsgs.applyPack_(locale);
+    callback(true);
+    return;
+  }
+  var pending = Blockly.ScratchMsgs.pendingLoads_;
+  if (pending[locale]) {
+    pending[locale].push(callback);
+    return;
+  }
+  pending[locale] = [callback];
+  var finish = function(loaded) {
+    var callbacks = pending[locale];
+    delete pending[locale];
+    if (loaded) {
+      Blockly.ScratchMsgs.applyPack_(locale);
+    } else {
+      console.warn('Could not load messages for locale: ' + locale);
+    }
+    for (var i = 0; i < callbacks.length; i++) {
+      callbacks[i](loaded);
+    }
+  };
+  var xhr = new XMLHttpRequest();
+  xhr.open('GET', Blockly.ScratchMsgs.packPath + locale + '.json');
+  xhr.onload = function() {
+    if (xhr.status != 200) {
+      finish(false);
+      return;
+    }
+    try {
+      Blockly.ScratchMsgs.packs_[locale] = JSON.parse(xhr.responseText);
+    } catch (e) {
+      finish(false);
+      return;
+    }
+    finish(true);
+  };
+  xhr.onerror = function() {
+    finish(false);
+  };
+  xhr.send();
+};
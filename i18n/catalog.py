@@ -0,0 +1,430 @@
+#!/usr/bin/python
+
+# In-memory model of the messages shared by the i18n scripts.
+#
+# Copyright 2026 openblock.cc.
+# https://github.com/sgologuzov/robopro-blocks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A catalog of the messages of a project and their translations.
+
+The catalog is read once from the files the i18n scripts exchange (the
+source language .json file, qqq.json, keys.json, synonyms.json,
+constants.json and one .json file per language) and can be written back to
+each of them, as well as to msg/js files, message packs and .xlf files.
+Every output is built in memory and written with a single call.
+"""
+
+import codecs
+import glob
+import json
+import os
+import sys
+from collections import OrderedDict
+from datetime import datetime
+from common import InputError
+from common import write_if_changed
+
+try:
+  _intern = intern
+except NameError:
+  _intern = sys.intern
+
+# Dictionaries keep insertion order from Python 3.7 on.
+ordered_dict = dict if sys.version_info >= (3, 7) else OrderedDict
+
+# Files of a json directory which do not hold a language.
+SPECIAL_FILES = ('keys', 'qqq', 'synonyms', 'constants')
+
+
+def intern_key(key):
+  """Return the single shared copy of a message key."""
+  try:
+    # Python 2 only interns byte strings; keys are ASCII.
+    return _intern(str(key))
+  except (TypeError, UnicodeError):
+    return key
+
+
+def _ordered_pairs(pairs):
+  return ordered_dict((intern_key(key), value) for (key, value) in pairs)
+
+
+def read_json(filename):
+  """Read a JSON file as UTF-8, keeping its key order.
+
+  Args:
+    filename: The filename, which must end ".json".
+
+  Returns:
+    A tuple of the @metadata entry (or None) and a dictionary of the other
+    entries, whose keys are interned.
+
+  Raises:
+    InputError: The filename did not end with ".json" or the file could not
+        be parsed.
+  """
+  if not filename.endswith('.json'):
+    raise InputError(filename, 'filenames must end with ".json"')
+  try:
+    with codecs.open(filename, 'r', 'utf-8') as infile:
+      defs = json.load(infile, object_pairs_hook=_ordered_pairs)
+  except ValueError as e:
+    print('Error reading ' + filename)
+    raise InputError(filename, str(e))
+  metadata = defs.pop('@metadata', None)
+  return (metadata, defs)
+
+
+def quote(value):
+  """Quote a string for JSON or JavaScript, leaving non-ASCII as is.
+
+  U+2028 and U+2029 are valid in JSON strings but end the line in
+  JavaScript before ES2019, so they are always escaped.
+  """
+  return (json.dumps(value, ensure_ascii=False)
+          .replace(u'\u2028', u'\\u2028').replace(u'\u2029', u'\\u2029'))
+
+
+def format_json(defs, indent='\t', metadata=None):
+  """Format a dictionary as the one-entry-per-line JSON files of msg/json.
+
+  Args:
+    defs: A dictionary mapping keys to strings, in the desired order.
+    indent: The indentation of each entry.
+    metadata: Lines of the @metadata entry, if any.
+
+  Returns:
+    The text of the file.
+  """
+  entries = []
+  if metadata:
+    entries.append(indent + '"@metadata": {\n' + ',\n'.join(
+        [indent * 2 + line for line in metadata]) + '\n' + indent + '}')
+  entries.extend([u'{0}"{1}": {2}'.format(indent, key, quote(defs[key]))
+                  for key in defs])
+  return u'{\n' + u',\n'.join(entries) + u'\n}\n'
+
+
+def format_xliff(source_lang, target_lang, targets):
+  """Format translations as a Soy message bundle.
+
+  Args:
+    source_lang: The ISO 639 language code of the source language.
+    target_lang: The ISO 639 language code of the translations.
+    targets: A list of (Closure key, translation) pairs.  Translations are
+        XLIFF markup already, so that their placeholders survive.
+
+  Returns:
+    The text of the .xlf file.
+  """
+  out = [u"""<?xml version="1.0" encoding="UTF-8"?>
+<xliff version="1.2" xmlns="urn:oasis:names:tc:xliff:document:1.2">
+  <file original="SoyMsgBundle"
+        datatype="x-soy-msg-bundle"
+        xml:space="preserve"
+        source-language="{0}"
+        target-language="{1}">
+    <body>""".format(source_lang, target_lang)]
+  for (identifier, target) in targets:
+    out.append(u"""
+      <trans-unit id="{0}" datatype="html">
+        <target>{1}</target>
+      </trans-unit>""".format(identifier, target))
+  out.append("""
+    </body>
+  </file>
+</xliff>
+""")
+  return u''.join(out)
+
+
+class Unit(object):
+  """A message of the source language."""
+  __slots__ = ('key', 'source', 'description', 'closure_key')
+
+  def __init__(self, key, source, description='', closure_key=None):
+    self.key = key
+    self.source = source
+    self.description = description
+    self.closure_key = closure_key
+
+
+class Catalog(object):
+  """The messages of the source language and their translations.
+
+  Attributes:
+    source_lang: ISO 639-1 code of the source language.
+    units: A dictionary mapping keys to Units, in definition order.
+    synonyms: A dictionary mapping synonym keys to the keys they stand for.
+    constants: A dictionary mapping the keys of constant (untranslated)
+        messages to their values.
+    translations: A dictionary mapping language codes to dictionaries of
+        translated messages.
+  """
+
+  def __init__(self, source_lang='en'):
+    self.source_lang = source_lang
+    self.units = ordered_dict()
+    self.synonyms = ordered_dict()
+    self.constants = ordered_dict()
+    self.translations = {}
+    self._sorted_keys = None
+    self._js_tail = None
+
+  def add(self, key, source, description='', closure_key=None):
+    """Add a message of the source language."""
+    key = intern_key(key)
+    self.units[key] = Unit(key, source, description, closure_key)
+    self._sorted_keys = None
+
+  @classmethod
+  def from_units(cls, units, source_lang='en'):
+    """Build a catalog from dictionaries with entries for 'meaning',
+    'source', 'description' and optionally 'key', the Closure key."""
+    catalog = cls(source_lang)
+    for unit in units:
+      catalog.add(unit['meaning'], unit['source'], unit['description'],
+                  unit.get('key'))
+    return catalog
+
+  @classmethod
+  def from_defs(cls, source_defs, synonym_defs=None, constant_defs=None,
+                source_lang='en'):
+    """Build a catalog from dictionaries of messages, synonyms and
+    constants."""
+    catalog = cls(source_lang)
+    for key in source_defs:
+      catalog.add(key, source_defs[key])
+    for (table, defs) in ((catalog.synonyms, synonym_defs),
+                          (catalog.constants, constant_defs)):
+      for key in defs or {}:
+        table[intern_key(key)] = defs[key]
+    return catalog
+
+  @classmethod
+  def load(cls, source_file, qqq_file=None, key_file=None, synonym_file=None,
+           constant_file=None):
+    """Read the source language and whichever companion files are given.
+
+    The source language is taken from the name of source_file.
+
+    Raises:
+      IOError: A file could not be read.
+      InputError: A file could not be parsed.
+    """
+    source_lang = os.path.basename(source_file)[:-len('.json')]
+    (_, source_defs) = read_json(source_file)
+    catalog = cls.from_defs(
+        source_defs,
+        read_json(synonym_file)[1] if synonym_file else None,
+        read_json(constant_file)[1] if constant_file else None,
+        source_lang)
+    for (filename, attr) in ((qqq_file, 'description'),
+                             (key_file, 'closure_key')):
+      if filename:
+        (_, defs) = read_json(filename)
+        for key in defs:
+          if key in catalog.units:
+            setattr(catalog.units[key], attr, defs[key])
+    return catalog
+
+  @classmethod
+  def load_dir(cls, json_dir, source_lang='en'):
+    """Read every file of a msg/json style directory.
+
+    Companion files which do not exist are skipped.
+    """
+    def path(name):
+      filename = os.path.join(json_dir, name + '.json')
+      return filename if os.path.isfile(filename) else None
+    catalog = cls.load(os.path.join(json_dir, source_lang + '.json'),
+                       qqq_file=path('qqq'), key_file=path('keys'),
+                       synonym_file=path('synonyms'),
+                       constant_file=path('constants'))
+    for filename in sorted(glob.glob(os.path.join(json_dir, '*.json'))):
+      lang = os.path.basename(filename)[:-len('.json')]
+      if lang not in SPECIAL_FILES and lang != source_lang:
+        catalog.load_translation(filename)
+    return catalog
+
+  def load_translation(self, filename):
+    """Read a <lang>.json file into the translations.
+
+    Returns:
+      The language code, taken from the filename.
+    """
+    lang = os.path.basename(filename)
+    lang = lang[:lang.index('.')]
+    self.translations[lang] = read_json(filename)[1]
+    return lang
+
+  @property
+  def sorted_keys(self):
+    """The keys of the source messages in the order msg/js files use."""
+    if self._sorted_keys is None:
+      self._sorted_keys = sorted(self.units)
+    return self._sorted_keys
+
+  def subset(self, keys):
+    """Return a catalog of only the given messages, synonyms and constants.
+
+    Translations are shared with this catalog; outputs skip their other keys.
+    """
+    catalog = Catalog(self.source_lang)
+    for (key, unit) in self.units.items():
+      if key in keys:
+        catalog.units[key] = unit
+    for (table, subset) in ((self.synonyms, catalog.synonyms),
+                            (self.constants, catalog.constants)):
+      for key in table:
+        if key in keys:
+          subset[key] = table[key]
+    catalog.translations = self.translations
+    return catalog
+
+  def source_defs(self):
+    """Return a dictionary mapping keys to source messages."""
+    return ordered_dict((key, unit.source)
+                        for (key, unit) in self.units.items())
+
+  def closure_keys(self):
+    """Return a dictionary mapping keys to Closure keys."""
+    return ordered_dict((key, unit.closure_key)
+                        for (key, unit) in self.units.items()
+                        if unit.closure_key is not None)
+
+  def to_lang_json(self, author):
+    """Format the source language file for translatewiki.net."""
+    return format_json(self.source_defs(), metadata=[
+        u'"author": {0}'.format(quote(author)),
+        u'"lastupdated": "{0}"'.format(datetime.now()),
+        u'"locale": "{0}"'.format(self.source_lang),
+        u'"messagedocumentation" : "qqq"'])
+
+  def to_qqq_json(self):
+    """Format qqq.json, the documentation of each message."""
+    return format_json(ordered_dict(
+        (key, unit.description.replace('{lb}', '{').replace('{rb}', '}'))
+        for (key, unit) in self.units.items()))
+
+  def to_keys_json(self):
+    """Format keys.json, mapping each message to its Closure key."""
+    return format_json(self.closure_keys(), indent='')
+
+  def to_js(self, lang, target_defs=None):
+    """Format the msg/js file of a language.
+
+    Args:
+      lang: The language code.
+      target_defs: The translations, if not those loaded for lang.  Source
+          messages are used, with a comment, for any missing translation.
+
+    Returns:
+      The text of the file.
+    """
+    if target_defs is None:
+      target_defs = self.translations.get(lang, {})
+    out = ["""// This file was automatically generated.  Do not modify.
+
+'use strict';
+
+goog.provide('Blockly.Msg.{0}');
+
+goog.require('Blockly.Msg');
+
+""".format(lang.replace('-', '.'))]
+    for key in self.sorted_keys:
+      if key in target_defs:
+        out.append(u'Blockly.Msg["{0}"] = {1};\n'.format(
+            key, quote(target_defs[key])))
+      else:
+        out.append(u'Blockly.Msg["{0}"] = {1};  // untranslated\n'.format(
+            key, quote(self.units[key].source)))
+    if self._js_tail is None:
+      self._js_tail = '\n'.join(
+          ['Blockly.Msg.{0} = Blockly.Msg.{1};'.format(key, self.synonyms[key])
+           for key in self.synonyms]) + '\n' + u''.join(
+          [u'\nBlockly.Msg["{0}"] = {1};'.format(key, quote(value))
+           for (key, value) in self.constants.items()])
+    out.append(self._js_tail)
+    return u''.join(out)
+
+  def to_delta_js(self, lang, target_defs=None):
+    """Format the msg/js file of a language as a delta: only the messages it
+    translates, applied by Blockly.Msg.applyDelta, which falls back to the
+    source language for the rest.  Synonyms are reassigned afterwards, and
+    constants come with the source language.
+
+    Returns:
+      A tuple of the text of the file and the number of messages translated.
+    """
+    if target_defs is None:
+      target_defs = self.translations.get(lang, {})
+    keys = [key for key in self.sorted_keys if key in target_defs]
+    out = ["""// This file was automatically generated.  Do not modify.
+
+'use strict';
+
+goog.provide('Blockly.Msg.{0}');
+
+goog.require('Blockly.Msg');
+
+Blockly.Msg.applyDelta({{""".format(lang.replace('-', '.'))]
+    out.append(u','.join([u'\n  "{0}": {1}'.format(key, quote(target_defs[key]))
+                          for key in keys]))
+    out.append('\n});\n')
+    if self.synonyms:
+      out.append('\n' + '\n'.join(
+          ['Blockly.Msg.{0} = Blockly.Msg.{1};'.format(key, self.synonyms[key])
+           for key in self.synonyms]) + '\n')
+    return (u''.join(out), len(keys))
+
+  def to_pack(self, lang, target_defs=None):
+    """Format the message pack of a language: one JSON object holding every
+    message, with synonyms resolved and constants included."""
+    if target_defs is None:
+      target_defs = self.translations.get(lang, {})
+    pack = {}
+    for (key, unit) in self.units.items():
+      pack[key] = target_defs.get(key, unit.source)
+    for key in self.synonyms:
+      if self.synonyms[key] in pack:
+        pack[key] = pack[self.synonyms[key]]
+    pack.update(self.constants)
+    return json.dumps(pack, ensure_ascii=False, separators=(',', ':'),
+                      sort_keys=True)
+
+  def write_files(self, output_dir, author, write_key_file=False,
+                  quiet=False):
+    """Write <lang>.json, qqq.json and optionally keys.json.
+
+    Args:
+      output_dir: Relative directory for output files.
+      author: Name and email address of contact for translators.
+      write_key_file: Whether to output a keys.json file.
+      quiet: Whether to not list the files written.
+
+    Raises:
+      IOError: An error occurred while writing a file.
+    """
+    outputs = [(self.source_lang, self.to_lang_json(author)),
+               ('qqq', self.to_qqq_json())]
+    if write_key_file:
+      outputs.append(('keys', self.to_keys_json()))
+    for (name, text) in outputs:
+      filename = os.path.join(os.curdir, output_dir, name + '.json')
+      write_if_changed(filename, text)
+      if not quiet:
+        print('Created file: ' + filename)
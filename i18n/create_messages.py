@@ -18,32 +18,413 @@
 # limitations under the License.
 
 import argparse
-import codecs
+import hashlib
+import json
+import multiprocessing
 import os
 import re
+import subprocess
 import sys
-from common import read_json_file
+from catalog import Catalog
+from catalog import SPECIAL_FILES
+from catalog import read_json
+from common import InputError
+from common import write_atomically
+from common import write_if_changed
+from prune_messages import dead_keys
+from prune_messages import default_keep_file
+from prune_messages import default_source_dirs
+from prune_messages import find_references
+from prune_messages import reachable_keys
+from prune_messages import read_keep_file
+from store import Store
+from store import load_catalog
 
 
 _NEWLINE_PATTERN = re.compile('[\n\r]')
 
+# Name of the file, in the output directory, recording the hash of the inputs
+# each language's .js file was last generated from.
+_MANIFEST_NAME = '.manifest.json'
+
+# The scripts whose code shapes the output files, next to this one.
+_CODE_FILES = ('create_messages.py', 'catalog.py', 'common.py',
+               'prune_messages.py', 'store.py')
+
+# Set in each worker process by _init_worker().
+_shared = None
+
+# The translation store each process reads from, opened by _open_store().
+_store = None
+
+# Node.js script printing, as JSON, the median milliseconds it takes to load
+# each pair of files named on the command line after the number of runs: a
+# .js message file, run against a stub Blockly.Msg, and the message pack which
+# replaces it, parsed and merged into Blockly.Msg.
+_LOAD_TIME_JS = """
+var fs = require('fs'), vm = require('vm');
+var runs = parseInt(process.argv[1], 10), files = process.argv.slice(2);
+function median(times) {
+  times.sort(function(a, b) { return a - b; });
+  return times[runs >> 1];
+}
+function time(f) {
+  var start = process.hrtime();
+  f();
+  var elapsed = process.hrtime(start);
+  return elapsed[0] * 1e3 + elapsed[1] / 1e6;
+}
+var result = [];
+for (var i = 0; i < files.length; i += 2) {
+  var js = fs.readFileSync(files[i], 'utf8');
+  var pack = fs.readFileSync(files[i + 1], 'utf8');
+  var jsTimes = [], packTimes = [];
+  for (var run = 0; run < runs; run++) {
+    var context = vm.createContext({
+      goog: {provide: function() {}, require: function() {}},
+      Blockly: {Msg: {}}
+    });
+    // A distinct comment defeats V8's compilation cache.
+    jsTimes.push(time(function() {
+      new vm.Script(js + '\\n//' + run).runInContext(context);
+    }));
+    var msg = {};
+    packTimes.push(time(function() {
+      Object.assign(msg, JSON.parse(pack));
+    }));
+  }
+  result.push([median(jsTimes), median(packTimes)]);
+}
+console.log(JSON.stringify(result));
+"""
+
 
 def string_is_ascii(s):
   try:
-    s.decode('ascii')
+    s.encode('ascii')
     return True
-  except UnicodeEncodeError:
+  except UnicodeError:
     return False
 
-def load_constants(filename):
-  """Read in constants file, which must be output in every language."""
-  constant_defs = read_json_file(filename);
-  constants_text = '\n'
-  for key in constant_defs:
-    value = constant_defs[key]
-    value = value.replace('"', '\\"')
-    constants_text += '\nBlockly.Msg["{0}"] = "{1}";'.format(key, value)
-  return constants_text
+
+def _hash_inputs(shared_digest, filename):
+  """Return a SHA-1 hex digest of the shared inputs and a language's file.
+
+  With a store, the language's digest in the store stands for its file.
+  """
+  digest = hashlib.sha1(shared_digest.encode('ascii'))
+  if _shared['store']:
+    target_lang = _language(filename)
+    lang_digest = _open_store().digest(target_lang)
+    if lang_digest is None:
+      raise InputError(target_lang, 'not in ' + _shared['store'])
+    digest.update(lang_digest.encode('ascii'))
+  else:
+    with open(filename, 'rb') as f:
+      digest.update(f.read())
+  return digest.hexdigest()
+
+
+def _read_manifest(filename):
+  try:
+    with open(filename) as f:
+      return json.load(f)
+  except (IOError, ValueError):
+    return {}
+
+
+def _write_manifest(filename, manifest):
+  write_atomically(filename, json.dumps(
+      manifest, indent=1, sort_keys=True).encode('utf-8'))
+
+
+def _init_worker(shared):
+  """Receive the data every language needs, once per worker process."""
+  global _shared
+  _shared = shared
+
+
+def _open_store():
+  """Return this process's connection to the translation store."""
+  global _store
+  if _store is None or _store.filename != _shared['store']:
+    _store = Store(_shared['store'])
+  return _store
+
+
+def _close_store():
+  global _store
+  if _store is not None:
+    _store.close()
+    _store = None
+
+
+def _language(arg_file):
+  """Return the language code of a <lang>.json file name."""
+  (_, filename) = os.path.split(arg_file)
+  return filename[:filename.index('.')] if '.' in filename else filename
+
+
+def _output_files(target_lang):
+  """Return the files generated for a language."""
+  outnames = []
+  if _shared['formats'] in ('js', 'both'):
+    outnames.append(os.path.join(
+        os.curdir, _shared['output_dir'], target_lang + '.js'))
+  if _shared['formats'] in ('pack', 'both'):
+    outnames.append(os.path.join(
+        os.curdir, _shared['pack_dir'], target_lang + '.json'))
+  return outnames
+
+
+def _write_language(arg_file):
+  """Write the .js file and/or the message pack for one language.
+
+  Args:
+    arg_file: Path to the language's .json file.
+
+  Returns:
+    A tuple of a list of (output file name, whether the file was written)
+    pairs and a list of messages to print.  A file is not written if its
+    content would be unchanged.
+  """
+  (_, filename) = os.path.split(arg_file)
+  target_lang = _language(arg_file)
+  catalog = _shared['catalog']
+  messages = []
+  if _shared['store']:
+    # A single indexed read of the language, instead of parsing its file.
+    target_defs = _open_store().language(target_lang)
+  else:
+    (_, target_defs) = read_json(os.path.join(os.curdir, arg_file))
+
+  # Verify that keys are 'ascii'
+  bad_keys = [key for key in target_defs if not string_is_ascii(key)]
+  if bad_keys:
+    messages.append(u'These keys in {0} contain non ascii characters: {1}'.format(
+        filename, ', '.join(bad_keys)))
+
+  # If there's a '\n' or '\r', remove it and print a warning.
+  for key, value in target_defs.items():
+    if _NEWLINE_PATTERN.search(value):
+      messages.append(u'WARNING: definition of {0} in {1} contained '
+                      'a newline character.'.
+                      format(key, arg_file))
+      target_defs[key] = _NEWLINE_PATTERN.sub(' ', value)
+
+  # Announce any keys defined only for target language.  Pruned keys are not
+  # extra.
+  if not _shared['quiet']:
+    source = _shared['unpruned'] or catalog
+    extra_keys = [key for key in target_defs if key not in source.units and
+                  key not in source.synonyms]
+    synonym_keys = [key for key in target_defs if key in source.synonyms]
+    if extra_keys:
+      messages.append(u'These extra keys appeared in {0}: {1}'.format(
+          filename, ', '.join(extra_keys)))
+    if synonym_keys:
+      messages.append(u'These synonym keys appeared in {0}: {1}'.format(
+          filename, ', '.join(synonym_keys)))
+
+  # The .js file outputs the target value of each key in the source language
+  # file if present; otherwise, the source language value with a warning
+  # comment.  The message pack holds the same messages as one JSON object.
+  unpruned = _shared['unpruned']
+  delta = _shared['delta'] and target_lang != catalog.source_lang
+  outputs = []
+  for outname in _output_files(target_lang):
+    text = _render(catalog, outname, target_lang, target_defs, delta)
+    outputs.append((outname, write_if_changed(outname, text)))
+    if _shared['quiet']:
+      continue
+    size = len(text.encode('utf-8'))
+    if unpruned is not None:
+      full_size = len(_render(unpruned, outname, target_lang, target_defs,
+                              delta).encode('utf-8'))
+      messages.append(u'Pruning saved {0} bytes ({1}%) in {2}.'.format(
+          full_size - size, (full_size - size) * 100 // max(1, full_size),
+          outname))
+    if delta and outname.endswith('.js'):
+      translated = len([key for key in catalog.units if key in target_defs])
+      full_size = len(catalog.to_js(target_lang, target_defs).encode('utf-8'))
+      messages.append(
+          u'{0}: {1} of {2} messages translated ({3}%), {4} bytes instead of '
+          '{5} ({6}% smaller).'.format(
+              target_lang, translated, len(catalog.units),
+              translated * 100 // max(1, len(catalog.units)), size, full_size,
+              (full_size - size) * 100 // max(1, full_size)))
+  return (outputs, messages)
+
+
+def _render(catalog, outname, target_lang, target_defs, delta):
+  """Return the text of an output file of a language."""
+  if not outname.endswith('.js'):
+    return catalog.to_pack(target_lang, target_defs)
+  if delta:
+    return catalog.to_delta_js(target_lang, target_defs)[0]
+  return catalog.to_js(target_lang, target_defs)
+
+
+def generate_language_files(files, catalog, output_dir, quiet=False,
+                            force=False, jobs=1, formats='js', pack_dir=None,
+                            store=None, unpruned=None, delta=False):
+  """Generate a .js file defining the messages of each language, and/or a
+  message pack: a JSON object of every message, which
+  Blockly.ScratchMsgs.loadLocale fetches and applies in one go.
+
+  Args:
+    files: Paths to the <lang>.json files to convert.  keys.json, qqq.json,
+        synonyms.json and constants.json are ignored.  With a store, these
+        name the languages to read from it.
+    catalog: A Catalog of the source language, which provides any values
+        missing in the target languages, and of the synonyms and constants
+        output in every language.
+    output_dir: Relative directory for output files.
+    quiet: Whether to not write anything to standard output.
+    force: Whether to regenerate languages whose inputs have not changed.
+    jobs: Number of languages to generate at once.
+    formats: 'js', 'pack' or 'both'.
+    pack_dir: Relative directory for message packs.
+    store: Path to a translation store written by store.py, to read the
+        languages from instead of their .json files.
+    unpruned: If catalog was pruned to the reachable keys, the full catalog,
+        to report the bytes pruning saves in each output.
+    delta: Whether the .js files of languages other than the source language
+        only hold their translations, falling back to the source language at
+        runtime through Blockly.Msg.applyDelta.
+
+  Returns:
+    A tuple of two lists of output files: those which were written and those
+    left as they were, because their content is up to date.
+
+  Raises:
+    InputError: A source definition contains a newline character.
+  """
+  if not output_dir.endswith(os.path.sep):
+    output_dir += os.path.sep
+  for directory in (output_dir, pack_dir if formats != 'js' else None):
+    if directory and not os.path.isdir(directory):
+      os.makedirs(directory)
+
+  # Make sure the source file doesn't contain a newline or carriage return.
+  source_defs = catalog.source_defs()
+  for key, value in source_defs.items():
+    if _NEWLINE_PATTERN.search(value):
+      raise InputError(key, 'source definition contains a newline character')
+
+  # A language only needs regenerating if its own .json file, one of the
+  # shared definitions or the code writing it changed since its .js file was
+  # written.
+  shared_digest = hashlib.sha1()
+  script_dir = os.path.dirname(os.path.abspath(__file__))
+  for name in _CODE_FILES:
+    with open(os.path.join(script_dir, name), 'rb') as f:
+      shared_digest.update(f.read())
+  shared_digest.update(json.dumps(
+      [source_defs, catalog.synonyms, catalog.constants, formats, delta],
+      sort_keys=True).encode('utf-8'))
+  shared_digest = shared_digest.hexdigest()
+  manifest_file = os.path.join(os.curdir, output_dir, _MANIFEST_NAME)
+  manifest = {} if force else _read_manifest(manifest_file)
+  shared = {
+    'catalog': catalog,
+    'output_dir': output_dir,
+    'pack_dir': pack_dir,
+    'formats': formats,
+    'quiet': quiet,
+    'store': store,
+    'unpruned': unpruned,
+    'delta': delta,
+  }
+  _init_worker(shared)
+  stale = []
+  unchanged = []
+  hashes = {}
+  for arg_file in files:
+    target_lang = _language(arg_file)
+    if target_lang not in SPECIAL_FILES:
+      hashes[target_lang] = _hash_inputs(shared_digest, arg_file)
+      outnames = _output_files(target_lang)
+      if (manifest.get(target_lang) == hashes[target_lang] and
+          all(os.path.isfile(outname) for outname in outnames)):
+        for outname in outnames:
+          if not quiet:
+            print('Unchanged {0}.'.format(outname))
+          unchanged.append(outname)
+      else:
+        stale.append(arg_file)
+
+  # Create each output file.
+  if jobs > 1 and len(stale) > 1:
+    # Workers open the store themselves; a connection must not cross a fork.
+    _close_store()
+    pool = multiprocessing.Pool(min(jobs, len(stale)), _init_worker,
+                                (shared,))
+    try:
+      results = pool.map(_write_language, stale)
+    finally:
+      pool.close()
+      pool.join()
+  else:
+    results = [_write_language(arg_file) for arg_file in stale]
+  _close_store()
+
+  written = []
+  for (arg_file, (outputs, messages)) in zip(stale, results):
+    for message in messages:
+      print(message)
+    for (outname, changed) in outputs:
+      if changed:
+        if not quiet:
+          print('Created {0}.'.format(outname))
+        written.append(outname)
+      else:
+        if not quiet:
+          print('Unchanged {0}.'.format(outname))
+        unchanged.append(outname)
+    manifest[_language(arg_file)] = hashes[_language(arg_file)]
+  _write_manifest(manifest_file, manifest)
+  return (written, unchanged)
+
+
+def pack_savings(outnames, runs=5):
+  """Compare the message packs among outnames with their .js files.
+
+  Args:
+    outnames: Output files of generate_language_files.
+    runs: Number of times to load each file when timing it.
+
+  Returns:
+    A dict of the total bytes of the .js files and the message packs
+    ('js_bytes', 'pack_bytes') and, if Node.js is available, the total
+    milliseconds it takes to load them ('js_ms', 'pack_ms').
+  """
+  pairs = []
+  packs = [outname for outname in outnames if outname.endswith('.json')]
+  for outname in outnames:
+    if outname.endswith('.js'):
+      target_lang = os.path.basename(outname)[:-len('.js')]
+      for pack in packs:
+        if os.path.basename(pack) == target_lang + '.json':
+          pairs.extend([outname, pack])
+  savings = {
+    'js_bytes': sum(os.path.getsize(js) for js in pairs[0::2]),
+    'pack_bytes': sum(os.path.getsize(pack) for pack in pairs[1::2]),
+  }
+  if not pairs:
+    return savings
+  try:
+    proc = subprocess.Popen(['node', '-e', _LOAD_TIME_JS, str(runs)] + pairs,
+                            stdout=subprocess.PIPE, shell=(os.name == 'nt'))
+  except OSError:
+    return savings
+  (stdout, _) = proc.communicate()
+  if not proc.returncode:
+    times = json.loads(stdout.decode('utf-8'))
+    savings['js_ms'] = sum(js_ms for (js_ms, _) in times)
+    savings['pack_ms'] = sum(pack_ms for (_, pack_ms) in times)
+  return savings
+
 
 def main():
   """Generate .js files defining Blockly core and language messages."""
@@ -63,102 +444,95 @@ def main():
                       help='Path to .json file with constant definitions')
   parser.add_argument('--output_dir', default='js/',
                       help='relative directory for output files')
-  parser.add_argument('--key_file', default='keys.json',
-                      help='relative path to input keys file')
+  parser.add_argument('--format', default='js',
+                      choices=['js', 'pack', 'both'],
+                      help='write .js files, JSON message packs or both')
+  parser.add_argument('--pack_dir', default='packs/',
+                      help='relative directory for message packs')
+  parser.add_argument('--store_file',
+                      help='read every language from this store, written by '
+                      'store.py, instead of the .json files')
   parser.add_argument('--quiet', action='store_true', default=False,
                       help='do not write anything to standard output')
-  parser.add_argument('files', nargs='+', help='input files')
+  parser.add_argument('--force', action='store_true', default=False,
+                      help='regenerate every language, even if its inputs '
+                      'have not changed')
+  parser.add_argument('--jobs', type=int, default=multiprocessing.cpu_count(),
+                      help='number of languages to generate at once')
+  parser.add_argument('--delta', action='store_true', default=False,
+                      help='only write translated messages to the .js files '
+                      'of other languages, which fall back to the source '
+                      'language at runtime')
+  parser.add_argument('--prune', action='store_true', default=False,
+                      help='only output the messages the code in '
+                      '--source_dirs references')
+  parser.add_argument('--source_dirs', nargs='+',
+                      help='directories of .js files to search for message '
+                      'references (default: ' +
+                      ', '.join(default_source_dirs()) + ')')
+  parser.add_argument('--keep_file', default=default_keep_file(),
+                      help='file listing keys, one per line, which --prune '
+                      'keeps even if no code references them (default: '
+                      '%(default)s)')
+  parser.add_argument('--keep', nargs='+', default=[], metavar='KEY',
+                      help='more keys for --prune to keep')
+  parser.add_argument('files', nargs='*',
+                      help='input files, or with --store_file the languages '
+                      'to generate (all by default)')
   args = parser.parse_args()
-  if not args.output_dir.endswith(os.path.sep):
-    args.output_dir += os.path.sep
 
-  # Read in source language .json file, which provides any values missing
-  # in target languages' .json files.
-  source_defs = read_json_file(os.path.join(os.curdir, args.source_lang_file))
-  # Make sure the source file doesn't contain a newline or carriage return.
-  for key, value in source_defs.items():
-    if _NEWLINE_PATTERN.search(value):
-      print('ERROR: definition of {0} in {1} contained a newline character.'.
-            format(key, args.source_lang_file))
-      sys.exit(1)
-  sorted_keys = source_defs.keys()
-  sorted_keys.sort()
+  # Read in the source language .json file, which provides any values missing
+  # in target languages' .json files, and the synonyms and constants, which
+  # must be output in every language.
+  if args.store_file:
+    with Store(args.store_file) as store:
+      catalog = load_catalog(store, args.source_lang)
+      files = args.files or store.languages()
+  elif args.files:
+    catalog = Catalog.load(
+        os.path.join(os.curdir, args.source_lang_file),
+        synonym_file=os.path.join(os.curdir, args.source_synonym_file),
+        constant_file=os.path.join(os.curdir, args.source_constants_file))
+    files = args.files
+  else:
+    parser.error('no input files')
 
-  # Read in synonyms file, which must be output in every language.
-  synonym_defs = read_json_file(os.path.join(
-      os.curdir, args.source_synonym_file))
-  synonym_text = '\n'.join(['Blockly.Msg.{0} = Blockly.Msg.{1};'.format(
-      key, synonym_defs[key]) for key in synonym_defs])
+  unpruned = None
+  if args.prune:
+    references = find_references(args.source_dirs or default_source_dirs())
+    references.update(args.keep)
+    if args.keep_file:
+      references.update(read_keep_file(args.keep_file))
+    keys = reachable_keys(catalog, references)
+    dead = dead_keys(catalog, keys)
+    if not args.quiet:
+      print('Pruned {0} of {1} keys: {2}'.format(
+          len(dead), len(dead) + len(keys), ', '.join(dead)))
+    (unpruned, catalog) = (catalog, catalog.subset(keys))
 
-  # Read in constants file, which must be output in every language.
-  constants_text = load_constants(os.path.join(os.curdir, args.source_constants_file))
-
-  # Create each output file.
-  for arg_file in args.files:
-    (_, filename) = os.path.split(arg_file)
-    target_lang = filename[:filename.index('.')]
-    if target_lang not in ('qqq', 'keys', 'synonyms', 'constants'):
-      target_defs = read_json_file(os.path.join(os.curdir, arg_file))
-
-      # Verify that keys are 'ascii'
-      bad_keys = [key for key in target_defs if not string_is_ascii(key)]
-      if bad_keys:
-        print(u'These keys in {0} contain non ascii characters: {1}'.format(
-            filename, ', '.join(bad_keys)))
-
-      # If there's a '\n' or '\r', remove it and print a warning.
-      for key, value in target_defs.items():
-        if _NEWLINE_PATTERN.search(value):
-          print(u'WARNING: definition of {0} in {1} contained '
-                'a newline character.'.
-                format(key, arg_file))
-          target_defs[key] = _NEWLINE_PATTERN.sub(' ', value)
-
-      # Output file.
-      outname = os.path.join(os.curdir, args.output_dir, target_lang + '.js')
-      with codecs.open(outname, 'w', 'utf-8') as outfile:
-        outfile.write(
-            """// This file was automatically generated.  Do not modify.
-
-'use strict';
-
-goog.provide('Blockly.Msg.{0}');
-
-goog.require('Blockly.Msg');
-
-""".format(target_lang.replace('-', '.')))
-        # For each key in the source language file, output the target value
-        # if present; otherwise, output the source language value with a
-        # warning comment.
-        for key in sorted_keys:
-          if key in target_defs:
-            value = target_defs[key]
-            comment = ''
-            del target_defs[key]
-          else:
-            value = source_defs[key]
-            comment = '  // untranslated'
-          value = value.replace('"', '\\"')
-          outfile.write(u'Blockly.Msg["{0}"] = "{1}";{2}\n'.format(
-              key, value, comment))
-
-        # Announce any keys defined only for target language.
-        if target_defs:
-          extra_keys = [key for key in target_defs if key not in synonym_defs]
-          synonym_keys = [key for key in target_defs if key in synonym_defs]
-          if not args.quiet:
-            if extra_keys:
-              print(u'These extra keys appeared in {0}: {1}'.format(
-                  filename, ', '.join(extra_keys)))
-            if synonym_keys:
-              print(u'These synonym keys appeared in {0}: {1}'.format(
-                  filename, ', '.join(synonym_keys)))
-
-        outfile.write(synonym_text)
-        outfile.write(constants_text)
-
-      if not args.quiet:
-        print('Created {0}.'.format(outname))
+  try:
+    (written, unchanged) = generate_language_files(
+        files, catalog, args.output_dir,
+        quiet=args.quiet, force=args.force, jobs=args.jobs,
+        formats=args.format, pack_dir=args.pack_dir, store=args.store_file,
+        unpruned=unpruned, delta=args.delta)
+  except InputError as e:
+    print('ERROR: {0} in {1}.'.format(e, args.source_lang_file))
+    sys.exit(1)
+  if not args.quiet:
+    print('{0} files changed, {1} unchanged.'.format(
+        len(written), len(unchanged)))
+  if args.format == 'both' and not args.quiet:
+    savings = pack_savings(written + unchanged)
+    report = 'Message packs: {0} bytes, {1}% smaller than the .js files.'.format(
+        savings['pack_bytes'],
+        100 - savings['pack_bytes'] * 100 // max(1, savings['js_bytes']))
+    if 'js_ms' in savings:
+      report += ' Loading: {0:.2f} ms, {1}% faster than {2:.2f} ms.'.format(
+          savings['pack_ms'],
+          100 - int(savings['pack_ms'] * 100 // max(savings['js_ms'], 1e-9)),
+          savings['js_ms'])
+    print(report)
 
 
 if __name__ == '__main__':
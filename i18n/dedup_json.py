@@ -22,9 +22,9 @@
 # limitations under the License.
 
 import argparse
-import codecs
-import json
-from common import InputError
+from catalog import format_json
+from catalog import read_json
+from common import write_if_changed
 
 
 def main():
@@ -48,25 +48,8 @@ def main():
   for filename in args.files:
     # Read in json using Python libraries.  This eliminates duplicates.
     print('Processing ' + filename + '...')
-    try:
-      with codecs.open(filename, 'r', 'utf-8') as infile:
-        j = json.load(infile)
-    except ValueError, e:
-      print('Error reading ' + filename)
-      raise InputError(file, str(e))
-
-    # Built up output strings as an array to make output of delimiters easier.
-    output = []
-    for key in j:
-      if key != '@metadata':
-        output.append('\t"' + key + '": "' +
-                      j[key].replace('\n', '\\n') + '"')
-
-    # Output results.
-    with codecs.open(filename + args.suffix, 'w', 'utf-8') as outfile:
-      outfile.write('{\n')
-      outfile.write(',\n'.join(output))
-      outfile.write('\n}\n')
+    (_, defs) = read_json(filename)
+    write_if_changed(filename + args.suffix, format_json(defs))
 
 
 if __name__ == '__main__':
@@ -45,23 +45,96 @@ import codecs
 import json
 import os
 import re
-from common import write_files
+from catalog import Catalog
+from common import write_if_changed
 
 
-_INPUT_DEF_PATTERN = re.compile("""Blockly.Msg.(\w*)\s*=\s*'(.*)';?\r?$""")
+_INPUT_DEF_PATTERN = re.compile(r"""Blockly.Msg.(\w*)\s*=\s*'(.*)';?\r?$""")
 
 _INPUT_SYN_PATTERN = re.compile(
-    """Blockly.Msg.(\w*)\s*=\s*Blockly.Msg.(\w*);""")
+    r"""Blockly.Msg.(\w*)\s*=\s*Blockly.Msg.(\w*);""")
 
 _CONSTANT_DESCRIPTION_PATTERN = re.compile(
     """{{Notranslate}}""", re.IGNORECASE)
 
+_DEFAULT_AUTHOR = 'Ellen Spertus <ellen.spertus@gmail.com>'
+
+
+def extract_messages(input_file):
+  """Read message definitions from a .js file.
+
+  Args:
+    input_file: Path to the .js file, such as msg/messages.js.
+
+  Returns:
+    A Catalog of the messages, in the order they were defined, with their
+    descriptions, synonyms and constant (untranslated) messages.
+  """
+  catalog = Catalog()
+  description = ''
+  with codecs.open(input_file, 'r', 'utf-8') as infile:
+    for line in infile:
+      if line.startswith('///'):
+        if description:
+          description = description + ' ' + line[3:].strip()
+        else:
+          description = line[3:].strip()
+      else:
+        match = _INPUT_DEF_PATTERN.match(line)
+        if match:
+          key = match.group(1)
+          value = match.group(2).replace("\\'", "'")
+          if not description:
+            print('Warning: No description for ' + key)
+          if (description and _CONSTANT_DESCRIPTION_PATTERN.search(description)):
+            catalog.constants[key] = value
+          else:
+            catalog.add(key, value, description)
+          description = ''
+        else:
+          match = _INPUT_SYN_PATTERN.match(line)
+          if match:
+            if description:
+              print('Warning: Description preceding definition of synonym {0}.'.
+                    format(match.group(1)))
+              description = ''
+            catalog.synonyms[match.group(1)] = match.group(2)
+  return catalog
+
+
+def write_messages(catalog, output_dir, author=_DEFAULT_AUTHOR, quiet=False):
+  """Write <lang>.json, qqq.json, synonyms.json and constants.json.
+
+  Args:
+    catalog: A Catalog as returned by extract_messages().
+    output_dir: Relative directory for output files.
+    author: Name and email address of contact for translators.
+    quiet: Whether to only display warnings, not routine info.
+
+  Raises:
+    IOError: An error occurred while writing a file.
+  """
+  if not output_dir.endswith(os.path.sep):
+    output_dir += os.path.sep
+
+  # Create <lang_file>.json and qqq.json.
+  catalog.write_files(output_dir, author, quiet=quiet)
+
+  # Create synonyms.json and constants.json.
+  for (name, table) in (('synonym', catalog.synonyms),
+                        ('constant', catalog.constants)):
+    file_name = os.path.join(os.curdir, output_dir, name + 's.json')
+    write_if_changed(file_name, json.dumps(table))
+    if not quiet:
+      print("Wrote {0} {1} pairs to {2}.".format(len(table), name, file_name))
+
+
 def main():
   # Set up argument parser.
   parser = argparse.ArgumentParser(description='Create translation files.')
   parser.add_argument(
       '--author',
-      default='Ellen Spertus <ellen.spertus@gmail.com>',
+      default=_DEFAULT_AUTHOR,
       help='name and email address of contact for translators')
   parser.add_argument('--lang', default='en',
                       help='ISO 639-1 source language code')
@@ -72,65 +145,11 @@ def main():
   parser.add_argument('--quiet', action='store_true', default=False,
                       help='only display warnings, not routine info')
   args = parser.parse_args()
-  if (not args.output_dir.endswith(os.path.sep)):
-    args.output_dir += os.path.sep
 
-  # Read and parse input file.
-  results = []
-  synonyms = {}
-  constants = {}  # Values that are constant across all languages.
-  description = ''
-  infile = codecs.open(args.input_file, 'r', 'utf-8')
-  for line in infile:
-    if line.startswith('///'):
-      if description:
-        description = description + ' ' + line[3:].strip()
-      else:
-        description = line[3:].strip()
-    else:
-      match = _INPUT_DEF_PATTERN.match(line)
-      if match:
-        key = match.group(1)
-        value = match.group(2).replace("\\'", "'")
-        if not description:
-          print('Warning: No description for ' + result['meaning'])
-        if (description and _CONSTANT_DESCRIPTION_PATTERN.search(description)):
-          constants[key] = value
-        else:
-          result = {}
-          result['meaning'] = key
-          result['source'] = value
-          result['description'] = description
-          results.append(result)
-        description = ''
-      else:
-        match = _INPUT_SYN_PATTERN.match(line)
-        if match:
-          if description:
-            print('Warning: Description preceding definition of synonym {0}.'.
-                  format(match.group(1)))
-            description = ''
-          synonyms[match.group(1)] = match.group(2)
-  infile.close()
-
-  # Create <lang_file>.json, keys.json, and qqq.json.
-  write_files(args.author, args.lang, args.output_dir, results, False)
-
-  # Create synonyms.json.
-  synonym_file_name = os.path.join(os.curdir, args.output_dir, 'synonyms.json')
-  with open(synonym_file_name, 'w') as outfile:
-    json.dump(synonyms, outfile)
-  if not args.quiet:
-    print("Wrote {0} synonym pairs to {1}.".format(
-        len(synonyms), synonym_file_name))
-
-  # Create constants.json
-  constants_file_name = os.path.join(os.curdir, args.output_dir, 'constants.json')
-  with open(constants_file_name, 'w') as outfile:
-    json.dump(constants, outfile)
-  if not args.quiet:
-    print("Wrote {0} constant pairs to {1}.".format(
-        len(constants), synonym_file_name))
+  catalog = extract_messages(args.input_file)
+  catalog.source_lang = args.lang
+  write_messages(catalog, args.output_dir, author=args.author,
+                 quiet=args.quiet)
 
 if __name__ == '__main__':
   main()
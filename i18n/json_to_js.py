@@ -20,60 +20,354 @@
 import argparse
 import codecs      # for codecs.open(..., 'utf-8')
 import glob
-import json        # for json.load()
 import os          # for os.path()
+import re
 import subprocess  # for subprocess.check_call()
+from catalog import format_xliff
+from catalog import read_json
 from common import InputError
-from common import read_json_file
+from common import write_if_changed
 
 
 # Store parsed command-line arguments in global variable.
 args = None
 
+# Literal blocks, whose text Soy leaves alone.
+_LITERAL_PATTERN = re.compile(r'\{literal\}(.*?)\{/literal\}', re.DOTALL)
 
-def _create_xlf(target_lang):
-    """Creates a <target_lang>.xlf file for Soy.
+# Soy comments: /* ... */ anywhere, // only after whitespace or at line start.
+# Literal blocks are matched first, so comments within them are kept.
+_COMMENT_PATTERN = re.compile(
+    r'(\{literal\}.*?\{/literal\})|/\*.*?\*/|(?:^|(?<=\s))//[^\n]*',
+    re.DOTALL | re.MULTILINE)
+
+# Top-level Soy commands of a template file.
+_NAMESPACE_PATTERN = re.compile(r'\{namespace\s+([\w.]+)([^}]*)\}')
+_TEMPLATE_PATTERN = re.compile(
+    r'\{template\s+\.(\w+)([^}]*)\}(.*?)\{/template\}', re.DOTALL)
+
+# Soy tags within a template body.
+_SOY_TAG_PATTERN = re.compile(r'\{[^{}]*\}')
+_ATTRIBUTE_PATTERN = re.compile(r'(\w+)\s*=\s*"([^"]*)"')
+
+# The attributes of {msg} which do not change the generated code.
+_MSG_ATTRIBUTES = ('meaning', 'desc')
+
+# Soy's special character commands.
+_SPECIAL_CHARS = {'{sp}': ' ', '{nil}': '', '{\\n}': '\n', '{\\r}': '\r',
+                  '{\\t}': '\t', '{lb}': '{', '{rb}': '}'}
+
+# Placeholder names Soy gives to common HTML tags within messages.
+_TAG_PLACEHOLDERS = {'a': 'LINK', 'b': 'BOLD', 'br': 'BREAK', 'em': 'EMPHASIS',
+                     'i': 'ITALIC', 'img': 'IMAGE', 'li': 'LIST_ITEM',
+                     'ol': 'ORDERED_LIST', 'p': 'PARAGRAPH',
+                     'ul': 'UNORDERED_LIST'}
+
+# A placeholder in a translation, as written into the .xlf files.
+_PLACEHOLDER_PATTERN = re.compile(r"""<x\s+id=["'](\w+)["']\s*/>""")
+_ENTITY_PATTERN = re.compile(r'&(#x[0-9a-fA-F]+|#[0-9]+|\w+);')
+_ENTITIES = {'amp': '&', 'lt': '<', 'gt': '>', 'quot': '"', 'apos': "'"}
+_JS_ESCAPES = {'\n': '\\n', '\r': '\\r', '\t': '\\t', '\b': '\\b',
+               '\f': '\\f', '\\': '\\\\', "'": "\\'", '"': '\\"'}
+
+
+class _Message(object):
+    """A {msg} block of a template.
+
+    Attributes:
+        meaning: The Blockly key of the message (e.g., Maze.turnLeft).
+        parts: The source text, as a list of strings and placeholder names.
+        placeholders: Dictionary mapping placeholder names to the HTML they
+            stand for.
+    """
+
+    def __init__(self, meaning, content, location):
+        self.meaning = meaning
+        self.parts = []
+        self.placeholders = {}
+        tags = {}  # Base placeholder name to the distinct tags using it.
+        pieces = re.split(r'(<[^>]*>)', content)
+        for (i, piece) in enumerate(pieces):
+            if i % 2 and piece:
+                base = self._base_name(piece)
+                if piece not in tags.setdefault(base, []):
+                    tags[base].append(piece)
+            elif '{' in piece or '}' in piece:
+                raise InputError(location, 'unsupported command in {msg}: '
+                                 + piece + ' (drop --native)')
+        names = {}
+        for (base, variants) in tags.items():
+            for (n, tag) in enumerate(variants):
+                name = base if len(variants) == 1 else '%s_%d' % (base, n + 1)
+                names[tag] = name
+                self.placeholders[name] = tag
+        for (i, piece) in enumerate(pieces):
+            if i % 2:
+                self.parts.append(_Placeholder(names[piece]))
+            elif piece:
+                self.parts.append(piece)
+
+    @staticmethod
+    def _base_name(tag):
+        """Returns the placeholder name Soy uses for an HTML tag."""
+        match = re.match(r'<(/?)([\w-]*)', tag)
+        tag_name = match.group(2).lower()
+        base = _TAG_PLACEHOLDERS.get(tag_name, tag_name.upper())
+        if match.group(1):
+            return 'END_' + base
+        if tag.endswith('/>'):
+            return base
+        return 'START_' + base
+
+    def render(self, target):
+        """Returns the text of the message in a language.
+
+        Args:
+            target: The translation as written into an .xlf file, or None to
+                use the source text.
+
+        Raises:
+            InputError: The translation names an unknown placeholder.
+        """
+        if target is None:
+            return ''.join([self.placeholders[part]
+                            if isinstance(part, _Placeholder) else part
+                            for part in self.parts])
+        pieces = _PLACEHOLDER_PATTERN.split(target)
+        for i in range(1, len(pieces), 2):
+            if pieces[i] not in self.placeholders:
+                raise InputError(self.meaning,
+                                 'unknown placeholder ' + pieces[i])
+            pieces[i] = self.placeholders[pieces[i]]
+        for i in range(0, len(pieces), 2):
+            pieces[i] = _ENTITY_PATTERN.sub(_unescape_entity, pieces[i])
+        return ''.join(pieces)
+
+
+class _Placeholder(str):
+    """The name of a placeholder within _Message.parts."""
+
+
+def _unescape_entity(match):
+    entity = match.group(1)
+    if entity.startswith('#x'):
+        return _unichr(int(entity[2:], 16))
+    if entity.startswith('#'):
+        return _unichr(int(entity[1:]))
+    return _ENTITIES.get(entity, match.group(0))
+
+
+def _unichr(code_point):
+    try:
+        return unichr(code_point)
+    except NameError:
+        return chr(code_point)
+
+
+def _join_lines(body):
+    """Applies Soy's line joining to the raw text of a template.
+
+    Each line is stripped.  Lines are joined with no space when the join is
+    next to an HTML or Soy tag, and with a single space otherwise.
+    """
+    result = ''
+    for line in body.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        if (result and not result.endswith(('>', '}'))
+                and not line.startswith(('<', '{'))):
+            result += ' '
+        result += line
+    return result
+
+
+def parse_templates(filename):
+    """Parses the message templates of a Soy file.
+
+    Only the subset of Soy found in message templates is understood: raw
+    text and HTML, {msg} blocks with meaning and desc attributes, {literal}
+    blocks and special characters.  Anything else, such as attributes of
+    {namespace} or {template}, which may change the escaping of the output,
+    is rejected rather than approximated.
 
     Args:
-        target_lang: The ISO 639 language code for the target language.
-            This is used in the name of the file and in the metadata.
+        filename: The name of the .soy file.
 
     Returns:
-        A pointer to a file to which the metadata has been written.
+        A (namespace, templates) tuple, where templates is a list of
+        (name, parts) tuples and parts holds strings and _Message objects.
 
     Raises:
-        IOError: An error occurred while opening or writing the file.
+        IOError: An error occurred while reading the file.
+        InputError: The file uses Soy commands outside that subset.
     """
-    filename = os.path.join(os.curdir, args.output_dir, target_lang + '.xlf')
-    out_file = codecs.open(filename, 'w', 'utf-8')
-    out_file.write("""<?xml version="1.0" encoding="UTF-8"?>
-<xliff version="1.2" xmlns="urn:oasis:names:tc:xliff:document:1.2">
-  <file original="SoyMsgBundle"
-        datatype="x-soy-msg-bundle"
-        xml:space="preserve"
-        source-language="{0}"
-        target-language="{1}">
-    <body>""".format(args.source_lang, target_lang))
-    return out_file
+    with codecs.open(filename, 'r', 'utf-8') as infile:
+        source = _COMMENT_PATTERN.sub(lambda match: match.group(1) or '',
+                                      infile.read())
+    namespace = _NAMESPACE_PATTERN.search(source)
+    if not namespace:
+        raise InputError(filename, 'no {namespace} found')
+    if namespace.group(2).strip():
+        raise InputError(filename, 'unsupported attributes of {namespace}: '
+                         + namespace.group(2).strip() + ' (drop --native)')
+    rest = _TEMPLATE_PATTERN.sub('', source.replace(namespace.group(0), ''))
+    if rest.strip():
+        raise InputError(filename, 'unsupported text outside templates: '
+                         + rest.strip().split('\n')[0] + ' (drop --native)')
+    templates = []
+    for (name, attributes, body) in _TEMPLATE_PATTERN.findall(source):
+        location = '%s:.%s' % (filename, name)
+        if attributes.strip():
+            raise InputError(location, 'unsupported attributes of {template}: '
+                             + attributes.strip() + ' (drop --native)')
+        # Line joining does not apply within literal blocks, which count as
+        # tags, so they are set aside until the lines are joined.
+        literals = _LITERAL_PATTERN.findall(body)
+        body = _join_lines(_LITERAL_PATTERN.sub(
+            lambda match: '{literal}', body))
+        parts = []
+        message = None
+        pos = 0
+        for match in _SOY_TAG_PATTERN.finditer(body):
+            text = body[pos:match.start()]
+            tag = match.group(0)
+            pos = match.end()
+            if '{' in text or '}' in text:
+                raise InputError(location, 'unsupported text: ' + text
+                                 + ' (drop --native)')
+            if message is not None:
+                if tag != '{/msg}':
+                    if tag not in _SPECIAL_CHARS:
+                        raise InputError(location, 'unsupported command in '
+                                         '{msg}: ' + tag + ' (drop --native)')
+                    message[1].append(text + _SPECIAL_CHARS[tag])
+                    continue
+                attributes = dict(_ATTRIBUTE_PATTERN.findall(message[0]))
+                if 'meaning' not in attributes:
+                    raise InputError(location, 'no meaning in ' + message[0])
+                for attribute in attributes:
+                    if attribute not in _MSG_ATTRIBUTES:
+                        raise InputError(location, 'unsupported attribute of '
+                                         '{msg}: ' + attribute
+                                         + ' (drop --native)')
+                parts.append(_Message(attributes['meaning'],
+                                      ''.join(message[1]) + text, location))
+                message = None
+            elif tag.startswith('{msg '):
+                parts.append(text)
+                message = (tag, [])
+            elif tag == '{literal}' and literals:
+                parts.append(text + literals.pop(0))
+            elif tag in _SPECIAL_CHARS:
+                parts.append(text + _SPECIAL_CHARS[tag])
+            else:
+                raise InputError(location, 'unsupported command: ' + tag
+                                 + ' (drop --native)')
+        if message is not None:
+            raise InputError(location, 'unterminated ' + message[0])
+        text = body[pos:]
+        if '{' in text or '}' in text:
+            raise InputError(location, 'unsupported text: ' + text
+                             + ' (drop --native)')
+        parts.append(text)
+        templates.append((name, [part for part in parts if part]))
+    return (namespace.group(1), templates)
 
 
-def _close_xlf(xlf_file):
-    """Closes a <target_lang>.xlf file created with create_xlf().
+def _js_string(text):
+    """Quotes text as a JavaScript string, escaping non-ASCII like Soy."""
+    out = []
+    for char in text:
+        if char in _JS_ESCAPES:
+            out.append(_JS_ESCAPES[char])
+        elif ord(char) < 0x20 or ord(char) >= 0x7F:
+            code = ord(char)
+            if code > 0xFFFF:
+                # Narrow Python 2 builds split these into surrogates already.
+                code -= 0x10000
+                out.append('\\u%04X\\u%04X' % (0xD800 + (code >> 10),
+                                                  0xDC00 + (code & 0x3FF)))
+            else:
+                out.append('\\u%04X' % code)
+        else:
+            out.append(char)
+    return "'" + ''.join(out) + "'"
 
-    This includes writing the terminating XML.
+
+def emit_js(template_file, namespace, templates, key_dict, translations):
+    """Generates the JavaScript Soy would for one language.
 
     Args:
-        xlf_file: A pointer to a file created by _create_xlf().
+        template_file: The name of the .soy file, for the header comment.
+        namespace: The namespace of the templates.
+        templates: The templates returned by parse_templates().
+        key_dict: Dictionary mapping Blockly keys (e.g., Maze.turnLeft) to
+            Closure keys (hash numbers).
+        translations: Dictionary mapping Closure keys to the translations,
+            as written into the .xlf files.  Messages without a translation
+            use the source text.
+
+    Returns:
+        The text of the <target_lang>.js file.
 
     Raises:
-        IOError: An error occurred while writing to or closing the file.
+        InputError: A translation names an unknown placeholder.
     """
-    xlf_file.write("""
-    </body>
-  </file>
-</xliff>
-""")
-    xlf_file.close()
+    lines = ['// This file was automatically generated from %s.'
+             % os.path.basename(template_file),
+             "// Please don't edit this file by hand.",
+             '']
+    names = namespace.split('.')
+    lines.append("if (typeof {0} == 'undefined') {{ var {0} = {{}}; }}"
+                 .format(names[0]))
+    for i in range(2, len(names) + 1):
+        lines.append("if (typeof {0} == 'undefined') {{ {0} = {{}}; }}"
+                     .format('.'.join(names[:i])))
+    for (name, parts) in templates:
+        text = ''.join([
+            part.render(translations.get(key_dict.get(part.meaning)))
+            if isinstance(part, _Message) else part for part in parts])
+        lines.extend([
+            '', '',
+            '%s.%s = function(opt_data, opt_ignored, opt_ijData) {'
+            % (namespace, name),
+            '  return %s;' % _js_string(text),
+            '};'])
+    return '\n'.join(lines) + '\n'
+
+
+def _read_translations(path_to_json, target_lang, key_dict):
+    """Reads the translations of the specified .json input file.
+
+    The name of the input file must be target_lang followed by '.json'.
+
+    Args:
+        path_to_json: Path to the directory of xx.json files.
+        target_lang: A IETF language code (RFC 4646), such as 'es' or 'pt-br'.
+        key_dict: Dictionary mapping Blockly keys (e.g., Maze.turnLeft) to
+            Closure keys (hash numbers).
+
+    Returns:
+        A dictionary mapping Closure keys to translations.
+
+    Raises:
+        IOError: An I/O error occurred with the input file.
+        InputError: Input JSON could not be parsed.
+        KeyError: Key found in input file but not in key file.
+    """
+    keyfile = os.path.join(path_to_json, target_lang + '.json')
+    (_, j) = read_json(keyfile)
+    translations = {}
+    for key in j:
+        try:
+            identifier = key_dict[key]
+        except KeyError as e:
+            print('Key "%s" is in %s but not in %s' %
+                  (key, keyfile, args.key_file))
+            raise e
+        translations[identifier] = j[key]
+    return translations
 
 
 def _process_file(path_to_json, target_lang, key_dict):
@@ -93,23 +387,11 @@ def _process_file(path_to_json, target_lang, key_dict):
         InputError: Input JSON could not be parsed.
         KeyError: Key found in input file but not in key file.
     """
-    keyfile = os.path.join(path_to_json, target_lang + '.json')
-    j = read_json_file(keyfile)
-    out_file = _create_xlf(target_lang)
-    for key in j:
-        if key != '@metadata':
-            try:
-                identifier = key_dict[key]
-            except KeyError, e:
-                print('Key "%s" is in %s but not in %s' %
-                      (key, keyfile, args.key_file))
-                raise e
-            target = j.get(key)
-            out_file.write(u"""
-      <trans-unit id="{0}" datatype="html">
-        <target>{1}</target>
-      </trans-unit>""".format(identifier, target))
-    _close_xlf(out_file)
+    translations = _read_translations(path_to_json, target_lang, key_dict)
+    filename = os.path.join(os.curdir, args.output_dir, target_lang + '.xlf')
+    with open(filename, 'wb') as out_file:
+        out_file.write(format_xliff(args.source_lang, target_lang,
+                                    translations.items()).encode('utf-8'))
 
 
 def main():
@@ -129,6 +411,11 @@ def main():
                         + '_soy',
                         help='relative path from working directory to '
                         'SoyToJsSrcCompiler.jar')
+    parser.add_argument('--native', dest='soy', action='store_false',
+                        help='emit the .js files directly instead of compiling '
+                        'with SoyToJsSrcCompiler.jar, which needs Java '
+                        '(experimental: not yet checked byte for byte against '
+                        'the jar\'s output)')
     parser.add_argument('files', nargs='+', help='input files')
 
     # Initialize global variables.
@@ -141,44 +428,66 @@ def main():
 
     # Read in keys.json, mapping descriptions (e.g., Maze.turnLeft) to
     # Closure keys (long hash numbers).
-    key_file = open(args.key_file)
-    key_dict = json.load(key_file)
-    key_file.close()
+    (_, key_dict) = read_json(args.key_file)
 
-    # Process each input file.
-    print('Creating .xlf files...')
-    processed_langs = []
     if len(args.files) == 1:
       # Windows does not expand globs automatically.
       args.files = glob.glob(args.files[0])
+    inputs = []
     for arg_file in args.files:
       (path_to_json, filename) = os.path.split(arg_file)
       if not filename.endswith('.json'):
         raise InputError(filename, 'filenames must end with ".json"')
       target_lang = filename[:filename.index('.')]
       if not target_lang in ('qqq', 'keys'):
-        processed_langs.append(target_lang)
-        _process_file(path_to_json, target_lang, key_dict)
+        inputs.append((path_to_json, target_lang))
+    if not inputs:
+      return
+    processed_lang_list = ','.join([lang for (_, lang) in inputs])
 
-    # Output command line for Closure compiler.
-    if processed_langs:
+    if args.soy:
+      _compile_with_soy(inputs, key_dict)
+    else:
+      # Parse the templates once and fill them in for every language.
+      (namespace, templates) = parse_templates(args.template)
       print('Creating .js files...')
-      processed_lang_list = ','.join(processed_langs)
-      subprocess.check_call([
-          'java',
-          '-jar', os.path.join(args.path_to_jar, 'SoyToJsSrcCompiler.jar'),
-          '--locales', processed_lang_list,
-          '--messageFilePathFormat', args.output_dir + '{LOCALE}.xlf',
-          '--outputPathFormat', args.output_dir + '{LOCALE}.js',
-          '--srcs', args.template])
-      if len(processed_langs) == 1:
-        print('Created ' + processed_lang_list + '.js in ' + args.output_dir)
-      else:
-        print('Created {' + processed_lang_list + '}.js in ' + args.output_dir)
-
-      for lang in processed_langs:
-        os.remove(args.output_dir + lang + '.xlf')
-      print('Removed .xlf files.')
+      for (path_to_json, target_lang) in inputs:
+        translations = _read_translations(path_to_json, target_lang, key_dict)
+        write_if_changed(args.output_dir + target_lang + '.js',
+                         emit_js(args.template, namespace, templates, key_dict,
+                                 translations))
+    if len(inputs) == 1:
+      print('Created ' + processed_lang_list + '.js in ' + args.output_dir)
+    else:
+      print('Created {' + processed_lang_list + '}.js in ' + args.output_dir)
+
+
+def _compile_with_soy(inputs, key_dict):
+    """Creates the .js files through .xlf files and SoyToJsSrcCompiler.jar.
+
+    Args:
+        inputs: List of (path_to_json, target_lang) tuples.
+        key_dict: Dictionary mapping Blockly keys (e.g., Maze.turnLeft) to
+            Closure keys (hash numbers).
+    """
+    print('Creating .xlf files...')
+    processed_langs = []
+    for (path_to_json, target_lang) in inputs:
+      processed_langs.append(target_lang)
+      _process_file(path_to_json, target_lang, key_dict)
+
+    print('Creating .js files...')
+    subprocess.check_call([
+        'java',
+        '-jar', os.path.join(args.path_to_jar, 'SoyToJsSrcCompiler.jar'),
+        '--locales', ','.join(processed_langs),
+        '--messageFilePathFormat', args.output_dir + '{LOCALE}.xlf',
+        '--outputPathFormat', args.output_dir + '{LOCALE}.js',
+        '--srcs', args.template])
+
+    for lang in processed_langs:
+      os.remove(args.output_dir + lang + '.xlf')
+    print('Removed .xlf files.')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,134 @@
+#!/usr/bin/python
+
+# Finds the Blockly.Msg keys the shipped code can reach.
+#
+# Copyright 2026 openblock.cc.
+# https://github.com/sgologuzov/robopro-blocks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Finds the messages referenced by the JavaScript sources.
+
+A key is reachable if the sources mention it in one of these forms:
+
+    Blockly.Msg.SOME_KEY
+    %{BKY_SOME_KEY}      (in block JSON and toolbox XML; any case)
+    'SOME_KEY'           (a string literal, as looked up by Blockly.Msg[key])
+
+The last form is deliberately generous, so keys looked up indirectly, such
+as those of goog.getMsg.blocklyMsgMap, are kept.  A synonym keeps the key
+it stands for.
+
+Keys only used outside this repository, such as those the Scratch GUI reads
+from Blockly.ScratchMsgs, are listed in KEEP_FILE.
+"""
+
+import codecs
+import os
+import re
+
+# The code shipped in the compressed files, relative to the repository.
+SOURCE_DIRS = ('core', 'blocks_vertical', 'blocks_common', 'generators')
+
+# The keys to keep whether or not SOURCE_DIRS reference them, next to this
+# script.
+KEEP_FILE = 'keep_keys.txt'
+
+_REFERENCE_PATTERN = re.compile(
+    r'Blockly\.Msg\.(\w+)'
+    r'|%\{[Bb][Kk][Yy]_(\w+)\}'
+    r'''|(['"])([A-Z][A-Z0-9_]*)\3''')
+
+
+def default_source_dirs():
+  """Return the paths of SOURCE_DIRS."""
+  root = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+  return [os.path.normpath(os.path.join(root, name)) for name in SOURCE_DIRS]
+
+
+def default_keep_file():
+  """Return the path of KEEP_FILE."""
+  return os.path.join(os.path.dirname(os.path.abspath(__file__)), KEEP_FILE)
+
+
+def read_keep_file(filename):
+  """Read a list of keys to keep, one per line.
+
+  Blank lines and everything after a '#' are ignored.
+
+  Args:
+    filename: The file to read.
+
+  Returns:
+    A set of the keys.
+  """
+  keys = set()
+  with codecs.open(filename, 'r', 'utf-8') as infile:
+    for line in infile:
+      key = line.split('#', 1)[0].strip()
+      if key:
+        keys.add(key)
+  return keys
+
+
+def find_references(paths):
+  """Collect the message keys referenced by .js files.
+
+  Args:
+    paths: Directories, searched recursively, and files.
+
+  Returns:
+    A set of the referenced keys.
+  """
+  filenames = []
+  for path in paths:
+    if os.path.isdir(path):
+      for (dirpath, _, names) in os.walk(path):
+        filenames.extend([os.path.join(dirpath, name) for name in names
+                          if name.endswith('.js')])
+    else:
+      filenames.append(path)
+  references = set()
+  for filename in filenames:
+    with codecs.open(filename, 'r', 'utf-8') as infile:
+      text = infile.read()
+    for (key, bky_key, _, literal) in _REFERENCE_PATTERN.findall(text):
+      references.add(key or bky_key.upper() or literal)
+  return references
+
+
+def reachable_keys(catalog, references):
+  """Return the keys of a catalog that references reach.
+
+  Args:
+    catalog: A Catalog of the source messages, synonyms and constants.
+    references: Keys as returned by find_references().
+
+  Returns:
+    A set of message, synonym and constant keys.
+  """
+  keys = set(key for key in references
+             if key in catalog.units or key in catalog.synonyms or
+             key in catalog.constants)
+  for key in list(keys):
+    # Synonyms may stand for other synonyms.
+    while key in catalog.synonyms and catalog.synonyms[key] not in keys:
+      key = catalog.synonyms[key]
+      keys.add(key)
+  return keys
+
+
+def dead_keys(catalog, keys):
+  """Return the keys of a catalog outside keys, in definition order."""
+  return [key for table in (catalog.units, catalog.synonyms, catalog.constants)
+          for key in table if key not in keys]
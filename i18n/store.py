@@ -0,0 +1,291 @@
+#!/usr/bin/python
+
+# Packs the msg/json files into a single indexed store, and back.
+#
+# Copyright 2026 openblock.cc.
+# https://github.com/sgologuzov/robopro-blocks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A packed store of every file of a msg/json directory.
+
+The store is an SQLite database.  Each key gets a numeric id, and each
+file (a language, or one of keys, qqq, synonyms and constants) holds its
+strings in a table indexed by (file, key), so a value, a range of keys or
+one language can be read without parsing anything else.  Readers map the
+database into memory.
+
+Importing a directory and exporting it again gives back the same entries,
+in the same order, with the same @metadata.
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+from catalog import Catalog
+from catalog import SPECIAL_FILES
+from catalog import format_json
+from catalog import intern_key
+from catalog import ordered_dict
+from catalog import read_json
+from common import InputError
+from common import write_if_changed
+
+# Bytes of the database to map into memory; more than any store needs.
+_MMAP_SIZE = 1 << 28
+
+_SCHEMA = """
+CREATE TABLE files (
+  id INTEGER PRIMARY KEY,
+  name TEXT UNIQUE NOT NULL,
+  metadata TEXT,
+  digest TEXT NOT NULL
+);
+CREATE TABLE keys (
+  id INTEGER PRIMARY KEY,
+  key TEXT UNIQUE NOT NULL
+);
+CREATE TABLE strings (
+  file INTEGER NOT NULL,
+  key INTEGER NOT NULL,
+  position INTEGER NOT NULL,
+  value TEXT NOT NULL,
+  PRIMARY KEY (file, key)
+) WITHOUT ROWID;
+CREATE UNIQUE INDEX strings_order ON strings (file, position);
+"""
+
+
+def write_store(filename, files):
+  """Write a store, replacing any existing one.
+
+  Args:
+    filename: The store to write.
+    files: A list of (name, metadata, defs) tuples: the name of the file
+        without ".json", its @metadata entry (or None) and a dictionary of
+        its other entries, in order.  Keys are numbered in the order they
+        first appear, so the source language should come first.
+
+  Raises:
+    InputError: A value is not a string.
+  """
+  tmp_filename = filename + '.tmp'
+  if os.path.exists(tmp_filename):
+    os.remove(tmp_filename)
+  db = sqlite3.connect(tmp_filename)
+  try:
+    db.executescript(_SCHEMA)
+    key_ids = {}
+    for (file_id, (name, metadata, defs)) in enumerate(files):
+      rows = []
+      for (position, key) in enumerate(defs):
+        value = defs[key]
+        if not isinstance(value, type(u'')):
+          raise InputError(name, 'value of {0} is not a string'.format(key))
+        if key not in key_ids:
+          key_ids[key] = len(key_ids)
+          db.execute('INSERT INTO keys VALUES (?, ?)', (key_ids[key], key))
+        rows.append((file_id, key_ids[key], position, value))
+      db.executemany('INSERT INTO strings VALUES (?, ?, ?, ?)', rows)
+      digest = hashlib.sha1(json.dumps(
+          [metadata, list(defs.items())]).encode('utf-8')).hexdigest()
+      db.execute('INSERT INTO files VALUES (?, ?, ?, ?)', (
+          file_id, name, None if metadata is None else json.dumps(metadata),
+          digest))
+    db.commit()
+  finally:
+    db.close()
+  if os.name == 'nt' and os.path.exists(filename):
+    os.remove(filename)
+  os.rename(tmp_filename, filename)
+
+
+def import_json(json_dir, filename, source_lang='en'):
+  """Pack every .json file of a directory into a store.
+
+  Returns:
+    The number of files packed.
+  """
+  names = [os.path.basename(path)[:-len('.json')]
+           for path in glob.glob(os.path.join(json_dir, '*.json'))]
+  # The source language and its companions first, then the rest by name.
+  names.sort(key=lambda name: (name != source_lang, name not in SPECIAL_FILES,
+                               name))
+  files = []
+  for name in names:
+    (metadata, defs) = read_json(os.path.join(json_dir, name + '.json'))
+    files.append((name, metadata, defs))
+  write_store(filename, files)
+  return len(files)
+
+
+def _format_file(name, metadata, defs):
+  """Format a file the way the i18n scripts write it."""
+  if name in ('synonyms', 'constants'):
+    return json.dumps(defs)
+  if name == 'keys':
+    return format_json(defs, indent='')
+  if metadata is not None:
+    metadata = [u'"{0}": {1}'.format(key, json.dumps(metadata[key],
+                                                     ensure_ascii=False))
+                for key in metadata]
+  return format_json(defs, metadata=metadata)
+
+
+def export_json(filename, json_dir):
+  """Write every file of a store back to a directory of .json files.
+
+  Returns:
+    A list of the files written; files already up to date are left alone.
+  """
+  if not os.path.isdir(json_dir):
+    os.makedirs(json_dir)
+  written = []
+  with Store(filename) as store:
+    for name in store.names():
+      outname = os.path.join(json_dir, name + '.json')
+      if write_if_changed(outname, _format_file(
+          name, store.metadata(name), store.language(name))):
+        written.append(outname)
+  return written
+
+
+def load_catalog(store, source_lang='en'):
+  """Build a Catalog of the source language and its companion files.
+
+  Args:
+    store: An open Store.
+    source_lang: The code of the source language.
+
+  Returns:
+    A Catalog without translations.
+  """
+  catalog = Catalog.from_defs(store.language(source_lang),
+                              store.language('synonyms'),
+                              store.language('constants'), source_lang)
+  for (name, attr) in (('qqq', 'description'), ('keys', 'closure_key')):
+    for (key, value) in store.items(name):
+      if key in catalog.units:
+        setattr(catalog.units[key], attr, value)
+  return catalog
+
+
+class Store(object):
+  """Read access to a store written by write_store()."""
+
+  def __init__(self, filename):
+    if not os.path.isfile(filename):
+      raise IOError('No such store: ' + filename)
+    self.filename = filename
+    self._db = sqlite3.connect(filename)
+    self._db.execute('PRAGMA query_only = ON')
+    self._db.execute('PRAGMA mmap_size = {0}'.format(_MMAP_SIZE))
+    self._files = {}
+    for row in self._db.execute('SELECT name, id, metadata, digest FROM files'):
+      self._files[row[0]] = row[1:]
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def close(self):
+    self._db.close()
+
+  def names(self):
+    """Return the names of the files in the store, in import order."""
+    return sorted(self._files, key=lambda name: self._files[name][0])
+
+  def languages(self):
+    """Return the language codes in the store."""
+    return [name for name in self.names() if name not in SPECIAL_FILES]
+
+  def metadata(self, name):
+    """Return the @metadata entry of a file, or None."""
+    metadata = self._files[name][1]
+    if metadata is None:
+      return None
+    return json.loads(metadata, object_pairs_hook=ordered_dict)
+
+  def digest(self, name):
+    """Return a SHA-1 hex digest of a file's entries, or None if the store
+    does not hold the file."""
+    return self._files[name][2] if name in self._files else None
+
+  def get(self, name, key, default=None):
+    """Look up one value of a file."""
+    if name not in self._files:
+      return default
+    row = self._db.execute(
+        'SELECT value FROM strings JOIN keys ON strings.key = keys.id '
+        'WHERE file = ? AND keys.key = ?',
+        (self._files[name][0], key)).fetchone()
+    return default if row is None else row[0]
+
+  def items(self, name):
+    """Return the (key, value) pairs of a file, in file order, or an empty
+    list if the store does not hold the file."""
+    if name not in self._files:
+      return []
+    return [(intern_key(key), value) for (key, value) in self._db.execute(
+        'SELECT keys.key, value FROM strings JOIN keys '
+        'ON strings.key = keys.id WHERE file = ? ORDER BY position',
+        (self._files[name][0],))]
+
+  def language(self, name):
+    """Return the entries of a file as a dictionary, in file order."""
+    return ordered_dict(self.items(name))
+
+  def range(self, name, first, last=None):
+    """Return the (key, value) pairs of a file whose keys sort between first
+    (inclusive) and last (exclusive, or the end if None), in key order."""
+    if name not in self._files:
+      return []
+    query = ('SELECT keys.key, value FROM keys JOIN strings '
+             'ON strings.key = keys.id WHERE file = ? AND keys.key >= ?')
+    params = [self._files[name][0], first]
+    if last is not None:
+      query += ' AND keys.key < ?'
+      params.append(last)
+    return [(intern_key(key), value) for (key, value) in
+            self._db.execute(query + ' ORDER BY keys.key', params)]
+
+
+def main():
+  """Packs a directory of .json files into a store, or exports it back."""
+  parser = argparse.ArgumentParser(
+      description='Pack translation files into a single indexed store.')
+  parser.add_argument('--json_dir', default='json',
+                      help='relative directory of the .json files')
+  parser.add_argument('--store_file', default='messages.db',
+                      help='relative path to the store')
+  parser.add_argument('--source_lang', default='en',
+                      help='ISO 639-1 source language code')
+  parser.add_argument('--export', action='store_true', default=False,
+                      help='write the .json files from the store instead')
+  args = parser.parse_args()
+
+  if args.export:
+    written = export_json(args.store_file, args.json_dir)
+    print('Wrote {0} files to {1}.'.format(len(written), args.json_dir))
+  else:
+    count = import_json(args.json_dir, args.store_file, args.source_lang)
+    print('Packed {0} files into {1}.'.format(count, args.store_file))
+
+
+if __name__ == '__main__':
+  main()
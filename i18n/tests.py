@@ -18,9 +18,46 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import catalog
 import common
+import create_messages
+import json
+import json_to_js
+import os
+import prune_messages
 import re
+import shutil
+import store
+import subprocess
+import sys
+import tempfile
 import unittest
+import xliff_to_json
+
+_XLIFF = u"""<?xml version="1.0" encoding="UTF-8"?>
+<xliff version="1.2" xmlns="urn:oasis:names:tc:xliff:document:1.2">
+  <file original="SoyMsgBundle" datatype="x-soy-msg" xml:space="preserve" source-language="en" target-language="vi">
+    <body>
+      <trans-unit id="1001" datatype="html">
+        <source>Turn <x id="DIRECTION"/> &amp; move "ahead" &lt;3</source>
+        <target>Quay <g id="b" ctype="bold">bên trái</g> &gt; đi</target>
+        <note priority="1" from="description">Turn &amp; move.</note>
+        <note priority="1" from="meaning">Maze.turn</note>
+      </trans-unit>
+      <trans-unit id="1002" datatype="html">
+        <source></source>
+        <note priority="1" from="description">ibid</note>
+        <note priority="1" from="meaning">Maze.turn</note>
+      </trans-unit>
+      <trans-unit id="1003" datatype="html">
+        <source>Repeat until <x id="GOAL" equiv-text="{$goal}"/></source>
+        <note priority="1" from="description">Loop label.</note>
+        <note priority="1" from="meaning">Maze.repeatUntil</note>
+      </trans-unit>
+    </body>
+  </file>
+</xliff>
+"""
 
 class TestSequenceFunctions(unittest.TestCase):
   def test_insert_breaks(self):
@@ -43,5 +80,426 @@ class TestSequenceFunctions(unittest.TestCase):
                        re.sub(spaces, '', output)))
 
 
+class TestXliffToJson(unittest.TestCase):
+  def setUp(self):
+    (fd, self.filename) = tempfile.mkstemp(suffix='.xlf')
+    os.close(fd)
+
+  def tearDown(self):
+    os.remove(self.filename)
+
+  def write_xliff(self, text):
+    with open(self.filename, 'wb') as f:
+      f.write(text.encode('utf-8'))
+
+  def test_stream_matches_dom(self):
+    self.write_xliff(_XLIFF)
+    expected = list(xliff_to_json._iter_dom_trans_units(self.filename))
+    self.assertEqual(3, len(expected))
+    self.assertEqual(
+        u'Turn <x id="DIRECTION"/> &amp; move &quot;ahead&quot; &lt;3',
+        expected[0]['source'])
+    # Small chunks split text, tags and multi-byte characters.
+    for chunk_size in [1, 7, 64 * 1024]:
+      units = list(xliff_to_json._iter_trans_units(self.filename, chunk_size))
+      self.assertEqual(expected, units)
+
+  def test_stream_rejects_second_target(self):
+    self.write_xliff(_XLIFF.replace(
+        u'<source></source>', u'<target>a</target><target>b</target>'))
+    with self.assertRaises(common.InputError) as context:
+      list(xliff_to_json._iter_trans_units(self.filename))
+    self.assertEqual('1002', context.exception.location)
+
+  def test_stream_rejects_malformed_file(self):
+    self.write_xliff(_XLIFF.replace(u'</body>', u''))
+    with self.assertRaises(common.InputError):
+      list(xliff_to_json._iter_trans_units(self.filename))
+
+  def test_sort_units(self):
+    templates = ' '.join([
+        '{msg meaning="Maze.b" desc="B"}b{/msg}',
+        '{msg meaning="Maze.a" desc="A"}a{/msg}',
+        '{msg meaning="Maze.b" desc="B again"}b{/msg}'])
+    units = [{'meaning': 'Maze.a'}, {'meaning': 'Maze.b'}]
+    self.assertEqual(['Maze.b', 'Maze.a'],
+                     [unit['meaning'] for unit in
+                      xliff_to_json.sort_units(units, templates)])
+
+  def test_sort_units_reports_every_missing_meaning(self):
+    units = [{'meaning': 'Maze.x'}, {'meaning': 'Maze.a'},
+             {'meaning': 'Maze.y'}]
+    with self.assertRaises(common.InputError) as context:
+      xliff_to_json.sort_units(units, '{msg meaning="Maze.a" desc="A"}a{/msg}')
+    self.assertTrue(context.exception.msg.endswith('Maze.x, Maze.y'))
+
+
+class TestCatalog(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_round_trip(self):
+    messages = catalog.Catalog()
+    messages.add('B', u'say "hi"\\', u'Greeting {lb}1{rb}.', '202')
+    messages.add('A', u'für', u'For.', '101')
+    messages.write_files(self.dir, 'A. Author', write_key_file=True)
+    with open(os.path.join(self.dir, 'de.json'), 'wb') as f:
+      f.write(json.dumps({'@metadata': {}, 'A': u'für'}).encode('utf-8'))
+    loaded = catalog.Catalog.load_dir(self.dir)
+    self.assertEqual(['B', 'A'], list(loaded.units))
+    self.assertEqual(u'say "hi"\\', loaded.units['B'].source)
+    self.assertEqual(u'Greeting {1}.', loaded.units['B'].description)
+    self.assertEqual({'B': '202', 'A': '101'}, dict(loaded.closure_keys()))
+    self.assertEqual({'de': {'A': u'für'}},
+                     dict((lang, dict(defs)) for (lang, defs) in
+                          loaded.translations.items()))
+    # Keys are shared between the tables.
+    self.assertIs(list(loaded.units)[1], list(loaded.translations['de'])[0])
+    js = loaded.to_js('de')
+    self.assertIn(u'Blockly.Msg["A"] = "für";\n', js)
+    self.assertIn(u'Blockly.Msg["B"] = "say \\"hi\\"\\\\";  // untranslated\n',
+                  js)
+
+  def test_line_separators(self):
+    self.assertEqual(u'"a\\u2028b\\u2029c\u00e4"',
+                     catalog.quote(u'a\u2028b\u2029c\u00e4'))
+    messages = catalog.Catalog()
+    messages.add('A', u'a\u2028b', u'Two lines.', '101')
+    self.assertIn(u'Blockly.Msg["A"] = "a\\u2028b";', messages.to_js('en'))
+
+  def test_write_files_quiet(self):
+    messages = catalog.Catalog()
+    messages.add('A', u'a', u'A.', '101')
+    written = []
+    class Recorder(object):
+      def write(self, text):
+        written.append(text)
+    stdout = sys.stdout
+    sys.stdout = Recorder()
+    try:
+      messages.write_files(self.dir, 'A. Author', quiet=True)
+    finally:
+      sys.stdout = stdout
+    self.assertEqual([], written)
+    # No temporary files are left behind.
+    self.assertEqual(['en.json', 'qqq.json'], sorted(os.listdir(self.dir)))
+
+
+class TestPruneMessages(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_reachable_keys(self):
+    os.mkdir(os.path.join(self.dir, 'blocks'))
+    with open(os.path.join(self.dir, 'blocks', 'a.js'), 'w') as f:
+      f.write('''Blockly.Blocks['a'] = {init: function() {
+  this.jsonInit({"message0": "%{bky_a} %{BKY_SYN}", "args0": []});
+  this.setTooltip(Blockly.Msg.B);
+}};
+goog.getMsg.blocklyMsgMap = {'Today': 'TODAY'};
+''')
+    with open(os.path.join(self.dir, 'b.txt'), 'w') as f:
+      f.write('Blockly.Msg.UNUSED')
+    references = prune_messages.find_references([self.dir])
+    self.assertTrue(set(['A', 'SYN', 'B', 'TODAY']) <= references)
+    messages = catalog.Catalog.from_defs(
+        {'A': 'a', 'B': 'b', 'C': 'c', 'TODAY': 'Today', 'UNUSED': 'u'},
+        {'SYN': 'C', 'OLD': 'A'}, {'K': 'k'})
+    keys = prune_messages.reachable_keys(messages, references)
+    self.assertEqual(set(['A', 'B', 'C', 'SYN', 'TODAY']), keys)
+    self.assertEqual(['UNUSED', 'OLD', 'K'],
+                     prune_messages.dead_keys(messages, keys))
+    pruned = messages.subset(keys)
+    self.assertEqual(['A', 'B', 'C', 'TODAY'], pruned.sorted_keys)
+    self.assertNotIn('UNUSED', pruned.to_pack('en'))
+
+
+class TestStore(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.json_dir = os.path.join(self.dir, 'json')
+    self.store_file = os.path.join(self.dir, 'messages.db')
+    messages = catalog.Catalog.from_defs(
+        {'B': u'b "1"', 'A': 'a', 'C': 'c'}, {'D': 'A'}, {'E': 'e'})
+    messages.units['A'].description = 'The letter A.'
+    os.mkdir(self.json_dir)
+    messages.write_files(self.json_dir, u'Zoë')
+    with open(os.path.join(self.json_dir, 'vi.json'), 'wb') as f:
+      f.write(u'{"@metadata": {"authors": ["X"]}, "C": "c\\u00e0", "A": "\\u00e1"}'
+              .encode('utf-8'))
+    for name in ('synonyms', 'constants'):
+      with open(os.path.join(self.json_dir, name + '.json'), 'w') as f:
+        f.write(json.dumps(getattr(messages, name)))
+    store.import_json(self.json_dir, self.store_file)
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_round_trip(self):
+    out_dir = os.path.join(self.dir, 'out')
+    self.assertEqual(5, len(store.export_json(self.store_file, out_dir)))
+    for name in ('en', 'qqq', 'synonyms', 'constants', 'vi'):
+      expected = catalog.read_json(os.path.join(self.json_dir, name + '.json'))
+      actual = catalog.read_json(os.path.join(out_dir, name + '.json'))
+      self.assertEqual(expected, actual)
+      # Entries keep their order.
+      self.assertEqual(list(expected[1]), list(actual[1]))
+
+  def test_lookups(self):
+    with store.Store(self.store_file) as messages:
+      self.assertEqual(['en', 'vi'], messages.languages())
+      self.assertEqual(u'c\u00e0', messages.get('vi', 'C'))
+      self.assertEqual(None, messages.get('vi', 'B'))
+      self.assertEqual([('A', u'\u00e1'), ('C', u'c\u00e0')],
+                       messages.range('vi', 'A'))
+      self.assertEqual([('B', u'b "1"')], messages.range('en', 'B', 'C'))
+      self.assertEqual(['C', 'A'], list(messages.language('vi')))
+      self.assertEqual(['X'], messages.metadata('vi')['authors'])
+      self.assertEqual('The letter A.',
+                       store.load_catalog(messages).units['A'].description)
+
+  def test_create_messages(self):
+    outputs = []
+    for (files, source) in (([os.path.join(self.json_dir, 'vi.json')], None),
+                            (['vi'], self.store_file)):
+      output_dir = os.path.join(self.dir, 'js%d' % len(outputs))
+      create_messages.generate_language_files(
+          files, catalog.Catalog.load_dir(self.json_dir), output_dir,
+          quiet=True, store=source)
+      with open(os.path.join(output_dir, 'vi.js'), 'rb') as f:
+        outputs.append(f.read())
+    self.assertEqual(outputs[0], outputs[1])
+
+
+class TestCreateMessages(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_pack_matches_js(self):
+    filename = os.path.join(self.dir, 'de.json')
+    with open(filename, 'wb') as f:
+      f.write(json.dumps({'@metadata': {}, 'A': u'für "a"'}).encode('utf-8'))
+    messages = catalog.Catalog.from_defs({'A': 'a', 'B': 'b'}, {'C': 'A'},
+                                         {'D': 'd'})
+    (written, unchanged) = create_messages.generate_language_files(
+        [filename], messages, os.path.join(self.dir, 'js'), quiet=True,
+        formats='both',
+        pack_dir=os.path.join(self.dir, 'packs'))
+    self.assertEqual(2, len(written))
+    self.assertEqual([], unchanged)
+    with open(os.path.join(self.dir, 'packs', 'de.json'), 'rb') as f:
+      pack = json.loads(f.read().decode('utf-8'))
+    # Untranslated messages fall back to the source, synonyms are resolved.
+    self.assertEqual({'A': u'für "a"', 'B': 'b', 'C': u'für "a"', 'D': 'd'},
+                     pack)
+    with open(os.path.join(self.dir, 'js', 'de.js'), 'rb') as f:
+      self.assertIn(u'Blockly.Msg["A"] = "für \\"a\\"";',
+                    f.read().decode('utf-8'))
+
+  def test_prune_keeps_listed_keys(self):
+    os.mkdir(os.path.join(self.dir, 'json'))
+    for (name, defs) in (('en', {'@metadata': {}, 'A': 'a', 'B': 'b',
+                                 'C': 'c', 'D': 'd'}),
+                         ('de', {'@metadata': {}, 'B': u'bä'}),
+                         ('synonyms', {}), ('constants', {})):
+      with open(os.path.join(self.dir, 'json', name + '.json'), 'wb') as f:
+        f.write(json.dumps(defs).encode('utf-8'))
+    os.mkdir(os.path.join(self.dir, 'src'))
+    with open(os.path.join(self.dir, 'src', 'a.js'), 'w') as f:
+      f.write('Blockly.Msg.A;')
+    with open(os.path.join(self.dir, 'keep'), 'w') as f:
+      f.write('# Used elsewhere.\nB  # here too\n\n')
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'create_messages.py')
+    subprocess.check_call([
+        sys.executable, script, '--prune', '--quiet', '--jobs', '1',
+        '--source_dirs', 'src', '--keep_file', 'keep', '--keep', 'C',
+        '--', os.path.join('json', 'de.json')], cwd=self.dir)
+    with open(os.path.join(self.dir, 'js', 'de.js'), 'rb') as f:
+      js = f.read().decode('utf-8')
+    self.assertIn(u'Blockly.Msg["A"] = "a";', js)
+    self.assertIn(u'Blockly.Msg["B"] = "bä";', js)
+    self.assertIn(u'Blockly.Msg["C"] = "c";', js)
+    self.assertNotIn(u'Blockly.Msg["D"]', js)
+
+  def test_shipped_keep_file(self):
+    i18n_dir = os.path.dirname(os.path.abspath(__file__))
+    keys = prune_messages.read_keep_file(prune_messages.default_keep_file())
+    self.assertIn('LOOKS_HELLO', keys)
+    # Every key kept is still defined.
+    (_, source_defs) = catalog.read_json(
+        os.path.join(i18n_dir, os.pardir, 'msg', 'json', 'en.json'))
+    self.assertEqual(set(), keys - set(source_defs))
+
+  def test_interrupted_manifest_write(self):
+    filename = os.path.join(self.dir, '.manifest.json')
+    create_messages._write_manifest(filename, {'de.js': 'a'})
+
+    def interrupted(src, dst):
+      raise OSError('interrupted')
+
+    replace_file = common.replace_file
+    common.replace_file = interrupted
+    try:
+      self.assertRaises(OSError, create_messages._write_manifest, filename,
+                        {'de.js': 'b'})
+    finally:
+      common.replace_file = replace_file
+    # The old manifest is intact and no temporary file is left behind.
+    self.assertEqual({'de.js': 'a'}, create_messages._read_manifest(filename))
+    self.assertEqual(['.manifest.json'], os.listdir(self.dir))
+
+  def test_digest_covers_code(self):
+    # Every script create_messages.py takes code from shapes its output.
+    script_dir = os.path.dirname(os.path.abspath(create_messages.__file__))
+    for value in vars(create_messages).values():
+      module = sys.modules.get(getattr(value, '__module__', None))
+      filename = getattr(module, '__file__', None)
+      if filename and os.path.dirname(os.path.abspath(filename)) == script_dir:
+        self.assertIn(os.path.splitext(os.path.basename(filename))[0] + '.py',
+                      create_messages._CODE_FILES)
+
+  def test_delta(self):
+    for (lang, defs) in (('en', {'A': 'a', 'B': 'b'}), ('de', {'A': u'ä'})):
+      with open(os.path.join(self.dir, lang + '.json'), 'wb') as f:
+        f.write(json.dumps(defs).encode('utf-8'))
+    messages = catalog.Catalog.from_defs({'A': 'a', 'B': 'b'}, {'C': 'A'},
+                                         {'D': 'd'})
+    create_messages.generate_language_files(
+        [os.path.join(self.dir, 'de.json'), os.path.join(self.dir, 'en.json')],
+        messages, self.dir, quiet=True, delta=True)
+    with open(os.path.join(self.dir, 'de.js'), 'rb') as f:
+      text = f.read().decode('utf-8')
+    # Only the translation; the rest comes from the source language.
+    self.assertIn(u'Blockly.Msg.applyDelta({\n  "A": "ä"\n});', text)
+    self.assertNotIn('"B"', text)
+    self.assertNotIn('Blockly.Msg["D"]', text)
+    self.assertIn('Blockly.Msg.C = Blockly.Msg.A;', text)
+    with open(os.path.join(self.dir, 'en.js'), 'rb') as f:
+      text = f.read().decode('utf-8')
+    self.assertNotIn('applyDelta', text)
+    self.assertIn('Blockly.Msg["B"] = "b";', text)
+
+
+# A template covering what json_to_js.emit_js supports, and one translation of
+# it, to compare emit_js against SoyToJsSrcCompiler.jar with.
+_TESTDATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'testdata')
+
+# The directory of SoyToJsSrcCompiler.jar and SoyMsgExtractor.jar.
+_SOY_JAR = os.environ.get('SOY_JAR')
+
+_SOY = u"""{namespace Maze.soy}
+
+/**
+ * Messages, hidden from view.
+ */
+{template .messages}
+  <div style="display: none">
+    // Not shown.
+    <span id="turn">{msg meaning="Maze.turn" desc="Turn."}
+      Turn <b>left</b> or <a href="#r">right</a>{sp}&amp; <a href="#m">move</a>
+    {/msg}</span>
+    <span id="again">{msg meaning="Maze.again" desc="Again."}Again{/msg}</span>
+  </div>
+{/template}
+"""
+
+class TestJsonToJs(unittest.TestCase):
+  def setUp(self):
+    (fd, self.filename) = tempfile.mkstemp(suffix='.soy')
+    os.close(fd)
+    with open(self.filename, 'wb') as f:
+      f.write(_SOY.encode('utf-8'))
+
+  def tearDown(self):
+    os.remove(self.filename)
+
+  def test_emit_js(self):
+    (namespace, templates) = json_to_js.parse_templates(self.filename)
+    self.assertEqual('Maze.soy', namespace)
+    keys = {'Maze.turn': '101', 'Maze.again': '102'}
+    translation = (u"<x id='START_LINK_2'/>Đi<x id='END_LINK'/> &amp; quay "
+                   u"<x id='START_BOLD'/>trái<x id='END_BOLD'/> "
+                   u"<x id='START_LINK_1'/>'phải'<x id='END_LINK'/>")
+    js = json_to_js.emit_js(self.filename, namespace, templates, keys,
+                            {'101': translation})
+    self.assertEqual(u'''// This file was automatically generated from %s.
+// Please don't edit this file by hand.
+
+if (typeof Maze == 'undefined') { var Maze = {}; }
+if (typeof Maze.soy == 'undefined') { Maze.soy = {}; }
+
+
+Maze.soy.messages = function(opt_data, opt_ignored, opt_ijData) {
+  return '<div style=\\"display: none\\"><span id=\\"turn\\">\
+<a href=\\"#m\\">\\u0110i</a> & quay <b>tr\\u00E1i</b> \
+<a href=\\"#r\\">\\'ph\\u1EA3i\\'</a></span>\
+<span id=\\"again\\">Again</span></div>';
+};
+''' % os.path.basename(self.filename), js)
+    # Without a translation, the source text is used.
+    js = json_to_js.emit_js(self.filename, namespace, templates, keys, {})
+    self.assertIn(u'Turn <b>left</b> or <a href=\\"#r\\">right</a> &amp; '
+                  u'<a href=\\"#m\\">move</a></span>', js)
+
+  @unittest.skipUnless(_SOY_JAR, 'set SOY_JAR to the directory of '
+                       'SoyToJsSrcCompiler.jar to compare against it')
+  def test_matches_soy(self):
+    template = os.path.join(_TESTDATA, 'template.soy')
+    tmp_dir = tempfile.mkdtemp()
+    try:
+      extracted = os.path.join(tmp_dir, 'extracted_msgs.xlf')
+      subprocess.check_call([
+          'java', '-jar', os.path.join(_SOY_JAR, 'SoyMsgExtractor.jar'),
+          '--outputFile', extracted, '--srcs', template])
+      keys = dict((unit['meaning'], unit['key']) for unit in
+                  xliff_to_json._iter_trans_units(extracted))
+      (_, translations) = catalog.read_json(os.path.join(_TESTDATA, 'de.json'))
+      translations = dict((keys[meaning], translations[meaning])
+                          for meaning in translations)
+      with open(os.path.join(tmp_dir, 'de.xlf'), 'wb') as f:
+        f.write(catalog.format_xliff(
+            'en', 'de', sorted(translations.items())).encode('utf-8'))
+      subprocess.check_call([
+          'java', '-jar', os.path.join(_SOY_JAR, 'SoyToJsSrcCompiler.jar'),
+          '--locales', 'de',
+          '--messageFilePathFormat', os.path.join(tmp_dir, '{LOCALE}.xlf'),
+          '--outputPathFormat', os.path.join(tmp_dir, '{LOCALE}.js'),
+          '--srcs', template])
+      (namespace, templates) = json_to_js.parse_templates(template)
+      with open(os.path.join(tmp_dir, 'de.js'), 'rb') as f:
+        self.assertEqual(f.read().decode('utf-8'), json_to_js.emit_js(
+            template, namespace, templates, keys, translations))
+    finally:
+      shutil.rmtree(tmp_dir)
+
+  def test_unsupported_command(self):
+    with open(self.filename, 'wb') as f:
+      f.write(_SOY.replace(u'Again{/msg}', u'{/msg}{$again}').encode('utf-8'))
+    with self.assertRaises(common.InputError):
+      json_to_js.parse_templates(self.filename)
+
+  def test_unsupported_attributes(self):
+    for (old, new) in [
+        (u'{namespace Maze.soy}', u'{namespace Maze.soy autoescape="false"}'),
+        (u'{template .messages}', u'{template .messages kind="text"}'),
+        (u'desc="Again."', u'desc="Again." genders="$g"'),
+        (u'{/template}', u'{/template}\n{delpackage Maze}'),
+        (u'Again{/msg}', u'Again{/msg}{{sp}}')]:
+      with open(self.filename, 'wb') as f:
+        f.write(_SOY.replace(old, new).encode('utf-8'))
+      with self.assertRaises(common.InputError):
+        json_to_js.parse_templates(self.filename)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -22,13 +22,18 @@ import os
 import re
 import subprocess
 import sys
+import xml.sax
+import xml.sax.handler
 from xml.dom import minidom
+from catalog import Catalog
 from common import InputError
-from common import write_files
 
 # Global variables
 args = None  # Parsed command-line arguments.
 
+# A msg definition in a Soy template, capturing its meaning.
+_MEANING_PATTERN = re.compile(r'\smeaning\s*=\s*"([^"]*)"(?=\s)')
+
 
 def _parse_trans_unit(trans_unit):
     """Converts a trans-unit XML node into a more convenient dictionary format.
@@ -65,7 +70,7 @@ def _parse_trans_unit(trans_unit):
     try:
         result['source'] = get_value('source')
         result['target'] = get_value('target')
-    except InputError, e:
+    except InputError as e:
         raise InputError(key, e.msg)
 
     # Get notes, using the from value as key and the data as value.
@@ -80,7 +85,187 @@ def _parse_trans_unit(trans_unit):
     return result
 
 
-def _process_file(filename):
+def _escape(data):
+    """Escapes text the way minidom's toxml() does."""
+    return (data.replace('&', '&amp;').replace('<', '&lt;')
+            .replace('"', '&quot;').replace('>', '&gt;'))
+
+
+class _TransUnitHandler(xml.sax.handler.ContentHandler):
+    """SAX handler building the same dictionaries as _parse_trans_unit().
+
+    Only the trans-unit being parsed is held in memory.  Each completed
+    unit is appended to the units list, which the caller should empty as
+    it consumes them.
+    """
+
+    def __init__(self):
+        xml.sax.handler.ContentHandler.__init__(self)
+        self.units = []
+        self._unit = None       # Dictionary for the current trans-unit.
+        self._depth = 0         # Element depth within the current trans-unit.
+        self._values = None     # Number of source and target elements.
+        self._capture = None    # Fragments of the source or target value.
+        self._capture_depth = 0
+        self._open = []         # Whether each captured element has children.
+        self._note = None       # [from, depth, child count, text] of a note.
+        self._error = None      # First note that could not be extracted.
+
+    def startElement(self, name, attrs):
+        if self._unit is None:
+            if name == 'trans-unit':
+                key = attrs.get('id', '')
+                if not key:
+                    raise InputError('', 'id attribute not found')
+                self._unit = {'key': key, 'source': None, 'target': None}
+                self._depth = 0
+                self._values = {'source': 0, 'target': 0}
+                self._error = None
+            return
+        self._depth += 1
+        if self._note and self._depth == self._note[1] + 1:
+            self._note[2] += 1
+            self._note[3] = None
+        if self._capture is not None:
+            self._start_child()
+            # minidom writes attributes sorted by name before Python 3.8.
+            names = list(attrs.getNames())
+            if sys.version_info < (3, 8):
+                names.sort()
+            self._capture.append('<' + name + ''.join(
+                [u' {0}="{1}"'.format(attr, _escape(attrs.getValue(attr)))
+                 for attr in names]))
+            self._open.append(False)
+        elif name in self._values:
+            self._values[name] += 1
+            if self._values[name] == 1:
+                self._capture = []
+                self._capture_depth = self._depth
+                self._open = []
+        if name == 'note' and self._note is None:
+            self._note = [attrs.get('from', ''), self._depth, 0, None]
+
+    def endElement(self, name):
+        if self._unit is None:
+            return
+        if self._depth == 0:
+            self._end_unit()
+            return
+        if self._capture is not None:
+            if self._depth == self._capture_depth:
+                self._unit[name] = ''.join(self._capture)
+                self._capture = None
+            elif self._open.pop():
+                self._capture.append('</' + name + '>')
+            else:
+                self._capture.append('/>')
+        if self._note and self._depth == self._note[1]:
+            (from_value, _, children, text) = self._note
+            if from_value and children == 1 and text is not None:
+                self._unit[from_value] = text
+            elif self._error is None:
+                self._error = from_value
+            self._note = None
+        self._depth -= 1
+
+    def characters(self, content):
+        if self._unit is None:
+            return
+        if self._capture is not None:
+            if self._depth > self._capture_depth:
+                self._start_child()
+            self._capture.append(_escape(content))
+        if self._note and self._depth == self._note[1]:
+            # Adjacent text is a single node, however the parser splits it.
+            if self._note[3] is None:
+                self._note[2] += 1
+                self._note[3] = content
+            else:
+                self._note[3] += content
+
+    def _start_child(self):
+        """Closes the start tag of the innermost captured element if needed."""
+        if self._open and not self._open[-1]:
+            self._capture.append('>')
+            self._open[-1] = True
+
+    def _end_unit(self):
+        unit = self._unit
+        self._unit = None
+        for tag_name in ['source', 'target']:
+            if self._values[tag_name] > 1:
+                raise InputError(unit['key'], 'Unable to extract ' + tag_name)
+        if self._error is not None:
+            raise InputError(unit['key'], 'Unable to extract ' + self._error)
+        self.units.append(unit)
+
+
+def _iter_trans_units(filename, chunk_size=64 * 1024):
+    """Parses the translation units of an .xlf file one at a time.
+
+    Unlike minidom, the file is read incrementally and only the current
+    translation unit is kept in memory.
+
+    Args:
+        filename: The name of an .xlf file.
+        chunk_size: The number of bytes to read from the file at a time.
+
+    Yields:
+        The dictionaries _parse_trans_unit() would return, in file order.
+
+    Raises:
+        IOError: An error occurred while reading the file.
+        InputError: The file was not well-formed or a translation unit
+            lacked required fields.
+    """
+    handler = _TransUnitHandler()
+    parser = xml.sax.make_parser()
+    parser.setContentHandler(handler)
+    parser.setFeature(xml.sax.handler.feature_external_ges, False)
+    with open(filename, 'rb') as infile:
+        while True:
+            data = infile.read(chunk_size)
+            try:
+                if data:
+                    parser.feed(data)
+                else:
+                    parser.close()
+            except xml.sax.SAXException as e:
+                raise InputError(filename, str(e))
+            for unit in handler.units:
+                yield unit
+            del handler.units[:]
+            if not data:
+                break
+
+
+def _iter_dom_trans_units(filename):
+    """Parses the translation units of an .xlf file with minidom.
+
+    Args:
+        filename: The name of an .xlf file.
+
+    Yields:
+        The dictionaries returned by _parse_trans_unit(), in file order.
+
+    Raises:
+        IOError: An error occurred while reading the file.
+        InputError: The file could not be parsed or a translation unit
+            lacked required fields.
+    """
+    try:
+        parsed_xml = minidom.parse(filename)
+    except IOError:
+        # Don't get caught by below handler
+        raise
+    except Exception as e:
+        print('')
+        raise InputError(filename, str(e))
+    for trans_unit in parsed_xml.getElementsByTagName('trans-unit'):
+        yield _parse_trans_unit(trans_unit)
+
+
+def _process_file(filename, stream=True):
     """Builds list of translation units from input file.
 
     Each translation unit in the input file includes:
@@ -95,6 +280,8 @@ def _process_file(filename):
 
     Args:
         filename: The name of an .xlf file produced by Closure.
+        stream: Whether to parse the file incrementally rather than loading
+            it all with minidom.
 
     Raises:
         IOError: An I/O error occurred with an input or output file.
@@ -106,19 +293,14 @@ def _process_file(filename):
     """
     try:
         results = []  # list of dictionaries (return value)
-        names = []    # list of names of encountered keys (local variable)
-        try:
-            parsed_xml = minidom.parse(filename)
-        except IOError:
-            # Don't get caught by below handler
-            raise
-        except Exception, e:
-            print
-            raise InputError(filename, str(e))
+        names = set()  # names of encountered keys (local variable)
+        if stream:
+            trans_units = _iter_trans_units(filename)
+        else:
+            trans_units = _iter_dom_trans_units(filename)
 
         # Make sure needed fields are present and non-empty.
-        for trans_unit in parsed_xml.getElementsByTagName('trans-unit'):
-            unit = _parse_trans_unit(trans_unit)
+        for unit in trans_units:
             for key in ['description', 'meaning', 'source']:
                 if not key in unit or not unit[key]:
                     raise InputError(filename + ':' + unit['key'],
@@ -142,15 +324,31 @@ def _process_file(filename):
               if unit['meaning'] in names:
                 raise InputError(filename,
                                  'Second definition of: ' + unit['meaning'])
-              names.append(unit['meaning'])
+              names.add(unit['meaning'])
               results.append(unit)
 
         return results
-    except IOError, e:
-        print 'Error with file {0}: {1}'.format(filename, e.strerror)
+    except IOError as e:
+        print('Error with file {0}: {1}'.format(filename, e.strerror))
         sys.exit(1)
 
 
+def _index_meanings(templates):
+    """Finds where each meaning is first defined in the templates.
+
+    Args:
+        templates: A string containing Soy templates.
+
+    Returns:
+        A dictionary mapping each meaning to the offset of its first
+        definition.
+    """
+    offsets = {}
+    for match in _MEANING_PATTERN.finditer(templates):
+        offsets.setdefault(match.group(1), match.start())
+    return offsets
+
+
 def sort_units(units, templates):
     """Sorts the translation units by their definition order in the template.
 
@@ -166,19 +364,16 @@ def sort_units(units, templates):
 
     Raises:
         InputError: If a meaning definition cannot be found in the
-            templates.
+            templates.  Every missing meaning is listed.
     """
-    def key_function(unit):
-        match = re.search(
-            '\\smeaning\\s*=\\s*"{0}"\\s'.format(unit['meaning']),
-            templates)
-        if match:
-            return match.start()
-        else:
-            raise InputError(args.templates,
-                             'msg definition for meaning not found: ' +
-                             unit['meaning'])
-    return sorted(units, key=key_function)
+    offsets = _index_meanings(templates)
+    missing = [unit['meaning'] for unit in units
+               if unit['meaning'] not in offsets]
+    if missing:
+        raise InputError(getattr(args, 'templates', None),
+                         'msg definition for meaning not found: ' +
+                         ', '.join(missing))
+    return sorted(units, key=lambda unit: offsets[unit['meaning']])
 
 
 def main():
@@ -199,6 +394,9 @@ def main():
     parser.add_argument('--output_dir', default='json',
                         help='relative directory for output files')
     parser.add_argument('--xlf', help='file containing xlf definitions')
+    parser.add_argument('--dom', action='store_true', default=False,
+                        help='load the whole xlf file with minidom instead '
+                        'of parsing it incrementally')
     parser.add_argument('--templates', default=['template.soy'], nargs='+',
                         help='relative path to Soy templates, comma or space '
                         'separated (used for ordering messages)')
@@ -210,7 +408,7 @@ def main():
       args.output_dir += os.path.sep
 
     # Process the input file, and sort the entries.
-    units = _process_file(args.xlf)
+    units = _process_file(args.xlf, stream=not args.dom)
     files = []
     for arg in args.templates:
       for filename in arg.split(','):
@@ -221,7 +419,8 @@ def main():
     sorted_units = sort_units(units, ' '.join(files))
 
     # Write the output files.
-    write_files(args.author, args.lang, args.output_dir, sorted_units, True)
+    Catalog.from_units(sorted_units, args.lang).write_files(
+        args.output_dir, args.author, write_key_file=True)
 
     # Delete the input .xlf file.
     os.remove(args.xlf)
@@ -0,0 +1,313 @@
+#!/usr/bin/python
+# Benchmarks for the build and translation tooling.
+#
+# Copyright 2026 openblock.cc.
+# https://github.com/sgologuzov/robopro-blocks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Times build.py and the i18n scripts on generated inputs.
+
+Every benchmark runs in a scratch copy of the tree, so the working copy is
+never touched:
+
+  build/cold, build/warm   build.py with tests/benchmarks/stub_compiler.py as
+                           the local compiler, without and with a build cache.
+  build/remote             build.py --remote against stub_compile_server.py,
+                           which answers each request after 50ms.
+  js_to_json               i18n/js_to_json.py on msg/messages.js.
+  create_messages/<N>      i18n/create_messages.py on N synthetic languages.
+  xliff_to_json/<N>        i18n/xliff_to_json.py on an XLIFF file of N units.
+
+Each benchmark is repeated and its fastest time kept.  Results are written as
+JSON; given a baseline results file, any benchmark slower than its threshold
+in thresholds.json fails the run:
+
+  python tests/benchmarks/run_benchmarks.py --output new.json \\
+      --baseline old.json
+"""
+
+import argparse
+import codecs
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import stub_compile_server
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(os.path.dirname(BENCHMARK_DIR))
+RESULTS_VERSION = 1
+
+# Directories build.py reads, copied into the scratch tree.
+BUILD_INPUTS = ['core', 'blocks_common', 'blocks_horizontal', 'blocks_vertical',
+                'generators', 'build', 'msg', 'i18n']
+
+
+def run(args, cwd, env=None):
+  """Run a command quietly, returning its wall time in seconds."""
+  with open(os.devnull, 'w') as devnull:
+    start = time.time()
+    subprocess.check_call(args, cwd=cwd, env=env, stdout=devnull)
+    return time.time() - start
+
+
+def make_tree(scratch):
+  """Copy what build.py needs into scratch, linking the closure library."""
+  for name in BUILD_INPUTS:
+    shutil.copytree(os.path.join(ROOT, name), os.path.join(scratch, name))
+  shutil.copy(os.path.join(ROOT, 'build.py'), scratch)
+  library = os.path.join(ROOT, 'node_modules', 'google-closure-library')
+  if os.path.isdir(library):
+    os.mkdir(os.path.join(scratch, 'node_modules'))
+    target = os.path.join(scratch, 'node_modules', 'google-closure-library')
+    if hasattr(os, 'symlink'):
+      os.symlink(library, target)
+    else:
+      shutil.copytree(library, target)
+
+
+def stub_compiler_env(scratch):
+  """An environment whose google-closure-compiler is stub_compiler.py."""
+  bin_dir = os.path.join(scratch, 'stub_bin')
+  if not os.path.isdir(bin_dir):
+    os.mkdir(bin_dir)
+  stub = os.path.join(BENCHMARK_DIR, 'stub_compiler.py')
+  if os.name == 'nt':
+    with open(os.path.join(bin_dir, 'google-closure-compiler.cmd'), 'w') as f:
+      f.write('@"%s" "%s" %%*\n' % (sys.executable, stub))
+  else:
+    wrapper = os.path.join(bin_dir, 'google-closure-compiler')
+    with open(wrapper, 'w') as f:
+      f.write('#!/bin/sh\nexec "%s" "%s" "$@"\n' % (sys.executable, stub))
+    os.chmod(wrapper, 0o755)
+  env = dict(os.environ)
+  env['PATH'] = bin_dir + os.pathsep + env.get('PATH', '')
+  return env
+
+
+def bench_build(scratch, options):
+  if not os.path.isdir(os.path.join(scratch, 'node_modules')):
+    print('Skipping build.py: node_modules/google-closure-library not found.')
+    return {}
+  env = stub_compiler_env(scratch)
+  cache_dir = os.path.join(scratch, 'bench_cache')
+  args = [options.python, 'build.py', '--no-worker', '--cache-dir', cache_dir]
+  shutil.rmtree(cache_dir, ignore_errors=True)
+  cold = run(args, scratch, env)
+  warm = run(args, scratch, env)
+  return {'build/cold': cold, 'build/warm': warm}
+
+
+def bench_build_remote(scratch, options):
+  if not os.path.isdir(os.path.join(scratch, 'node_modules')):
+    print('Skipping build.py --remote: node_modules/google-closure-library not '
+          'found.')
+    return {}
+  server = stub_compile_server.start(latency=0.05)
+  try:
+    return {'build/remote': run([
+        options.python, 'build.py', '--remote', '--remote-url', server.url,
+        '--no-cache'], scratch)}
+  finally:
+    server.shutdown()
+    server.server_close()
+
+
+def bench_js_to_json(scratch, options):
+  output_dir = os.path.join(scratch, 'bench_json')
+  if not os.path.isdir(output_dir):
+    os.mkdir(output_dir)
+  return {'js_to_json': run([
+      options.python, os.path.join('i18n', 'js_to_json.py'),
+      '--input_file', os.path.join('msg', 'messages.js'),
+      '--output_dir', output_dir, '--quiet'], scratch)}
+
+
+def write_json(filename, data):
+  with codecs.open(filename, 'w', 'utf-8') as f:
+    json.dump(data, f, ensure_ascii=False, indent=4)
+
+
+def bench_create_messages(scratch, options):
+  json_dir = os.path.join(scratch, 'bench_json')
+  if not os.path.isfile(os.path.join(json_dir, 'en.json')):
+    bench_js_to_json(scratch, options)
+  with codecs.open(os.path.join(json_dir, 'en.json'), 'r', 'utf-8') as f:
+    source = json.load(f)
+  source.pop('@metadata', None)
+  # A fixed seed keeps the synthetic translations identical between runs.
+  rng = random.Random(0)
+  results = {}
+  for count in options.languages:
+    lang_dir = tempfile.mkdtemp(dir=scratch)
+    output_dir = tempfile.mkdtemp(dir=scratch)
+    files = []
+    for i in range(count):
+      lang = 'l%03d' % i
+      # Roughly 80% coverage, like a typical community translation.
+      write_json(os.path.join(lang_dir, lang + '.json'), dict(
+          (key, u'%s \u00e9 %s' % (value, lang))
+          for (key, value) in sorted(source.items()) if rng.random() < 0.8))
+      files.append(os.path.join(lang_dir, lang + '.json'))
+    results['create_messages/%d' % count] = run([
+        options.python, os.path.join('i18n', 'create_messages.py'),
+        '--source_lang_file', os.path.join(json_dir, 'en.json'),
+        '--source_synonym_file', os.path.join(json_dir, 'synonyms.json'),
+        '--source_constants_file', os.path.join(json_dir, 'constants.json'),
+        '--output_dir', output_dir, '--quiet', '--force'] + files, scratch)
+  return results
+
+
+def write_xliff(filename, templates, count):
+  """Generate an XLIFF file with count units and the templates ordering them."""
+  with codecs.open(filename, 'w', 'utf-8') as xlf:
+    xlf.write(u'<?xml version="1.0" encoding="UTF-8"?>\n'
+              u'<xliff version="1.2" '
+              u'xmlns="urn:oasis:names:tc:xliff:document:1.2">\n'
+              u'  <file original="SoyMsgBundle" datatype="x-soy-msg-bundle" '
+              u'xml:space="preserve" source-language="en" '
+              u'target-language="en">\n'
+              u'    <body>\n')
+    for i in range(count):
+      xlf.write(u'      <trans-unit id="%d" datatype="html">\n'
+                u'        <source>Message %d with <x id="VALUE"/> in it</source>\n'
+                u'        <note priority="1" from="description">'
+                u'Description of message %d.</note>\n'
+                u'        <note priority="1" from="meaning">Bench.msg%d</note>\n'
+                u'      </trans-unit>\n' % (1000000 + i, i, i, i))
+    xlf.write(u'    </body>\n  </file>\n</xliff>\n')
+  with codecs.open(templates, 'w', 'utf-8') as soy:
+    soy.write(u'{namespace bench}\n{template .messages}\n')
+    # Reverse order, so sorting the units has real work to do.
+    for i in reversed(range(count)):
+      soy.write(u'  {msg meaning="Bench.msg%d" desc="Description of message '
+                u'%d."}Message %d with {$value} in it{/msg}\n' % (i, i, i))
+    soy.write(u'{/template}\n')
+
+
+def bench_xliff_to_json(scratch, options):
+  results = {}
+  for count in options.units:
+    work_dir = tempfile.mkdtemp(dir=scratch)
+    xlf = os.path.join(work_dir, 'en.xlf')
+    templates = os.path.join(work_dir, 'template.soy')
+    write_xliff(xlf, templates, count)
+    # xliff_to_json.py deletes its input, so it always reads a fresh file.
+    results['xliff_to_json/%d' % count] = run([
+        options.python, os.path.join(ROOT, 'i18n', 'xliff_to_json.py'),
+        '--xlf', xlf, '--templates', templates, '--output_dir', '.'],
+        work_dir)
+  return results
+
+
+BENCHMARKS = [
+  ('build', bench_build),
+  ('build_remote', bench_build_remote),
+  ('js_to_json', bench_js_to_json),
+  ('create_messages', bench_create_messages),
+  ('xliff_to_json', bench_xliff_to_json),
+]
+
+
+def compare(results, baseline, thresholds):
+  """Print each benchmark against the baseline.
+
+  Returns:
+      The names of benchmarks slower than their threshold allows.
+  """
+  regressions = []
+  print('%-28s %10s %10s %8s' % ('benchmark', 'baseline', 'current', 'ratio'))
+  for name in sorted(results):
+    current = results[name]
+    if name not in baseline:
+      print('%-28s %10s %10.3f' % (name, '-', current))
+      continue
+    ratio = current / max(baseline[name], 1e-6)
+    limit = thresholds.get(name, thresholds['default'])
+    # Ignore noise on very short benchmarks.
+    regressed = ratio > limit and current - baseline[name] > thresholds['min_delta']
+    if regressed:
+      regressions.append(name)
+    print('%-28s %10.3f %10.3f %7.2fx%s' % (
+        name, baseline[name], current, ratio, '  REGRESSION' if regressed else ''))
+  return regressions
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark build tooling.')
+  parser.add_argument('--output', default='bench_results.json',
+                      help='file to write results to')
+  parser.add_argument('--baseline',
+                      help='earlier results file to check for regressions')
+  parser.add_argument('--thresholds',
+                      default=os.path.join(BENCHMARK_DIR, 'thresholds.json'),
+                      help='allowed slowdown per benchmark, as a ratio')
+  parser.add_argument('--repeat', type=int, default=3,
+                      help='runs per benchmark; the fastest is kept')
+  parser.add_argument('--python', default=sys.executable,
+                      help='interpreter to run the tools with')
+  parser.add_argument('--languages', type=int, nargs='+', default=[50, 200, 500],
+                      help='language counts for create_messages.py')
+  parser.add_argument('--units', type=int, nargs='+', default=[1000, 5000],
+                      help='translation unit counts for xliff_to_json.py')
+  parser.add_argument('--only', nargs='+', metavar='BENCHMARK',
+                      choices=[name for (name, _) in BENCHMARKS],
+                      help='run only these benchmarks')
+  options = parser.parse_args()
+
+  results = {}
+  scratch = tempfile.mkdtemp(prefix='robopro-bench-')
+  try:
+    make_tree(scratch)
+    for (name, benchmark) in BENCHMARKS:
+      if options.only and name not in options.only:
+        continue
+      for _ in range(options.repeat):
+        for (key, seconds) in benchmark(scratch, options).items():
+          results[key] = min(results.get(key, seconds), seconds)
+  finally:
+    shutil.rmtree(scratch, ignore_errors=True)
+
+  results = dict((key, round(value, 4)) for (key, value) in results.items())
+  with open(options.output, 'w') as f:
+    json.dump({
+        'version': RESULTS_VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }, f, indent=2, sort_keys=True)
+  print('Wrote %d results to %s.' % (len(results), options.output))
+
+  if options.baseline:
+    with open(options.baseline) as f:
+      baseline = json.load(f)
+    if baseline.get('version') != RESULTS_VERSION:
+      print('Baseline %s has an incompatible format.' % options.baseline)
+      sys.exit(1)
+    with open(options.thresholds) as f:
+      thresholds = json.load(f)
+    regressions = compare(results, baseline['results'], thresholds)
+    if regressions:
+      print('Performance regressions: ' + ', '.join(regressions))
+      sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,134 @@
+#!/usr/bin/python
+# Stand-in for the Closure Compiler web service, for testing build.py.
+#
+# Copyright 2026 openblock.cc.
+# https://github.com/sgologuzov/robopro-blocks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Serves the /compile JSON API of closure-compiler.appspot.com on localhost.
+
+Each js_code field is compiled with stub_compiler.py and the response has the
+compiledCode and statistics build.py asks for.  Connections are kept alive.
+To exercise build.py's retries, the server can be slowed down and made to
+answer every Nth request with 503 Service Unavailable:
+
+  python tests/benchmarks/stub_compile_server.py --port 8081 --fail-every 3
+  python build.py --remote --remote-url http://127.0.0.1:8081/compile
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+
+import stub_compiler
+
+if sys.version_info[0] == 2:
+  from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+  from SocketServer import ThreadingMixIn
+  from urlparse import parse_qsl
+else:
+  from http.server import BaseHTTPRequestHandler, HTTPServer
+  from socketserver import ThreadingMixIn
+  from urllib.parse import parse_qsl
+
+
+class CompileHandler(BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+
+  def do_POST(self):
+    body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+    with self.server.lock:
+      self.server.requests += 1
+      number = self.server.requests
+    if self.path != '/compile':
+      self.send_body(404, b'Not found')
+      return
+    time.sleep(self.server.latency)
+    if self.server.fail_every and number % self.server.fail_every == 0:
+      self.send_body(503, b'Service unavailable')
+      return
+    if sys.version_info[0] == 2:
+      params = [(name, value.decode('utf-8')) for (name, value) in
+                parse_qsl(body, keep_blank_values=True)]
+    else:
+      params = parse_qsl(body.decode('ascii'), keep_blank_values=True)
+    sources = [value for (name, value) in params if name == 'js_code']
+    code = stub_compiler.compile_sources(sources)
+    response = {
+      'compiledCode': code.decode('ascii'),
+      'statistics': {
+        'originalSize': sum(len(source.encode('utf-8')) for source in sources),
+        'compressedSize': len(code),
+      },
+    }
+    self.send_body(200, json.dumps(response).encode('utf-8'),
+                   'application/json')
+
+  def send_body(self, status, body, content_type='text/plain'):
+    self.send_response(status)
+    self.send_header('Content-Type', content_type)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, format, *args):
+    pass
+
+
+class CompileServer(ThreadingMixIn, HTTPServer):
+  daemon_threads = True
+
+  def __init__(self, port=0, latency=0, fail_every=0):
+    HTTPServer.__init__(self, ('127.0.0.1', port), CompileHandler)
+    self.latency = latency
+    self.fail_every = fail_every
+    self.lock = threading.Lock()
+    self.requests = 0
+
+  @property
+  def url(self):
+    return 'http://127.0.0.1:%d/compile' % self.server_address[1]
+
+
+def start(port=0, latency=0, fail_every=0):
+  """Serve from a background thread, returning the server."""
+  server = CompileServer(port, latency, fail_every)
+  thread = threading.Thread(target=server.serve_forever)
+  thread.daemon = True
+  thread.start()
+  return server
+
+
+def main():
+  parser = argparse.ArgumentParser(description='Stand-in compile service.')
+  parser.add_argument('--port', type=int, default=0,
+                      help='port to listen on (default: any free port)')
+  parser.add_argument('--latency', type=float, default=0,
+                      help='seconds to wait before answering each request')
+  parser.add_argument('--fail-every', type=int, default=0, metavar='N',
+                      help='answer every Nth request with HTTP 503')
+  args = parser.parse_args()
+  server = CompileServer(args.port, args.latency, args.fail_every)
+  print('Serving %s' % server.url)
+  sys.stdout.flush()
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,140 @@
+#!/usr/bin/python
+# Stand-in for the Closure Compiler, for benchmarking build.py.
+#
+# Copyright 2026 openblock.cc.
+# https://github.com/sgologuzov/robopro-blocks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Accepts the compiler flags build.py passes and does a cheap, deterministic
+imitation of SIMPLE optimizations: comments and blank lines are dropped,
+goog.provide('a.b') becomes var a={b:{}}; and other goog.* calls disappear.
+Output is ASCII-only, like the real compiler's.  With --create_source_map it
+also writes a version 3 source map with one mapping per output line.
+
+This keeps the benchmarks about build.py itself rather than about the JVM.
+"""
+
+import codecs
+import json
+import re
+import sys
+
+_PROVIDE_PATTERN = re.compile(r"goog\.provide\('(\w+)\.(\w+)'\);")
+
+
+def parse_args(argv):
+  """Split a compiler command line into input files and flags."""
+  if argv[:1] == ['--flagfile']:
+    with open(argv[1]) as f:
+      argv = f.read().split()
+  files = []
+  flags = {}
+  i = 0
+  while i < len(argv):
+    arg = argv[i]
+    if arg.startswith('--'):
+      if '=' in arg:
+        (arg, value) = arg.split('=', 1)
+      else:
+        i += 1
+        value = argv[i]
+      flags[arg[2:]] = value
+    else:
+      files.append(arg)
+    i += 1
+  return (files, flags)
+
+
+def read_sources(files):
+  sources = []
+  for filename in files:
+    with codecs.open(filename, 'r', 'utf-8') as f:
+      sources.append(f.read())
+  return sources
+
+
+def compile_files(files):
+  """Return the stand-in compiled code for the input files."""
+  return compile_sources(read_sources(files))
+
+
+def compile_lines(sources):
+  """Yield (source index, line number, column, output line) for the sources."""
+  for (index, source) in enumerate(sources):
+    for (number, line) in enumerate(source.splitlines()):
+      column = len(line) - len(line.lstrip())
+      line = line.strip()
+      if not line or line.startswith(('//', '/*', '*')):
+        continue
+      match = _PROVIDE_PATTERN.match(line)
+      if match:
+        yield (index, number, column, 'var %s={%s:{}};' % match.groups())
+      elif not line.startswith('goog.'):
+        yield (index, number, column, line)
+
+
+def compile_sources(sources):
+  """Return the stand-in compiled code for the given source texts."""
+  out = [line for (_, _, _, line) in compile_lines(sources)]
+  code = u'\n'.join(out) + u'\n'
+  return code.encode('ascii', 'backslashreplace')
+
+
+_BASE64 = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
+
+
+def _vlq(value):
+  value = (-value << 1) | 1 if value < 0 else value << 1
+  chars = ''
+  while True:
+    digit = value & 31
+    value >>= 5
+    chars += _BASE64[digit | 32 if value else digit]
+    if not value:
+      return chars
+
+
+def source_map(files, sources):
+  """Return a source map mapping the start of each output line to its source."""
+  mappings = []
+  previous = (0, 0, 0)
+  for (index, number, column, _) in compile_lines(sources):
+    mappings.append(_vlq(0) + _vlq(index - previous[0]) +
+                    _vlq(number - previous[1]) + _vlq(column - previous[2]))
+    previous = (index, number, column)
+  return json.dumps(dict(version=3, file='', lineCount=len(mappings) + 1,
+                         mappings=';'.join(mappings), sources=files,
+                         names=[]))
+
+
+def main():
+  argv = sys.argv[1:]
+  if argv == ['--version']:
+    print('Closure Compiler (benchmark stub)')
+    return
+  (files, flags) = parse_args(argv)
+  sources = read_sources(files)
+  code = compile_sources(sources)
+  if 'create_source_map' in flags:
+    with open(flags['create_source_map'], 'w') as f:
+      f.write(source_map(files, sources))
+  if 'js_output_file' in flags:
+    with open(flags['js_output_file'], 'wb') as f:
+      f.write(code)
+  else:
+    getattr(sys.stdout, 'buffer', sys.stdout).write(code)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,622 @@
+#!/usr/bin/python
+# Tests for build.py.
+#
+# Copyright 2026 openblock.cc.
+# https://github.com/sgologuzov/robopro-blocks
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit tests for the helpers of build.py.
+
+  python tests/build_tests.py
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import build
+
+
+class TestCompileCache(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.input = os.path.join(self.dir, 'a.js')
+    with open(self.input, 'w') as f:
+      f.write('var a = 1;\n')
+    self.params = [('compilation_level', 'SIMPLE'), ('js_file', self.input)]
+    self.cache = build.Compile_cache(os.path.join(self.dir, 'cache'), 'v1')
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_hit(self):
+    key = self.cache.key(self.params)
+    self.assertIsNone(self.cache.get(key))
+    self.cache.put(key, dict(compiledCode=b'var a=1;',
+                             statistics=dict(originalSize=11, compressedSize=8)))
+    json_data = build.Compile_cache(self.cache.cache_dir, 'v1').get(
+        self.cache.key(self.params))
+    self.assertEqual(b'var a=1;', json_data['compiledCode'])
+    self.assertEqual(8, json_data['statistics']['compressedSize'])
+
+  def test_key_invalidation(self):
+    key = self.cache.key(self.params)
+    self.assertNotEqual(key, build.Compile_cache(
+        self.cache.cache_dir, 'v2').key(self.params))
+    self.assertNotEqual(key, self.cache.key(
+        [('compilation_level', 'ADVANCED')] + self.params[1:]))
+    with open(self.input, 'w') as f:
+      f.write('var a = 2;\n')
+    self.assertNotEqual(key, self.cache.key(self.params))
+
+  def test_failures_are_not_cached(self):
+    key = self.cache.key(self.params)
+    self.cache.put(key, dict(errors=[dict(error='boom', file=None)]))
+    self.cache.put(key, dict(compiledCode=b'', errors=[]))
+    self.assertIsNone(self.cache.get(key))
+    self.assertFalse(os.path.exists(self.cache.cache_dir))
+
+
+class Recording_compressed(build.Gen_compressed):
+  """Compiles nothing, but records how targets are compiled and finished."""
+  def __init__(self, jobs):
+    build.Gen_compressed.__init__(self, [], [], {}, None, jobs=jobs)
+    self.lock = threading.Lock()
+    self.running = 0
+    self.most_running = 0
+    self.finished = []
+
+  def do_compile(self, params, target_filename, filenames, remove):
+    with self.lock:
+      self.running += 1
+      self.most_running = max(self.most_running, self.running)
+    # Earlier targets take longer, so they complete last.
+    time.sleep(dict(params)['delay'])
+    with self.lock:
+      self.running -= 1
+    return (target_filename, filenames, remove, {}, False)
+
+  def finish(self, target_filename, filenames, remove, json_data, cached):
+    self.finished.append(target_filename)
+    if target_filename == 'fail.js':
+      sys.exit(1)
+
+
+class TestCompileTargets(unittest.TestCase):
+  def targets(self, names):
+    return [([('delay', 0.1 * (len(names) - i))], name, [], '')
+            for (i, name) in enumerate(names)]
+
+  def test_parallel_in_order(self):
+    gen = Recording_compressed(3)
+    self.assertEqual(0, gen.compile_targets(self.targets(['a.js', 'b.js',
+                                                          'c.js'])))
+    self.assertEqual(['a.js', 'b.js', 'c.js'], gen.finished)
+    self.assertEqual(3, gen.most_running)
+
+  def test_jobs_bound(self):
+    gen = Recording_compressed(2)
+    gen.compile_targets(self.targets(['a.js', 'b.js', 'c.js', 'd.js']))
+    self.assertEqual(2, gen.most_running)
+
+  def test_failure(self):
+    gen = Recording_compressed(2)
+    self.assertEqual(1, gen.compile_targets(self.targets(['a.js', 'fail.js',
+                                                          'c.js'])))
+    self.assertEqual(['a.js', 'fail.js'], gen.finished)
+
+
+class TestClosureWorkerPool(unittest.TestCase):
+  def test_failing_workers(self):
+    # A worker which exits at once, and more targets than workers.
+    pool = build.Closure_worker_pool([sys.executable, '-c', 'pass'], 2)
+    errors = []
+
+    def compile_targets():
+      for _ in range(4):
+        try:
+          pool.compile(['target.js'])
+        except build.Closure_worker_error:
+          errors.append(1)
+
+    threads = [threading.Thread(target=compile_targets) for _ in range(3)]
+    for thread in threads:
+      thread.daemon = True
+      thread.start()
+    for thread in threads:
+      thread.join(30)
+      self.assertFalse(thread.is_alive(), 'the worker pool hangs')
+    self.assertEqual(12, len(errors))
+    self.assertTrue(pool.dead)
+    self.assertEqual(0, pool.started)
+    self.assertEqual([], pool.workers)
+
+  def test_hanging_worker(self):
+    # A worker which never replies is killed once the timeout is up.
+    pool = build.Closure_worker_pool(
+        [sys.executable, '-c', 'import time; time.sleep(60)'], 1, 0.5)
+    started = time.time()
+    with self.assertRaises(build.Closure_worker_error) as context:
+      pool.compile(['target.js'])
+    self.assertLess(time.time() - started, 30)
+    self.assertIn('no response', str(context.exception))
+    self.assertTrue(pool.dead)
+
+
+class TestCompileLocal(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.input = os.path.join(self.dir, 'a.js')
+    with open(self.input, 'w') as f:
+      f.write('var a = 1;\n')
+    # A one-shot compiler which echoes its input and warns about it.
+    compiler = os.path.join(self.dir, 'compiler')
+    with open(compiler, 'w') as f:
+      f.write('#!%s\nimport sys\n'
+              'sys.stderr.write("WARNING - %%s\\n" %% sys.argv[-1])\n'
+              'sys.stdout.write(open(sys.argv[-1]).read())\n' % sys.executable)
+    os.chmod(compiler, 0o755)
+    self.saved_compiler = build.CLOSURE_COMPILER_NPM
+    build.CLOSURE_COMPILER_NPM = compiler
+
+  def tearDown(self):
+    build.CLOSURE_COMPILER_NPM = self.saved_compiler
+    shutil.rmtree(self.dir)
+
+  @unittest.skipIf(os.name == 'nt', 'the compiler is a script')
+  def test_falls_back_from_hanging_worker(self):
+    workers = build.Closure_worker_pool(
+        [sys.executable, '-c', 'import time; time.sleep(60)'], 1, 0.5)
+    gen = build.Gen_compressed([], [], {}, None, workers=workers)
+    json_data = gen.compile_local([('js_file', self.input)], 'a.js', [])
+    self.assertEqual(b'var a = 1;\n', json_data['compiledCode'])
+    # The diagnostics are the target's, not written out as they arrive.
+    self.assertEqual('WARNING - %s\n' % self.input, json_data['diagnostics'])
+
+
+CALCDEPS = os.path.join(os.path.dirname(build.__file__), build.CLOSURE_ROOT_NPM,
+                        build.CLOSURE_LIBRARY_NPM, 'closure', 'bin',
+                        'calcdeps.py')
+
+
+@unittest.skipUnless(os.path.isfile(CALCDEPS), 'npm install first')
+class TestDependencyGraph(unittest.TestCase):
+  def setUp(self):
+    build.calcdeps = build.import_path(CALCDEPS)
+    self.dir = tempfile.mkdtemp()
+    self.base = self.write('base.js', '/** @provideGoog */\nvar COMPILED = false;\n')
+    self.a = self.write('a.js', "goog.provide('a');\ngoog.require('b');\n")
+    self.b = self.write('b.js', "goog.provide('b');\ngoog.require('c');\n")
+    self.c = self.write('c.js', "goog.provide('c');\n")
+    self.paths = [self.a, self.b, self.base, self.c]
+    self.index = os.path.join(self.dir, 'cache', 'deps.json')
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def write(self, name, text):
+    path = os.path.join(self.dir, name)
+    with open(path, 'w') as f:
+      f.write(text)
+    return path
+
+  def test_order(self):
+    deps = build.Dependency_graph(self.paths)
+    self.assertEqual([self.base, self.c, self.b, self.a],
+                     deps.calculate(self.paths, [self.a]))
+
+  def test_cycle(self):
+    self.write('c.js', "goog.provide('c');\ngoog.require('a');\n")
+    deps = build.Dependency_graph(self.paths)
+    self.assertEqual([self.base, self.c, self.b, self.a],
+                     deps.calculate(self.paths, [self.a]))
+
+  def test_index(self):
+    build.Dependency_graph(self.paths, self.index).save()
+    parse = build.calcdeps.BuildDependenciesFromFiles
+    parsed = []
+
+    def counting_parse(filenames):
+      parsed.extend(filenames)
+      return parse(filenames)
+
+    build.calcdeps.BuildDependenciesFromFiles = counting_parse
+    try:
+      deps = build.Dependency_graph(self.paths, self.index)
+      self.assertEqual([], parsed)
+      self.assertEqual(['b'], deps.deps[self.a].requires)
+      self.write('c.js', "goog.provide('c');\n\n")
+      deps = build.Dependency_graph(self.paths, self.index)
+      self.assertEqual([self.c], parsed)
+    finally:
+      build.calcdeps.BuildDependenciesFromFiles = parse
+
+  def test_update(self):
+    deps = build.Dependency_graph(self.paths)
+    self.write('c.js', "goog.provide('c');\nvar c = 1;\n")
+    self.assertFalse(deps.update([self.c]))
+    self.write('c.js', "goog.provide('c');\ngoog.require('b');\n")
+    self.assertTrue(deps.update([self.c]))
+    os.remove(self.c)
+    self.assertTrue(deps.update([self.c]))
+    self.assertNotIn(self.c, deps.deps)
+
+
+class Fake_watcher(object):
+  """Reports the given sets of changed files, then stops the watch."""
+  def __init__(self, changes):
+    self.changes = list(changes)
+
+  def wait(self):
+    if not self.changes:
+      raise KeyboardInterrupt()
+    return set(self.changes.pop(0))
+
+
+class Fake_compressed(object):
+  """Compressed targets which record what watch() recompiles."""
+  def __init__(self, inputs):
+    self.inputs = inputs
+    self.compiled = []
+
+  def targets(self):
+    return [([('js_file', filename) for filename in filenames], target, [], '')
+            for (target, filenames) in sorted(self.inputs.items())]
+
+  def compile_targets(self, targets):
+    self.compiled.append([target[1] for target in targets])
+
+
+class TestWatch(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.saved_make_watcher = build.make_watcher
+
+  def tearDown(self):
+    build.make_watcher = self.saved_make_watcher
+    shutil.rmtree(self.dir)
+
+  def write(self, name, text):
+    path = os.path.join(self.dir, name)
+    with open(path, 'w') as f:
+      f.write(text)
+    return os.path.normpath(path)
+
+  def test_rebuilds_affected_targets(self):
+    compressed = Fake_compressed({'a_compressed.js': ['a.js', 'shared.js'],
+                                  'b_compressed.js': ['b.js', 'shared.js']})
+    build.make_watcher = lambda directories: Fake_watcher(
+        [['a.js'], ['shared.js'], ['other.js']])
+    build.watch([], compressed, build.Dependency_graph([]), ['core'], [])
+    self.assertEqual([['a_compressed.js'],
+                      ['a_compressed.js', 'b_compressed.js']],
+                     compressed.compiled)
+
+  def test_rebuilds_on_new_inputs(self):
+    compressed = Fake_compressed({'a_compressed.js': ['a.js']})
+
+    class Watcher(Fake_watcher):
+      def wait(self):
+        # A file is added to the target.
+        compressed.inputs['a_compressed.js'] = ['a.js', 'new.js']
+        return Fake_watcher.wait(self)
+
+    build.make_watcher = lambda directories: Watcher([['unrelated.js']])
+    build.watch([], compressed, build.Dependency_graph([]), ['core'], [])
+    self.assertEqual([['a_compressed.js']], compressed.compiled)
+
+  def check_watcher(self, make_watcher):
+    path = self.write('a.js', 'var a;')
+    self.write('notes.txt', '')
+    watcher = make_watcher([self.dir])
+    self.write('a.js', 'var a = 1;')
+    self.write('notes.txt', 'not JavaScript')
+    self.assertEqual(set([path]), watcher.wait())
+
+  def test_poll_watcher(self):
+    self.check_watcher(lambda directories: build.Poll_watcher(directories,
+                                                              0.05))
+
+  @unittest.skipUnless(sys.platform.startswith('linux'), 'inotify is Linux')
+  def test_inotify_watcher(self):
+    self.check_watcher(build.Inotify_watcher)
+
+
+class TestWriteFile(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.filename = os.path.join(self.dir, 'out.js')
+    build.outputs.reset()
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_unchanged_output_is_left_alone(self):
+    self.assertTrue(build.write_file(self.filename, u'var a = "\u00e4";\n'))
+    os.utime(self.filename, (1000000000, 1000000000))
+    self.assertFalse(build.write_file(self.filename,
+                                      u'var a = "\u00e4";\n'.encode('utf-8')))
+    self.assertEqual(1000000000, os.path.getmtime(self.filename))
+    self.assertTrue(build.write_file(self.filename, 'var a = 1;\n'))
+    with open(self.filename) as f:
+      self.assertEqual('var a = 1;\n', f.read())
+    self.assertEqual([self.filename, self.filename], build.outputs.changed)
+    self.assertEqual([self.filename], build.outputs.unchanged)
+    self.assertEqual(['out.js'], os.listdir(self.dir))
+
+  def test_unchanged_compiled_output_is_left_alone(self):
+    pipeline = build.Output_pipeline()
+    pipeline.write(self.filename, '// H\n', b'a();')
+    os.utime(self.filename, (1000000000, 1000000000))
+    pipeline.write(self.filename, '// H\n', b'a();')
+    self.assertEqual(1000000000, os.path.getmtime(self.filename))
+    self.assertEqual(['out.js'], os.listdir(self.dir))
+    self.assertEqual('1 outputs changed, 1 unchanged.', build.outputs.summary())
+
+
+class Fixed_deps(object):
+  """Dependencies which are always the given files, in order."""
+  def __init__(self, filenames):
+    self.filenames = filenames
+
+  def calculate(self, paths, inputs):
+    return list(self.filenames)
+
+
+class TestGenBundle(unittest.TestCase):
+  def setUp(self):
+    self.cwd = os.getcwd()
+    self.dir = tempfile.mkdtemp()
+    os.chdir(self.dir)
+    os.mkdir('core')
+    self.write('base.js', 'var goog = {};')
+    self.write('mod.js', "goog.module('m');\nexports.x = 1;\n")
+    self.write(os.path.join('core', 'blockly.js'), "goog.provide('Blockly');\n")
+    self.gen = build.Gen_bundle([], True, {}, Fixed_deps(
+        ['base.js', 'mod.js', os.path.join('core', 'blockly.js')]))
+
+  def tearDown(self):
+    os.chdir(self.cwd)
+    shutil.rmtree(self.dir)
+
+  def write(self, filename, text):
+    with open(filename, 'w') as f:
+      f.write(text)
+
+  def read(self, filename):
+    with open(filename) as f:
+      return f.read()
+
+  def test_bundle(self):
+    self.gen.generate()
+    self.assertEqual(
+        build.HEADER + 'var CLOSURE_NO_DEPS = true;\n'
+        'var goog = {};\n'
+        "goog.loadModule(function(exports) {'use strict';\n"
+        "goog.module('m');\nexports.x = 1;\nreturn exports;});\n"
+        "goog.provide('Blockly');\n"
+        '//# sourceMappingURL=blockly_bundle_vertical.js.map\n',
+        self.read('blockly_bundle_vertical.js'))
+    source_map = json.loads(self.read('blockly_bundle_vertical.js.map'))
+    self.assertEqual(
+        [(3, ['base.js'], 'AAAA'), (5, ['mod.js'], 'AAAA;AACA;AACA'),
+         (8, ['core/blockly.js'], 'AAAA')],
+        [(section['offset']['line'], section['map']['sources'],
+          section['map']['mappings']) for section in source_map['sections']])
+
+  def test_rereads_changed_files(self):
+    self.gen.generate()
+    opened = []
+    codecs_open = build.codecs.open
+
+    def recording_open(filename, *args):
+      opened.append(filename)
+      return codecs_open(filename, *args)
+
+    build.codecs.open = recording_open
+    try:
+      self.write('mod.js', "goog.module('m');\nexports.x = 22;\n")
+      self.gen.generate()
+    finally:
+      build.codecs.open = codecs_open
+    self.assertEqual(['mod.js'], opened)
+    self.assertIn('exports.x = 22;', self.read('blockly_bundle_vertical.js'))
+
+
+ROOT = os.path.dirname(os.path.abspath(build.__file__))
+
+
+class TestModernVariants(unittest.TestCase):
+  def setUp(self):
+    self.cwd = os.getcwd()
+    self.dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    os.chdir(self.cwd)
+    shutil.rmtree(self.dir)
+
+  def test_targets(self):
+    os.chdir(ROOT)
+    gen = build.Gen_compressed([], [], {}, Fixed_deps(
+        [os.path.join('core', 'blockly.js')]), modern=True)
+    jobs = gen.targets()
+    targets = [job[1] for job in jobs]
+    self.assertEqual(14, len(jobs))
+    self.assertEqual([(target, target[:-3] + '.es2017.js')
+                      for target in targets[:7]], gen.variants)
+    self.assertEqual([pair[1] for pair in gen.variants], targets[7:])
+    for (es5, modern) in zip(jobs[:7], jobs[7:]):
+      self.assertEqual(es5[2:], modern[2:])
+      self.assertEqual(
+          [value for (arg, value) in es5[0] if arg == 'js_file'],
+          [value for (arg, value) in modern[0] if arg == 'js_file'])
+      self.assertEqual('ECMASCRIPT_2017', dict(modern[0])['language_in'])
+      self.assertEqual('ECMASCRIPT_2017', dict(modern[0])['language_out'])
+
+  def test_manifest(self):
+    os.chdir(self.dir)
+    for (filename, code) in (('a.js', b'var a=function(){return 1};'),
+                             ('a.es2017.js', b'var a=()=>1;')):
+      with open(filename, 'wb') as f:
+        f.write(code)
+    gen = build.Gen_compressed([], [], {}, None, modern=True)
+    gen.variants = [('a.js', 'a.es2017.js'), ('b.js', 'b.es2017.js')]
+    gen.write_manifest([([], 'a.es2017.js', [], '')])
+    with open(gen.MANIFEST_FILENAME) as f:
+      manifest = json.load(f)
+    self.assertEqual(dict(nomodule='ECMASCRIPT5', module='ECMASCRIPT_2017'),
+                     manifest['language_out'])
+    # b.js was not built, so it is left out.
+    self.assertEqual(['a.js'], list(manifest['targets']))
+    entry = manifest['targets']['a.js']
+    self.assertEqual('a.es2017.js', entry['module']['file'])
+    self.assertEqual(12, entry['module']['size'])
+    self.assertEqual('a.js', entry['nomodule']['file'])
+    self.assertEqual(27, entry['nomodule']['size'])
+
+
+class TestArduinoBoards(unittest.TestCase):
+  def setUp(self):
+    self.cwd = os.getcwd()
+    os.chdir(ROOT)
+    self.gen = build.Gen_compressed([], [], {}, Fixed_deps(
+        [os.path.join('core', 'blockly.js')]), arduino_boards=True)
+    self.dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    os.chdir(self.cwd)
+    shutil.rmtree(self.dir)
+
+  def board_file(self, board):
+    return os.path.join('generators', 'arduino', board + '.js')
+
+  def test_targets(self):
+    scans = []
+    arduino_board_files = self.gen.arduino_board_files
+
+    def counting_scan():
+      scans.append(1)
+      return arduino_board_files()
+
+    self.gen.arduino_board_files = counting_scan
+    jobs = self.gen.targets()
+    self.assertEqual(1, len(scans))
+    self.assertEqual(['arduino_base_compressed.js'] +
+                     ['arduino_%s_compressed.js' % board
+                      for board in build.ARDUINO_BOARDS],
+                     [job[1] for job in jobs[7:]])
+    arduino = [value for (arg, value) in jobs[5][0] if arg == 'js_file']
+    base = [value for (arg, value) in jobs[7][0] if arg == 'js_file']
+    self.assertEqual([filename for filename in arduino if filename not in
+                      [self.board_file(b) for b in build.ARDUINO_BOARDS]],
+                     base)
+    for (board, job) in zip(build.ARDUINO_BOARDS, jobs[8:]):
+      files = self.gen.board_files[board]
+      self.assertIn(self.board_file(board), files)
+      # In the order of arduino_compressed.js, and only board files.
+      self.assertEqual([filename for filename in arduino if filename in files],
+                       files)
+      self.assertEqual([os.path.join('build', 'gen_arduino.js')] + files,
+                       [value for (arg, value) in job[0] if arg == 'js_file'])
+      self.assertEqual('var Blockly={Arduino:{}};', job[3])
+
+  def test_manifest(self):
+    self.gen.targets()
+    os.chdir(self.dir)
+    self.gen.write_arduino_manifest()
+    with open(self.gen.ARDUINO_MANIFEST_FILENAME) as f:
+      manifest = json.load(f)
+    self.assertEqual('arduino_base_compressed.js', manifest['base'])
+    self.assertEqual(sorted(build.ARDUINO_BOARDS), sorted(manifest['boards']))
+    self.assertEqual('arduino_esp32_compressed.js',
+                     manifest['boards']['esp32']['file'])
+    self.assertIn('esp32', manifest['boards']['esp32']['modules'])
+
+  def test_board_chunk_header(self):
+    os.chdir(self.dir)
+    json_data = dict(compiledCode=b'Blockly.Arduino.esp32=1;',
+                     statistics=dict(originalSize=30, compressedSize=24))
+    for target in ('arduino_esp32_compressed.js', 'blocks_compressed.js'):
+      self.gen.write_output(target, '', json_data)
+    require = "\nlet Blockly = require('robopro-blocks');\n\n"
+    with open('arduino_esp32_compressed.js') as f:
+      self.assertEqual(build.HEADER + require + 'Blockly.Arduino.esp32=1;',
+                       f.read())
+    with open('blocks_compressed.js') as f:
+      self.assertEqual(build.HEADER + '\nBlockly.Arduino.esp32=1;', f.read())
+
+
+class TestOutputPipeline(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def write(self, code):
+    filename = os.path.join(self.dir, 'out.js')
+    build.Output_pipeline('var Blockly={};').write(filename, '// H\n', code)
+    with open(filename, 'rb') as f:
+      return f.read().decode('utf-8')
+
+  def license(self, title):
+    return u"""/*
+
+ %s
+
+ Copyright 2016 Google Inc.
+ https://developers.google.com/blockly/
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+   http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+*/""" % title
+
+  def test_strips_licenses(self):
+    for title in [u'Visual Blocks Editor',
+                  u'\u0420\u0435\u0434\u0430\u043a\u0442\u043e\u0440 '
+                  u'\u0431\u043b\u043e\u043a\u043e\u0432']:
+      code = (self.license(title) + u'var Blockly={};a();').encode('utf-8')
+      self.assertEqual(u'// H\na();', self.write(code))
+    # Only titles of words and spaces.
+    code = self.license(u'Blocks \u2013 Editor') + u'a();'
+    self.assertEqual(u'// H\n' + code, self.write(code.encode('utf-8')))
+
+  def test_adjust_mappings_counts_utf16(self):
+    code = u"X;var a='\u00e9\U0001f375';var b=1;\nX;c\u00e9=2;\n".encode('utf-8')
+    second = code.index(b'\nX;') + 1
+    # Columns of 'var b', then of 'c' and '=', in UTF-16 code units.
+    lines = [[[14, 0, 0, 0]], [[2, 0, 1, 0], [4, 0, 1, 5]]]
+    adjusted = build.Output_pipeline.adjust_mappings(
+        lines, 1, code, [(0, 2), (second, second + 2)])
+    self.assertEqual([[], [[12, 0, 0, 0]], [[0, 0, 1, 0], [2, 0, 1, 5]], []],
+                     adjusted)
+
+
+if __name__ == '__main__':
+  unittest.main()